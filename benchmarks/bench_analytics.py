@@ -0,0 +1,94 @@
+"""Measure link-graph analytics on a synthetic crawl.
+
+Usage::
+
+    python -m benchmarks.bench_analytics [--nodes N] [--edges N]
+
+A power-law site graph (1M edges by default) is built in memory the way
+:func:`src.analytics.load_graph` returns it, then every metric of
+:class:`src.analytics.GraphMetrics` is timed on it.
+"""
+
+import argparse
+import os
+import time
+
+# src.analytics imports the models, which build the SQLAlchemy engine at
+# import time; the benchmark never touches the database.
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+import numpy as np  # noqa: E402
+
+from src.analytics import (  # noqa: E402
+    GraphMetrics,
+    LinkGraph,
+    bfs_depth,
+    pagerank,
+    strong_components,
+)
+
+
+def synthetic_graph(nodes=100000, edges=1000000, seed=0):
+    """Node ids with gaps plus edges whose targets partly follow a Zipf law.
+
+    Like a real site, a few hub pages receive many links, a share of the
+    pages is sitemap-only and some were never fetched.
+    """
+    rng = np.random.default_rng(seed)
+    ids = np.sort(rng.choice(nodes * 2, nodes, replace=False)) + 1
+    sources = ids[rng.integers(0, nodes, edges)]
+    # Half the links go to Zipf-ranked hubs, half anywhere on the site
+    hub = rng.random(edges) < 0.5
+    ranks = np.where(
+        hub, rng.zipf(1.3, edges) - 1, rng.integers(0, nodes, edges)
+    )
+    targets = ids[ranks % nodes]
+    status = rng.choice(
+        np.array([200, 301, 404, 0], dtype=np.int16),
+        nodes,
+        p=[0.85, 0.05, 0.05, 0.05],
+    )
+    in_sitemap = rng.random(nodes) < 0.3
+    return ids, status, in_sitemap, sources, targets
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return time.perf_counter() - start, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--nodes", type=int, default=100000)
+    parser.add_argument("--edges", type=int, default=1000000)
+    args = parser.parse_args()
+
+    columns = synthetic_graph(args.nodes, args.edges)
+    seconds, graph = timed(LinkGraph, *columns)
+    results = [("csr", seconds)]
+    starts = np.array([0])
+    for name, fn, fn_args in (
+        ("pagerank", pagerank, (graph.adjacency,)),
+        ("bfs", bfs_depth, (graph.adjacency, starts)),
+        ("scc", strong_components, (graph.adjacency,)),
+        ("all", GraphMetrics.compute, (graph, starts)),
+    ):
+        seconds, result = timed(fn, *fn_args)
+        results.append((name, seconds))
+
+    print(f"{len(graph)} nodes, {graph.edge_count} distinct edges")
+    for name, seconds in results:
+        print(f"{name:>8}: {seconds * 1000:8.1f} ms")
+    summary = result.summary
+    print(
+        f"components: {summary['components']}, "
+        f"orphans: {summary['orphans']}, "
+        f"dead ends: {summary['dead_ends']}, "
+        f"unreachable: {summary['unreachable']}, "
+        f"max depth: {summary['max_depth']}"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,502 @@
+"""Reproducible crawl benchmarks against a synthetic site.
+
+Usage::
+
+    python -m benchmarks.bench_crawl [--scenario NAME ...] [--pages N] \\
+        [--fanout N] [--sitemap-size N] [--latency S] [--database URL] \\
+        [--repeat N] [--output results.json]
+
+Scenarios (all by default):
+
+``crawl``
+    End to end pages per second: the sitemap is seeded into a frontier
+    and every reachable page is fetched, parsed and written, as
+    ``crawl_website`` does, from a :mod:`benchmarks.synthetic` server.
+``parse``
+    Parse stage throughput on generated pages, without the network.
+``sitemap``
+    Sitemap ingestion: the site's sitemaps streamed through
+    ``seed_frontier`` into the graph.
+``db_write``
+    :class:`GraphWriter` throughput for generated pages and their links.
+
+``--database`` defaults to an in-memory SQLite stand-in holding just the
+``url_nodes`` and ``url_edges`` columns the writer uses.  A PostgreSQL URL
+must point to a scratch database with the migrations applied; every run
+writes into a job of its own whose partitions are dropped afterwards.
+Redis is never used.
+
+Each scenario runs ``--repeat`` times.  The figures of the median run are
+reported with every run's time, the per-stage profile of
+:class:`src.instrumentation.CrawlRecorder` and the database round trips, as
+one JSON document tagged with the commit, so that runs can be compared
+across commits.
+"""
+
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from robotexclusionrulesparser import RobotExclusionRulesParser
+import argparse
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+import time
+import uuid
+
+# The crawler module builds its SQLAlchemy engine at import time; scenarios
+# use an engine of their own.
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+from sqlalchemy import create_engine, event, text  # noqa: E402
+from sqlalchemy.orm import sessionmaker  # noqa: E402
+from sqlalchemy.pool import StaticPool  # noqa: E402
+
+from benchmarks.synthetic import SyntheticSite, serve_site, site_url  # noqa
+from src.database import (  # noqa: E402
+    create_job_partitions,
+    drop_job_partitions,
+)
+from src.instrumentation import (  # noqa: E402
+    CrawlRecorder,
+    instrument_engine,
+    profile_summary,
+)
+from src.models import CrawlJob, url_hash  # noqa: E402
+from src.routes.sitemap.sitemap_parser import iter_sitemap_pages  # noqa
+from src.tasks.crawler import (  # noqa: E402
+    CrawlContext,
+    make_normalizer,
+    process_batch,
+    queue_links,
+    seed_frontier,
+    site_domain,
+)
+from src.tasks.fingerprints import (  # noqa: E402
+    DEDUPE_MODES,
+    make_fingerprint_index,
+)
+from src.tasks.frontier import MemoryFrontier  # noqa: E402
+from src.tasks.graph_writer import GraphWriter  # noqa: E402
+from src.tasks.normalization import QUERY_MODES  # noqa: E402
+from src.tasks.options import CrawlOptions  # noqa: E402
+from src.tasks.parsing import ParsePool  # noqa: E402
+from src.tasks.politeness import fetch_robots, robots_url  # noqa: E402
+from src.tasks.scope import CrawlBudget  # noqa: E402
+
+
+SCENARIOS = ("crawl", "parse", "sitemap", "db_write")
+
+# Host of pages parsed or written without a server
+OFFLINE_URL = "http://bench.invalid"
+
+# The subset of the url_nodes and url_edges tables GraphWriter writes
+SQLITE_SCHEMA = """
+CREATE TABLE url_nodes (
+    id INTEGER PRIMARY KEY,
+    job_id VARCHAR NOT NULL,
+    url VARCHAR NOT NULL,
+    url_hash BIGINT GENERATED ALWAYS AS (url_hash(url)) STORED,
+    is_external BOOLEAN,
+    status_code INTEGER,
+    depth INTEGER,
+    in_sitemap BOOLEAN,
+    etag VARCHAR,
+    last_modified VARCHAR,
+    lastmod VARCHAR,
+    priority REAL,
+    content_type VARCHAR,
+    content_bytes BIGINT,
+    fetch_ms INTEGER,
+    truncated BOOLEAN,
+    content_hash BIGINT,
+    simhash BIGINT,
+    duplicate_of BIGINT,
+    UNIQUE (job_id, url_hash)
+);
+CREATE TABLE url_edges (
+    id INTEGER PRIMARY KEY,
+    job_id VARCHAR NOT NULL,
+    source_id BIGINT,
+    target_id BIGINT,
+    link_type VARCHAR,
+    UNIQUE (job_id, source_id, target_id)
+)
+"""
+
+
+def _least(a, b):
+    # PostgreSQL's LEAST ignores NULLs
+    if a is None or b is None:
+        return b if a is None else a
+    return min(a, b)
+
+
+def make_sessions(url):
+    """Return a session factory for the benchmark database at ``url``"""
+    if url.startswith("sqlite"):
+        engine = create_engine(url, poolclass=StaticPool)
+
+        @event.listens_for(engine, "connect")
+        def register_functions(connection, record):
+            connection.create_function(
+                "url_hash", 1, url_hash, deterministic=True
+            )
+            connection.create_function("least", 2, _least, deterministic=True)
+
+        with engine.begin() as connection:
+            for statement in SQLITE_SCHEMA.split(";"):
+                connection.exec_driver_sql(statement)
+    else:
+        engine = create_engine(url)
+    instrument_engine(engine)
+    return sessionmaker(bind=engine, autocommit=False, autoflush=False)
+
+
+@contextmanager
+def bench_job(db):
+    """Yield the id of a throwaway job; its graph is deleted afterwards"""
+    job_id = f"bench-{uuid.uuid4().hex[:12]}"
+    postgres = db.bind.dialect.name == "postgresql"
+    if postgres:
+        db.add(CrawlJob(id=job_id, start_url=OFFLINE_URL, status="running"))
+        db.commit()
+        create_job_partitions(db, job_id)
+    try:
+        yield job_id
+    finally:
+        db.rollback()
+        if postgres:
+            drop_job_partitions(db, job_id)
+            db.query(CrawlJob).filter_by(id=job_id).delete()
+        else:
+            for table in ("url_edges", "url_nodes"):
+                db.execute(
+                    text(f"DELETE FROM {table} WHERE job_id = :job"),
+                    {"job": job_id},
+                )
+        db.commit()
+
+
+class LocalThrottle:
+    """In-process :class:`HostThrottle`: the same slots, without Redis"""
+
+    def __init__(self):
+        self._next = {}
+
+    def reserve(self, host, delay):
+        if not delay:
+            return 0
+        now = time.monotonic()
+        start = max(now, self._next.get(host, now))
+        self._next[host] = start + delay
+        return start - now
+
+    def acquire(self, host, delay):
+        if not delay:
+            return 0
+        now = time.monotonic()
+        free = self._next.get(host, now)
+        if free > now:
+            return free - now
+        self._next[host] = now + delay
+        return 0
+
+
+def make_writer(db, job_id, options, recorder):
+    return GraphWriter(
+        db,
+        job_id,
+        flush_size=options.flush_size,
+        flush_interval=options.flush_interval,
+        recorder=recorder,
+    )
+
+
+def bench_crawl(bench, db, job_id, recorder):
+    options = bench.options
+    writer = make_writer(db, job_id, options, recorder)
+    robots = RobotExclusionRulesParser()
+    robots.parse(fetch_robots(robots_url(bench.base_url))[0])
+    ctx = CrawlContext(
+        options,
+        writer,
+        robots,
+        throttle=LocalThrottle(),
+        fingerprints=make_fingerprint_index(options, job_id),
+    )
+    frontier = MemoryFrontier(job_id)
+    pages = links = 0
+    started = time.perf_counter()
+    try:
+        domain = site_domain(bench.base_url, ctx.normalize)
+        seed_frontier(
+            iter_sitemap_pages(bench.base_url),
+            domain,
+            frontier,
+            writer,
+            ctx.normalize,
+            ctx.scope,
+        )
+        budget = CrawlBudget(options, datetime.now())
+        while True:
+            limit = budget.batch_limit(options.batch_size, pages)
+            batch = frontier.pop_batch(limit) if limit else []
+            if not batch:
+                break
+            for url, depth, found in process_batch(batch, ctx):
+                pages += 1
+                links += len(found)
+                queue_links(found, depth, frontier, ctx.scope)
+        writer.flush()
+    finally:
+        ctx.close()
+    seconds = time.perf_counter() - started
+    return seconds, {"pages": pages, "internal_links": links}
+
+
+def bench_parse(bench, db, job_id, recorder):
+    options = bench.options
+    pool = ParsePool(
+        options.extractor,
+        options.url_query,
+        workers=options.parse_workers,
+        max_pending=options.parse_queue,
+        recorder=recorder,
+    )
+    # Start the worker processes before the clock does
+    pool.submit(OFFLINE_URL, "<html></html>")
+    pool.drain()
+    pages = bench.offline_pages()
+    links = 0
+    started = time.perf_counter()
+    try:
+        for url, html in pages:
+            for _, _, (targets, _) in pool.submit(url, html):
+                links += len(targets)
+        for _, _, (targets, _) in pool.drain():
+            links += len(targets)
+    finally:
+        pool.close()
+    seconds = time.perf_counter() - started
+    return seconds, {
+        "pages": len(pages),
+        "bytes": sum(len(html) for _, html in pages),
+        "links": links,
+    }
+
+
+def bench_sitemap(bench, db, job_id, recorder):
+    writer = make_writer(db, job_id, bench.options, recorder)
+    frontier = MemoryFrontier(job_id)
+    normalize = make_normalizer(bench.options)
+    started = time.perf_counter()
+    seed_frontier(
+        iter_sitemap_pages(bench.base_url),
+        site_domain(bench.base_url, normalize),
+        frontier,
+        writer,
+        normalize,
+    )
+    seconds = time.perf_counter() - started
+    return seconds, {"entries": frontier.seen_count}
+
+
+def bench_db_write(bench, db, job_id, recorder):
+    writer = make_writer(db, job_id, bench.options, recorder)
+    pool = ParsePool(bench.options.extractor, bench.options.url_query)
+    pages = [
+        (url, pool.parse(url, html)[0]) for url, html in bench.offline_pages()
+    ]
+    started = time.perf_counter()
+    for url, targets in pages:
+        writer.add_page(url, 200, targets, depth=1)
+    writer.flush()
+    seconds = time.perf_counter() - started
+    return seconds, {
+        "pages": len(pages),
+        "links": sum(len(targets) for _, targets in pages),
+    }
+
+
+BENCHMARKS = {
+    "crawl": bench_crawl,
+    "parse": bench_parse,
+    "sitemap": bench_sitemap,
+    "db_write": bench_db_write,
+}
+
+
+class Bench:
+    """What the scenarios share: the site, its server and crawl options"""
+
+    def __init__(self, site, options, base_url, offline_pages):
+        self.site = site
+        self.options = options
+        self.base_url = base_url
+        self._offline_pages = offline_pages
+        self._pages = None
+
+    def offline_pages(self):
+        """``(url, html)`` of the first pages of the site, generated once"""
+        if self._pages is None:
+            count = min(self.site.pages, self._offline_pages)
+            self._pages = [
+                (
+                    f"{OFFLINE_URL}/page/{i}",
+                    self.site.page_html(i, OFFLINE_URL),
+                )
+                for i in range(count)
+            ]
+        return self._pages
+
+
+def run_scenario(name, bench, sessions, repeat):
+    """Run a scenario ``repeat`` times; return the median run's figures"""
+    runs = []
+    for _ in range(repeat):
+        recorder = CrawlRecorder(profile=True)
+        db = sessions()
+        try:
+            with bench_job(db) as job_id:
+                seconds, counts = BENCHMARKS[name](bench, db, job_id, recorder)
+        finally:
+            db.close()
+        runs.append((seconds, counts, recorder.take_profile()))
+    seconds, counts, profile = sorted(runs, key=lambda run: run[0])[
+        len(runs) // 2
+    ]
+    result = {"seconds": round(seconds, 4)}
+    for key, value in counts.items():
+        result[key] = value
+        result[f"{key}_per_second"] = round(value / seconds, 1)
+    summary = profile_summary(profile)
+    result["db_queries"] = summary["counters"].get("db_queries", 0)
+    result["stages"] = summary["stages"]
+    result["runs"] = [round(run[0], 4) for run in runs]
+    return result
+
+
+def git_revision():
+    """Return the checked out commit and whether the tree has changes"""
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+        changes = subprocess.run(
+            ["git", "status", "--porcelain", "--untracked-files=no"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+    return commit, bool(changes.strip())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--scenario", action="append", choices=SCENARIOS, default=[]
+    )
+    parser.add_argument("--pages", type=int, default=1000)
+    parser.add_argument("--fanout", type=int, default=20)
+    parser.add_argument("--external-ratio", type=float, default=0.1)
+    parser.add_argument("--script-links", type=int, default=2)
+    parser.add_argument("--sitemap-size", type=int, default=1000)
+    parser.add_argument("--page-bytes", type=int, default=16 * 1024)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--engine", choices=("sync", "async"), default="async")
+    parser.add_argument("--extractor", default="lxml")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--parse-workers", type=int, default=0)
+    parser.add_argument("--flush-size", type=int, default=2000)
+    parser.add_argument("--batch-size", type=int, default=50)
+    parser.add_argument("--url-query", choices=QUERY_MODES, default="drop")
+    parser.add_argument("--dedupe", choices=DEDUPE_MODES, default="off")
+    parser.add_argument("--max-depth", type=int, default=0)
+    parser.add_argument("--max-pages", type=int, default=0)
+    parser.add_argument("--crawl-delay", type=float, default=0.0)
+    parser.add_argument(
+        "--offline-pages",
+        type=int,
+        default=2000,
+        help="pages generated for the parse and db_write scenarios",
+    )
+    parser.add_argument("--database", default="sqlite://")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", help="write the JSON here, not stdout")
+    args = parser.parse_args()
+    # The crawler logs every URL at INFO
+    logging.getLogger().setLevel(logging.WARNING)
+
+    site = SyntheticSite(
+        pages=args.pages,
+        fanout=args.fanout,
+        external_ratio=args.external_ratio,
+        script_links=args.script_links,
+        sitemap_size=args.sitemap_size,
+        page_bytes=args.page_bytes,
+        latency=args.latency,
+        seed=args.seed,
+    )
+    options = CrawlOptions(
+        engine=args.engine,
+        extractor=args.extractor,
+        concurrency=args.concurrency,
+        per_host_concurrency=args.concurrency,
+        crawl_delay=args.crawl_delay,
+        parse_workers=args.parse_workers,
+        flush_size=args.flush_size,
+        batch_size=args.batch_size,
+        url_query=args.url_query,
+        dedupe=args.dedupe,
+        max_depth=args.max_depth,
+        max_pages=args.max_pages,
+    )
+    sessions = make_sessions(args.database)
+    server = serve_site(site)
+    bench = Bench(site, options, site_url(server), args.offline_pages)
+    commit, dirty = git_revision()
+    report = {
+        "benchmark": "crawl",
+        "commit": commit,
+        "dirty": dirty,
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "database": sessions.kw["bind"].dialect.name,
+        "site": site.to_dict(),
+        "options": {
+            **options.to_dict(),
+            "offline_pages": args.offline_pages,
+            "repeat": args.repeat,
+        },
+        "results": {},
+    }
+    try:
+        for name in args.scenario or SCENARIOS:
+            report["results"][name] = run_scenario(
+                name, bench, sessions, args.repeat
+            )
+    finally:
+        server.shutdown()
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+            f.write("\n")
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        sys.stdout.write("\n")
+
+
+if __name__ == "__main__":
+    main()
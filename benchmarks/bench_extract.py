@@ -0,0 +1,109 @@
+"""Compare link extractor backends for speed and output parity.
+
+Usage::
+
+    python -m benchmarks.bench_extract [--page FILE_OR_URL ...]
+
+Each page is run through every backend in
+:data:`src.tasks.extractors.EXTRACTORS`.  The ``bs4`` backend is the
+reference: any other backend whose links differ from it on a page is
+reported and makes the script exit with status 1.  Without ``--page`` a
+large synthetic page is used.
+"""
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+# The crawler module builds its SQLAlchemy engine at import time; the
+# benchmark never touches the database.
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+import requests  # noqa: E402
+
+from src.tasks.extractors import EXTRACTORS  # noqa: E402
+
+
+def synthetic_page(links=5000, scripts=200, seed=0):
+    rng = random.Random(seed)
+    parts = ["<html><head><title>bench</title></head><body>"]
+    for i in range(links):
+        href = rng.choice(
+            [
+                f"/page/{i}",
+                f"https://example.com/p/{i}?ref=nav",
+                f"../rel/{i}",
+                "#",
+                f"https://other.org/{i}",
+            ]
+        )
+        parts.append(
+            f'<div class="item"><p>Item {i} &amp; text</p>'
+            f'<a href="{href}" class="link">link {i}</a></div>'
+        )
+        if i % (links // scripts or 1) == 0:
+            parts.append(
+                "<script>var cfg = {url: '/api/%d'};"
+                "fetch('/data/%d'); if (a < b) {}</script>" % (i, i)
+            )
+    parts.append("</body></html>")
+    return "".join(parts)
+
+
+def load_page(source):
+    if source.startswith(("http://", "https://")):
+        return requests.get(source, timeout=30).text
+    with open(source, encoding="utf-8", errors="replace") as f:
+        return f.read()
+
+
+def run(extract, html, url, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        links = extract(html, url)
+        timings.append(time.perf_counter() - start)
+    return links, statistics.median(timings)
+
+
+def canonical(links):
+    return sorted(links.anchors), sorted(links.scripts)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--page", action="append", default=[])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    pages = [(source, load_page(source)) for source in args.page] or [
+        ("synthetic", synthetic_page())
+    ]
+
+    mismatches = 0
+    for source, html in pages:
+        url = source if source.startswith("http") else "https://example.com/"
+        size = len(html.encode("utf-8")) / 1e6
+        print(f"{source} ({size:.2f} MB)")
+        reference = None
+        for name, extract in EXTRACTORS.items():
+            links, seconds = run(extract, html, url, args.repeat)
+            print(
+                f"  {name:>5}: {seconds * 1000:8.1f} ms "
+                f"({size / seconds:6.1f} MB/s, {len(links.anchors)} anchors, "
+                f"{len(links.scripts)} script links)"
+            )
+            if reference is None:
+                reference = canonical(links)
+            elif canonical(links) != reference:
+                mismatches += 1
+                print(f"  {name:>5}: output differs from bs4")
+
+    sys.exit(1 if mismatches else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""Compare the sequential and async fetch paths against a local server.
+
+Usage::
+
+    python -m benchmarks.bench_fetch --pages 50 --latency 0.05
+
+The sequential path mirrors ``fetch_page``: one blocking ``requests.get``
+per page followed by the crawl delay.  The async path fetches the same pages
+through :class:`src.tasks.fetcher.CrawlEngine`.
+"""
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import argparse
+import os
+import threading
+import time
+
+# The crawler module builds its SQLAlchemy engine at import time; the
+# benchmark never touches the database.
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+import requests  # noqa: E402
+
+from src.tasks.fetcher import CrawlEngine  # noqa: E402
+
+
+def make_handler(latency, links_per_page):
+    class PageHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            time.sleep(latency)
+            links = "".join(
+                f'<a href="/page/{i}">page {i}</a>'
+                for i in range(links_per_page)
+            )
+            body = f"<html><body>{links}</body></html>".encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    return PageHandler
+
+
+def start_server(latency, links_per_page):
+    server = ThreadingHTTPServer(
+        ("127.0.0.1", 0), make_handler(latency, links_per_page)
+    )
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def bench_sequential(urls, crawl_delay):
+    start = time.perf_counter()
+    for url in urls:
+        time.sleep(crawl_delay)
+        requests.get(url, timeout=10).text
+    return len(urls) / (time.perf_counter() - start)
+
+
+def bench_async(urls, concurrency, per_host_concurrency):
+    with CrawlEngine(
+        concurrency=concurrency,
+        per_host_concurrency=per_host_concurrency,
+    ) as engine:
+        start = time.perf_counter()
+        results = engine.fetch_many(urls)
+        elapsed = time.perf_counter() - start
+    assert all(r.status_code == 200 for r in results)
+    return len(urls) / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pages", type=int, default=50)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--links", type=int, default=50)
+    parser.add_argument("--crawl-delay", type=float, default=1.0)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--per-host-concurrency", type=int, default=16)
+    args = parser.parse_args()
+
+    server = start_server(args.latency, args.links)
+    host, port = server.server_address
+    urls = [f"http://{host}:{port}/page/{i}" for i in range(args.pages)]
+    try:
+        sequential = bench_sequential(urls, args.crawl_delay)
+        concurrent = bench_async(
+            urls, args.concurrency, args.per_host_concurrency
+        )
+    finally:
+        server.shutdown()
+
+    print(f"sequential (crawl delay {args.crawl_delay}s): {sequential:.1f}")
+    print(f"async ({args.concurrency} concurrent): {concurrent:.1f}")
+    print("(pages per second)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""Measure the per-link cost of URL normalization.
+
+Usage::
+
+    python -m benchmarks.bench_normalize [--pages N] [--links N]
+
+Links of a synthetic site are normalized the way the crawler used to do it
+(``normalize_url`` on the raw href, then again after ``urljoin``, with an
+INFO log line per call) and with :class:`src.tasks.normalization.Normalizer`
+both cold and with a warm memo.
+"""
+
+import argparse
+import logging
+import os
+import random
+import time
+from urllib.parse import urljoin, urlparse
+
+# The crawler module builds its SQLAlchemy engine at import time; the
+# benchmark never touches the database.
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+from src.tasks.normalization import Normalizer  # noqa: E402
+
+
+logger = logging.getLogger("BenchNormalize")
+
+
+def legacy_normalize_url(u):
+    logger.info(f"Normalizing url: {u}")
+    p = urlparse(u)
+    ret = f"{p.scheme}://{p.netloc}{p.path}".rstrip("/")
+    logger.debug(f"Normalized URD: {ret}")
+    return ret
+
+
+def legacy(pages):
+    for url, hrefs in pages:
+        for href in {legacy_normalize_url(h) for h in hrefs}:
+            legacy_normalize_url(urljoin(url, href))
+
+
+def synthetic_site(pages=200, links=300, seed=0):
+    """Pages whose links mostly repeat, like site-wide navigation"""
+    rng = random.Random(seed)
+    site = []
+    for i in range(pages):
+        url = f"https://example.com/section/{i % 20}/page-{i}"
+        hrefs = [
+            rng.choice(
+                [
+                    f"/nav/{rng.randrange(50)}",
+                    f"../page-{rng.randrange(pages)}",
+                    f"https://example.com/p/{rng.randrange(pages)}?ref=nav",
+                    f"https://Other.org:443/{rng.randrange(100)}",
+                    "#top",
+                ]
+            )
+            for _ in range(links)
+        ]
+        site.append((url, hrefs))
+    return site
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    fn(*args)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pages", type=int, default=200)
+    parser.add_argument("--links", type=int, default=300)
+    args = parser.parse_args()
+
+    # The crawler logged at INFO; send it nowhere so only formatting counts
+    logger.setLevel(logging.INFO)
+    logger.addHandler(logging.NullHandler())
+    logger.propagate = False
+
+    site = synthetic_site(args.pages, args.links)
+    total = args.pages * args.links
+    normalizer = Normalizer()
+
+    def batch():
+        for url, hrefs in site:
+            normalizer.normalize_many(hrefs, url)
+
+    results = [
+        ("legacy", timed(legacy, site)),
+        ("cold", timed(batch)),
+        ("warm", timed(batch)),
+    ]
+    for name, seconds in results:
+        print(
+            f"{name:>6}: {seconds * 1e6 / total:6.2f} us/link "
+            f"({total / seconds:10.0f} links/s)"
+        )
+    print(f"memo: {normalizer.cache_info()}")
+    print(f"join memo: {normalizer.join_cache_info()}")
+
+
+if __name__ == "__main__":
+    main()
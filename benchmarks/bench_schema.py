@@ -0,0 +1,216 @@
+"""Compare the url_nodes layouts before and after migration 007.
+
+Usage::
+
+    DATABASE_URL=postgresql://... python -m benchmarks.bench_schema \\
+        [--jobs N] [--nodes N]
+
+Needs a scratch PostgreSQL database: everything is created in the
+``bench_schema`` schema, which is dropped first.  ``--jobs`` jobs of
+``--nodes`` URLs each are loaded into the original layout (one heap, unique
+``(job_id, url)`` plus a ``url`` index) and into the partitioned one
+(partition per job, unique ``(job_id, url_hash)``, partial pending index),
+then insert, lookup, pending-scan and job-drop costs and index sizes are
+reported for both.
+"""
+
+import argparse
+import os
+import random
+import time
+
+from sqlalchemy import create_engine, text
+
+
+SCHEMA = "bench_schema"
+INSERT_CHUNK = 1000
+
+LEGACY = """
+CREATE TABLE {schema}.legacy_nodes (
+    id BIGSERIAL PRIMARY KEY,
+    job_id VARCHAR(40) NOT NULL,
+    url VARCHAR(2000) NOT NULL,
+    is_external BOOLEAN NOT NULL DEFAULT false,
+    status_code SMALLINT,
+    depth INTEGER,
+    CONSTRAINT legacy_unique UNIQUE (job_id, url)
+);
+CREATE INDEX ON {schema}.legacy_nodes(job_id);
+CREATE INDEX ON {schema}.legacy_nodes(url);
+"""
+
+PARTITIONED = """
+CREATE FUNCTION {schema}.url_hash(url TEXT)
+RETURNS BIGINT AS $$
+    SELECT ('x' || substr(md5(url), 1, 16))::BIT(64)::BIGINT;
+$$ LANGUAGE SQL IMMUTABLE PARALLEL SAFE;
+CREATE TABLE {schema}.partitioned_nodes (
+    id BIGSERIAL,
+    job_id VARCHAR(40) NOT NULL,
+    url VARCHAR(2000) NOT NULL,
+    url_hash BIGINT NOT NULL
+        GENERATED ALWAYS AS ({schema}.url_hash(url)) STORED,
+    is_external BOOLEAN NOT NULL DEFAULT false,
+    status_code SMALLINT,
+    depth INTEGER,
+    PRIMARY KEY (job_id, id),
+    CONSTRAINT partitioned_unique UNIQUE (job_id, url_hash)
+) PARTITION BY LIST (job_id);
+CREATE INDEX ON {schema}.partitioned_nodes(job_id, id)
+    WHERE status_code IS NULL AND is_external IS false;
+"""
+
+LAYOUTS = {
+    "legacy": ("legacy_nodes", "(job_id, url)", "url = :url"),
+    "partitioned": (
+        "partitioned_nodes",
+        "(job_id, url_hash)",
+        f"url_hash = {SCHEMA}.url_hash(:url) AND url = :url",
+    ),
+}
+
+
+def job_urls(job, nodes):
+    # Long, similar URLs, like the query-heavy paths of real sites
+    return [
+        f"https://site-{job}.example.com/catalogue/category-{i % 97}/"
+        f"product-{i}?utm_source=newsletter&variant={i % 7}"
+        for i in range(nodes)
+    ]
+
+
+def timed(fn):
+    start = time.perf_counter()
+    fn()
+    return time.perf_counter() - start
+
+
+def load(conn, table, conflict, job, urls):
+    """Upsert a job's nodes the way GraphWriter.flush does"""
+    for i in range(0, len(urls), INSERT_CHUNK):
+        rows = [
+            {"job": job, "url": url, "status": 200 if n % 3 else None}
+            for n, url in enumerate(urls[i : i + INSERT_CHUNK], i)
+        ]
+        conn.execute(
+            text(
+                f"INSERT INTO {SCHEMA}.{table} "
+                "(job_id, url, status_code, depth) "
+                "VALUES (:job, :url, :status, 1) "
+                f"ON CONFLICT {conflict} DO UPDATE SET "
+                "status_code = COALESCE(excluded.status_code, "
+                f"{table}.status_code)"
+            ),
+            rows,
+        )
+
+
+def index_size(conn, table):
+    """Bytes of all indexes of ``table`` and its partitions"""
+    return conn.scalar(
+        text(
+            "SELECT SUM(pg_indexes_size(relid)) "
+            f"FROM pg_partition_tree('{SCHEMA}.{table}')"
+        )
+    )
+
+
+def bench(engine, layout, jobs, nodes, lookups):
+    table, conflict, match = LAYOUTS[layout]
+    results = {"insert": 0}
+    for job in range(jobs):
+        urls = job_urls(job, nodes)
+        with engine.begin() as conn:
+            if layout == "partitioned":
+                # What the crawl_jobs trigger does for every new job
+                conn.execute(
+                    text(
+                        f'CREATE TABLE {SCHEMA}."{table}_{job}" '
+                        f"PARTITION OF {SCHEMA}.{table} "
+                        f"FOR VALUES IN ('{job}')"
+                    )
+                )
+            results["insert"] += timed(
+                lambda: load(conn, table, conflict, str(job), urls)
+            )
+    results["insert"] = results["insert"] * 1e6 / (jobs * nodes)
+
+    with engine.begin() as conn:
+        conn.execute(text(f"ANALYZE {SCHEMA}.{table}"))
+        probe = [
+            (str(job), url)
+            for job in random.sample(range(jobs), min(jobs, 10))
+            for url in random.sample(job_urls(job, nodes), lookups // 10)
+        ]
+        stmt = text(
+            f"SELECT id FROM {SCHEMA}.{table} "
+            f"WHERE job_id = :job AND {match}"
+        )
+        seconds = timed(
+            lambda: [
+                conn.execute(stmt, {"job": job, "url": url}).scalar_one()
+                for job, url in probe
+            ]
+        )
+        results["lookup"] = seconds * 1e6 / len(probe)
+        pending = text(
+            f"SELECT id, url FROM {SCHEMA}.{table} WHERE job_id = :job "
+            "AND status_code IS NULL AND is_external IS false "
+            "AND id > 0 ORDER BY id LIMIT 1000"
+        )
+        seconds = timed(
+            lambda: [
+                conn.execute(pending, {"job": str(job)}).all()
+                for job in range(jobs)
+            ]
+        )
+        results["pending"] = seconds * 1e3 / jobs
+        results["index_mb"] = index_size(conn, table) / 2**20
+
+    with engine.begin() as conn:
+        if layout == "partitioned":
+            drop = text(f'DROP TABLE {SCHEMA}."{table}_0"')
+        else:
+            drop = text(f"DELETE FROM {SCHEMA}.{table} WHERE job_id = '0'")
+        results["drop"] = timed(lambda: conn.execute(drop)) * 1e3
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--jobs", type=int, default=20)
+    parser.add_argument("--nodes", type=int, default=50000)
+    parser.add_argument("--lookups", type=int, default=2000)
+    args = parser.parse_args()
+
+    url = os.getenv("DATABASE_URL", "")
+    if not url.startswith("postgresql"):
+        parser.error("DATABASE_URL must point to a scratch PostgreSQL db")
+    engine = create_engine(url)
+    with engine.begin() as conn:
+        conn.execute(text(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE"))
+        conn.execute(text(f"CREATE SCHEMA {SCHEMA}"))
+        conn.execute(text(LEGACY.format(schema=SCHEMA)))
+        conn.execute(text(PARTITIONED.format(schema=SCHEMA)))
+
+    random.seed(0)
+    print(f"{args.jobs} jobs x {args.nodes} nodes")
+    print(
+        f"{'layout':>12} {'insert us/row':>14} {'lookup us':>10} "
+        f"{'pending ms':>11} {'index MB':>9} {'drop job ms':>12}"
+    )
+    try:
+        for layout in LAYOUTS:
+            r = bench(engine, layout, args.jobs, args.nodes, args.lookups)
+            print(
+                f"{layout:>12} {r['insert']:14.1f} {r['lookup']:10.1f} "
+                f"{r['pending']:11.2f} {r['index_mb']:9.1f} "
+                f"{r['drop']:12.1f}"
+            )
+    finally:
+        with engine.begin() as conn:
+            conn.execute(text(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE"))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,196 @@
+"""Synthetic sites for the benchmarks, and a local server for them.
+
+A :class:`SyntheticSite` is fully determined by its parameters and seed:
+page ``i`` always links to the same pages, so runs on different commits
+crawl exactly the same graph.  Every ``/page/<i>`` exists; ``pages`` only
+bounds the ids that links point to, and the sitemaps list pages
+``0 .. sitemap_size - 1``.
+
+Serve one with :func:`serve_site`::
+
+    server = serve_site(SyntheticSite(pages=1000, latency=0.02))
+    base_url = site_url(server)
+    ...
+    server.shutdown()
+"""
+
+from dataclasses import asdict, dataclass
+from html import escape
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import random
+import re
+import threading
+import time
+
+
+# URLs per child sitemap, the protocol's limit
+SITEMAP_FILE_SIZE = 50000
+
+PAGE_RE = re.compile(r"^/page/(\d+)$")
+SITEMAP_RE = re.compile(r"^/sitemaps/(\d+)\.xml$")
+
+# Filler paragraph repeated to reach ``page_bytes``
+FILLER = (
+    "<p>Lorem ipsum dolor sit amet, consectetur adipiscing elit, sed do "
+    "eiusmod tempor incididunt ut labore et dolore magna aliqua.</p>\n"
+)
+
+
+@dataclass
+class SyntheticSite:
+    """Parameters of a generated site.
+
+    Each page has ``fanout`` anchors, ``external_ratio`` of them to other
+    hosts, and ``script_links`` links assigned in an inline script; the
+    internal ones use the absolute, root-relative, fragment and query forms
+    real sites mix.  ``page_bytes`` pads pages with text and ``latency``
+    delays every response by that many seconds.
+    """
+
+    pages: int = 1000
+    fanout: int = 20
+    external_ratio: float = 0.1
+    script_links: int = 2
+    sitemap_size: int = 1000
+    page_bytes: int = 16 * 1024
+    latency: float = 0.0
+    seed: int = 0
+
+    def to_dict(self):
+        return asdict(self)
+
+    def _random(self, page):
+        return random.Random(self.seed * 1000003 + page)
+
+    def _internal_link(self, rng, base_url):
+        target = rng.randrange(self.pages)
+        form = rng.randrange(4)
+        if form == 0:
+            return f"{base_url}/page/{target}"
+        if form == 1:
+            return f"/page/{target}#section-{rng.randrange(5)}"
+        if form == 2:
+            return f"/page/{target}?utm_source=bench&ref={rng.randrange(9)}"
+        return f"/page/{target}"
+
+    def links(self, page, base_url):
+        """Anchor and script link values of ``page``, as written in it"""
+        rng = self._random(page)
+        anchors = []
+        for _ in range(self.fanout):
+            if rng.random() < self.external_ratio:
+                host = f"ext{rng.randrange(50)}.example.com"
+                anchors.append(f"https://{host}/{rng.randrange(10000)}")
+            else:
+                anchors.append(self._internal_link(rng, base_url))
+        scripts = [
+            self._internal_link(rng, base_url)
+            for _ in range(self.script_links)
+        ]
+        return anchors, scripts
+
+    def page_html(self, page, base_url):
+        anchors, scripts = self.links(page, base_url)
+        parts = [
+            "<!DOCTYPE html>\n<html><head>",
+            f"<title>Page {page}</title></head><body>\n<nav>\n",
+        ]
+        parts.extend(
+            f'<a href="{escape(href)}">link</a>\n' for href in anchors
+        )
+        parts.append("</nav>\n<script>\n")
+        parts.extend(f'window.location = "{href}";\n' for href in scripts)
+        parts.append("</script>\n<main>\n")
+        size = sum(len(part) for part in parts)
+        if size < self.page_bytes:
+            parts.append(FILLER * ((self.page_bytes - size) // len(FILLER)))
+        parts.append("</main></body></html>\n")
+        return "".join(parts)
+
+    @property
+    def sitemap_files(self):
+        return -(-self.sitemap_size // SITEMAP_FILE_SIZE)
+
+    def sitemap_xml(self, base_url):
+        """The root sitemap: a urlset, or an index of child sitemaps"""
+        if self.sitemap_files <= 1:
+            return self.child_sitemap_xml(0, base_url)
+        entries = "".join(
+            f"<sitemap><loc>{base_url}/sitemaps/{i}.xml</loc></sitemap>\n"
+            for i in range(self.sitemap_files)
+        )
+        return (
+            '<?xml version="1.0" encoding="UTF-8"?>\n<sitemapindex '
+            'xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n'
+            f"{entries}</sitemapindex>\n"
+        )
+
+    def child_sitemap_xml(self, index, base_url):
+        first = index * SITEMAP_FILE_SIZE
+        last = min(first + SITEMAP_FILE_SIZE, self.sitemap_size)
+        entries = "".join(
+            f"<url><loc>{base_url}/page/{i}</loc>"
+            f"<lastmod>2024-01-{i % 28 + 1:02d}</lastmod>"
+            f"<priority>{(i % 10 + 1) / 10}</priority></url>\n"
+            for i in range(first, last)
+        )
+        return (
+            '<?xml version="1.0" encoding="UTF-8"?>\n<urlset '
+            'xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n'
+            f"{entries}</urlset>\n"
+        )
+
+    def robots_txt(self, base_url):
+        return f"User-agent: *\nAllow: /\nSitemap: {base_url}/sitemap.xml\n"
+
+
+def make_handler(site):
+    class SiteHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            if site.latency:
+                time.sleep(site.latency)
+            host, port = self.server.server_address
+            base_url = f"http://{host}:{port}"
+            path = self.path.split("?", 1)[0]
+            page = PAGE_RE.match(path)
+            sitemap = SITEMAP_RE.match(path)
+            if page:
+                body = site.page_html(int(page.group(1)), base_url)
+                self.respond(body, "text/html; charset=utf-8")
+            elif path == "/sitemap.xml":
+                self.respond(site.sitemap_xml(base_url), "application/xml")
+            elif sitemap and int(sitemap.group(1)) < site.sitemap_files:
+                body = site.child_sitemap_xml(int(sitemap.group(1)), base_url)
+                self.respond(body, "application/xml")
+            elif path == "/robots.txt":
+                self.respond(site.robots_txt(base_url), "text/plain")
+            else:
+                self.respond("Not found", "text/plain", 404)
+
+        def respond(self, body, content_type, status=200):
+            body = body.encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    return SiteHandler
+
+
+def serve_site(site, host="127.0.0.1", port=0):
+    """Serve ``site`` from a background thread; return the server"""
+    server = ThreadingHTTPServer((host, port), make_handler(site))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def site_url(server):
+    host, port = server.server_address
+    return f"http://{host}:{port}"
@@ -8,4 +8,6 @@ timezone = "UTC"
 enable_utc = True
 task_track_started = True
 task_time_limit = 300  # 5 minutes
+# Crawls checkpoint and continue in a new task when this one is hit
+task_soft_time_limit = 280
 worker_max_tasks_per_child = 100
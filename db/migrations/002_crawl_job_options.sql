@@ -0,0 +1,2 @@
+-- Per-job crawl settings (engine, concurrency limits, ...)
+ALTER TABLE crawl_jobs ADD COLUMN IF NOT EXISTS options JSONB;
@@ -0,0 +1,6 @@
+-- Checkpoint/resume support: the Celery task currently driving a job, the
+-- time of its last checkpoint and the BFS depth of every discovered URL so
+-- that a resumed frontier keeps its order.
+ALTER TABLE crawl_jobs ADD COLUMN IF NOT EXISTS task_id VARCHAR(255);
+ALTER TABLE crawl_jobs ADD COLUMN IF NOT EXISTS checkpoint_at TIMESTAMPTZ;
+ALTER TABLE url_nodes ADD COLUMN IF NOT EXISTS depth INTEGER;
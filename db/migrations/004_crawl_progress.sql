@@ -0,0 +1,22 @@
+-- Incrementally maintained progress counters, updated by every graph
+-- flush.  total_urls counts internal URLs (the crawl's workload) and
+-- processed_urls the pages fetched or skipped so far.
+ALTER TABLE crawl_jobs ADD COLUMN IF NOT EXISTS discovered_urls INTEGER DEFAULT 0;
+ALTER TABLE crawl_jobs ADD COLUMN IF NOT EXISTS external_urls INTEGER DEFAULT 0;
+ALTER TABLE crawl_jobs ADD COLUMN IF NOT EXISTS error_urls INTEGER DEFAULT 0;
+
+UPDATE crawl_jobs j
+SET discovered_urls = c.discovered,
+    external_urls = c.external,
+    error_urls = c.errors
+FROM (
+    SELECT job_id,
+           COUNT(*) AS discovered,
+           COUNT(*) FILTER (WHERE is_external) AS external,
+           COUNT(*) FILTER (
+               WHERE status_code < 0 OR status_code >= 400
+           ) AS errors
+    FROM url_nodes
+    GROUP BY job_id
+) c
+WHERE c.job_id = j.id;
@@ -0,0 +1,94 @@
+-- Per-job summary kept current by the crawler so that result pages never
+-- scan url_nodes: counts of fetched pages per status class ("2xx", ...,
+-- "error" for no response) and per depth, plus a capped sample of the
+-- internal and external URLs discovered first.
+
+-- Sum two {"key": count} objects key by key
+CREATE OR REPLACE FUNCTION jsonb_add_counts(a JSONB, b JSONB)
+RETURNS JSONB AS $$
+    SELECT COALESCE(jsonb_object_agg(key, total), '{}'::JSONB)
+    FROM (
+        SELECT key, SUM(value::BIGINT) AS total
+        FROM (
+            SELECT * FROM jsonb_each_text(a)
+            UNION ALL
+            SELECT * FROM jsonb_each_text(b)
+        ) counts
+        GROUP BY key
+    ) sums;
+$$ LANGUAGE SQL IMMUTABLE;
+
+-- Append array b to array a, keeping at most cap elements
+CREATE OR REPLACE FUNCTION jsonb_append_capped(a JSONB, b JSONB, cap INTEGER)
+RETURNS JSONB AS $$
+    SELECT CASE
+        WHEN jsonb_array_length(a) >= cap THEN a
+        ELSE (
+            SELECT COALESCE(jsonb_agg(value ORDER BY ord), '[]'::JSONB)
+            FROM jsonb_array_elements(a || b) WITH ORDINALITY AS e(value, ord)
+            WHERE ord <= cap
+        )
+    END;
+$$ LANGUAGE SQL IMMUTABLE;
+
+CREATE TABLE IF NOT EXISTS crawl_job_stats (
+    job_id VARCHAR(40) PRIMARY KEY REFERENCES crawl_jobs(id) ON DELETE CASCADE,
+    status_classes JSONB NOT NULL DEFAULT '{}',
+    depths JSONB NOT NULL DEFAULT '{}',
+    internal_sample JSONB NOT NULL DEFAULT '[]',
+    external_sample JSONB NOT NULL DEFAULT '[]',
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+INSERT INTO crawl_job_stats (job_id, status_classes, depths)
+SELECT j.id,
+       COALESCE((
+           SELECT jsonb_object_agg(class, n)
+           FROM (
+               SELECT CASE
+                          WHEN status_code < 0 THEN 'error'
+                          ELSE (status_code / 100)::TEXT || 'xx'
+                      END AS class,
+                      COUNT(*) AS n
+               FROM url_nodes
+               WHERE job_id = j.id AND status_code IS NOT NULL
+               GROUP BY 1
+           ) classes
+       ), '{}'),
+       COALESCE((
+           SELECT jsonb_object_agg(depth::TEXT, n)
+           FROM (
+               SELECT depth, COUNT(*) AS n
+               FROM url_nodes
+               WHERE job_id = j.id
+                 AND status_code IS NOT NULL
+                 AND depth IS NOT NULL
+               GROUP BY depth
+           ) depths
+       ), '{}')
+FROM crawl_jobs j
+ON CONFLICT (job_id) DO NOTHING;
+
+UPDATE crawl_job_stats s
+SET internal_sample = COALESCE((
+        SELECT jsonb_agg(url)
+        FROM (
+            SELECT url FROM url_nodes
+            WHERE job_id = s.job_id AND NOT is_external
+            ORDER BY id LIMIT 200
+        ) sample
+    ), '[]'),
+    external_sample = COALESCE((
+        SELECT jsonb_agg(url)
+        FROM (
+            SELECT url FROM url_nodes
+            WHERE job_id = s.job_id AND is_external
+            ORDER BY id LIMIT 200
+        ) sample
+    ), '[]');
+
+-- Keyset pagination of the job list, optionally filtered by status
+CREATE INDEX IF NOT EXISTS idx_crawl_jobs_created
+    ON crawl_jobs(created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_crawl_jobs_status_created
+    ON crawl_jobs(status, created_at DESC, id DESC);
@@ -0,0 +1,3 @@
+-- Whether a URL was listed in the site's sitemaps, so that sitemap URLs no
+-- crawled page links to (orphans) can be found.  Unknown for older jobs.
+ALTER TABLE url_nodes ADD COLUMN IF NOT EXISTS in_sitemap BOOLEAN NOT NULL DEFAULT false;
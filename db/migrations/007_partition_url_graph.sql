@@ -0,0 +1,135 @@
+-- Rebuild url_nodes and url_edges for 100M-row scale:
+--
+-- * Both tables are LIST-partitioned by job_id, one partition per job,
+--   created by a trigger on crawl_jobs.  drop_job_partitions() removes a
+--   job's graph instantly instead of deleting its rows one by one.
+-- * URLs are looked up through url_hash, a generated BIGINT (the first 64
+--   bits of their MD5), so the unique index per job is fixed-width instead
+--   of holding URLs of up to 2000 bytes.  The URL-only index, which no
+--   query used, is gone.
+-- * Pending URLs (get_pending_urls, frontier restore) have a partial index.
+-- * Ids become BIGINT.  Edges no longer carry foreign keys to url_nodes:
+--   both sides of an edge always live in the same job's partitions and
+--   are dropped together, and a cross-partition foreign key would make
+--   dropping a partition scan the edges of every other job.
+--
+-- Existing rows are copied into the new layout, which rewrites both tables.
+
+-- Matches src.models.url_hash()
+CREATE OR REPLACE FUNCTION url_hash(url TEXT)
+RETURNS BIGINT AS $$
+    SELECT ('x' || substr(md5(url), 1, 16))::BIT(64)::BIGINT;
+$$ LANGUAGE SQL IMMUTABLE PARALLEL SAFE;
+
+-- Set the old tables aside, freeing their constraint and index names
+ALTER TABLE url_edges RENAME TO url_edges_old;
+ALTER TABLE url_nodes RENAME TO url_nodes_old;
+ALTER TABLE url_edges_old DROP CONSTRAINT url_edges_pkey CASCADE;
+ALTER TABLE url_edges_old DROP CONSTRAINT edge_unique;
+ALTER TABLE url_edges_old DROP CONSTRAINT no_self_links;
+ALTER TABLE url_nodes_old DROP CONSTRAINT url_nodes_pkey CASCADE;
+ALTER TABLE url_nodes_old DROP CONSTRAINT url_unique_per_job;
+DROP INDEX IF EXISTS idx_url_nodes_job;
+DROP INDEX IF EXISTS idx_url_nodes_url;
+DROP INDEX IF EXISTS idx_url_edges_source;
+DROP INDEX IF EXISTS idx_url_edges_target;
+
+-- Keep the id sequences so that ids stay unique across the copy
+ALTER SEQUENCE url_nodes_id_seq OWNED BY NONE;
+ALTER SEQUENCE url_edges_id_seq OWNED BY NONE;
+ALTER SEQUENCE url_nodes_id_seq AS BIGINT;
+ALTER SEQUENCE url_edges_id_seq AS BIGINT;
+
+CREATE TABLE url_nodes (
+    id BIGINT NOT NULL DEFAULT nextval('url_nodes_id_seq'),
+    job_id VARCHAR(40) NOT NULL REFERENCES crawl_jobs(id) ON DELETE CASCADE,
+    url VARCHAR(2000) NOT NULL,
+    url_hash BIGINT NOT NULL GENERATED ALWAYS AS (url_hash(url)) STORED,
+    is_external BOOLEAN NOT NULL DEFAULT false,
+    status_code SMALLINT,
+    discovered_at TIMESTAMPTZ DEFAULT NOW(),
+    depth INTEGER,
+    in_sitemap BOOLEAN NOT NULL DEFAULT false,
+    CONSTRAINT url_nodes_pkey PRIMARY KEY (job_id, id),
+    CONSTRAINT url_hash_unique_per_job UNIQUE (job_id, url_hash)
+) PARTITION BY LIST (job_id);
+
+CREATE TABLE url_edges (
+    id BIGINT NOT NULL DEFAULT nextval('url_edges_id_seq'),
+    job_id VARCHAR(40) NOT NULL REFERENCES crawl_jobs(id) ON DELETE CASCADE,
+    source_id BIGINT NOT NULL,
+    target_id BIGINT NOT NULL,
+    link_type VARCHAR(20) DEFAULT 'hyperlink',
+    CONSTRAINT url_edges_pkey PRIMARY KEY (job_id, id),
+    CONSTRAINT no_self_links CHECK (source_id <> target_id),
+    -- Also serves lookups of a node's out-links
+    CONSTRAINT edge_unique UNIQUE (job_id, source_id, target_id)
+) PARTITION BY LIST (job_id);
+
+ALTER SEQUENCE url_nodes_id_seq OWNED BY url_nodes.id;
+ALTER SEQUENCE url_edges_id_seq OWNED BY url_edges.id;
+
+-- Written exactly like the filter of get_pending_urls so the planner
+-- matches it
+CREATE INDEX idx_url_nodes_pending ON url_nodes(job_id, id)
+    WHERE status_code IS NULL AND is_external IS false;
+CREATE INDEX idx_url_edges_target ON url_edges(job_id, target_id);
+
+-- Partitions are named after their job, e.g. "url_nodes_<job id>"
+CREATE OR REPLACE FUNCTION create_job_partitions(job VARCHAR)
+RETURNS VOID AS $$
+BEGIN
+    EXECUTE format(
+        'CREATE TABLE IF NOT EXISTS %I PARTITION OF url_nodes '
+        'FOR VALUES IN (%L)',
+        'url_nodes_' || job, job
+    );
+    EXECUTE format(
+        'CREATE TABLE IF NOT EXISTS %I PARTITION OF url_edges '
+        'FOR VALUES IN (%L)',
+        'url_edges_' || job, job
+    );
+END;
+$$ LANGUAGE plpgsql;
+
+-- Drop a job's whole link graph; the crawl_jobs row is left alone
+CREATE OR REPLACE FUNCTION drop_job_partitions(job VARCHAR)
+RETURNS VOID AS $$
+BEGIN
+    EXECUTE format('DROP TABLE IF EXISTS %I', 'url_edges_' || job);
+    EXECUTE format('DROP TABLE IF EXISTS %I', 'url_nodes_' || job);
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION crawl_jobs_create_partitions()
+RETURNS TRIGGER AS $$
+BEGIN
+    PERFORM create_job_partitions(NEW.id);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS crawl_jobs_partitions ON crawl_jobs;
+CREATE TRIGGER crawl_jobs_partitions
+    AFTER INSERT ON crawl_jobs
+    FOR EACH ROW EXECUTE FUNCTION crawl_jobs_create_partitions();
+
+SELECT create_job_partitions(id) FROM crawl_jobs;
+
+INSERT INTO url_nodes (
+    id, job_id, url, is_external, status_code, discovered_at, depth,
+    in_sitemap
+)
+SELECT id, job_id, url, is_external, status_code, discovered_at, depth,
+       in_sitemap
+FROM url_nodes_old;
+
+INSERT INTO url_edges (id, job_id, source_id, target_id, link_type)
+SELECT id, job_id, source_id, target_id, link_type
+FROM url_edges_old;
+
+DROP TABLE url_edges_old;
+DROP TABLE url_nodes_old;
+
+ANALYZE url_nodes;
+ANALYZE url_edges;
@@ -0,0 +1,15 @@
+-- Incremental recrawls: a job may reuse what the previous crawl of the
+-- same site saw.  Pages keep the validators of their response (ETag and
+-- Last-Modified headers, sent back as If-None-Match / If-Modified-Since)
+-- and their sitemap <lastmod>; pages that did not change are stored with
+-- the previous job's links instead of being fetched and parsed again.
+ALTER TABLE crawl_jobs ADD COLUMN IF NOT EXISTS previous_job_id VARCHAR(40)
+    REFERENCES crawl_jobs(id) ON DELETE SET NULL;
+ALTER TABLE url_nodes ADD COLUMN IF NOT EXISTS etag VARCHAR(512);
+ALTER TABLE url_nodes ADD COLUMN IF NOT EXISTS last_modified VARCHAR(64);
+ALTER TABLE url_nodes ADD COLUMN IF NOT EXISTS lastmod VARCHAR(64);
+
+-- Latest completed crawl of a start URL
+CREATE INDEX IF NOT EXISTS idx_crawl_jobs_start_url_completed
+    ON crawl_jobs(start_url, created_at DESC)
+    WHERE status = 'completed';
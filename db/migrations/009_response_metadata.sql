@@ -0,0 +1,7 @@
+-- What fetching a page cost: its Content-Type, body bytes read (or the
+-- announced Content-Length of a body that was skipped), the time to fetch
+-- it and whether the body was abandoned at the size limit.
+ALTER TABLE url_nodes ADD COLUMN IF NOT EXISTS content_type VARCHAR(255);
+ALTER TABLE url_nodes ADD COLUMN IF NOT EXISTS content_bytes BIGINT;
+ALTER TABLE url_nodes ADD COLUMN IF NOT EXISTS fetch_ms INTEGER;
+ALTER TABLE url_nodes ADD COLUMN IF NOT EXISTS truncated BOOLEAN;
@@ -0,0 +1,11 @@
+-- External link checking: external nodes get the status their URL answers
+-- with (-1 for no response) after the crawl, and the job records when its
+-- links were last checked.
+ALTER TABLE crawl_jobs ADD COLUMN IF NOT EXISTS links_checked_at TIMESTAMPTZ;
+
+-- Unchecked external nodes, written exactly like the link checker's filter
+CREATE INDEX IF NOT EXISTS idx_url_nodes_unchecked ON url_nodes(job_id, id)
+    WHERE status_code IS NULL AND is_external IS true;
+-- Broken outbound links report
+CREATE INDEX IF NOT EXISTS idx_url_nodes_broken ON url_nodes(job_id, id)
+    WHERE is_external IS true AND (status_code >= 400 OR status_code < 0);
@@ -0,0 +1,5 @@
+-- Per-job crawl profile: stage times (microseconds) and counts, page, link,
+-- byte, error and database round trip counters of jobs crawled with the
+-- ``profile`` option, summed at every graph flush with jsonb_add_counts.
+ALTER TABLE crawl_job_stats
+    ADD COLUMN IF NOT EXISTS profile JSONB NOT NULL DEFAULT '{}';
@@ -0,0 +1,11 @@
+-- Content fingerprints of fetched HTML pages, for jobs crawled with the
+-- ``dedupe`` option: a 64-bit hash of the body and, in "near" mode, its
+-- SimHash.  Pages found to duplicate an earlier one record that page's
+-- url_hash (in the same job) in duplicate_of; their links are not followed.
+ALTER TABLE url_nodes ADD COLUMN IF NOT EXISTS content_hash BIGINT;
+ALTER TABLE url_nodes ADD COLUMN IF NOT EXISTS simhash BIGINT;
+ALTER TABLE url_nodes ADD COLUMN IF NOT EXISTS duplicate_of BIGINT;
+
+-- Duplicates report, and the duplicates of each original page
+CREATE INDEX IF NOT EXISTS idx_url_nodes_duplicates
+    ON url_nodes(job_id, duplicate_of) WHERE duplicate_of IS NOT NULL;
@@ -0,0 +1,8 @@
+-- Crawl budgets and frontier order: when a job started running (its
+-- max_seconds budget counts from there) and the sitemap <priority> of
+-- seeded URLs, so that a resumed frontier keeps its order.
+ALTER TABLE crawl_jobs ADD COLUMN IF NOT EXISTS started_at TIMESTAMPTZ;
+ALTER TABLE url_nodes ADD COLUMN IF NOT EXISTS priority REAL;
+
+UPDATE crawl_jobs SET started_at = created_at
+WHERE started_at IS NULL AND status <> 'pending';
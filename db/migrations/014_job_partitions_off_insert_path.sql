@@ -0,0 +1,39 @@
+-- Create job partitions outside the INSERT of their crawl_jobs row.
+--
+-- The crawl_jobs trigger ran CREATE TABLE ... PARTITION OF inside the
+-- request that created a job, which takes an ACCESS EXCLUSIVE lock on
+-- url_nodes and url_edges: every new job waited for running exports and
+-- crawl writes, and held them up in turn.  The crawl task now creates its
+-- job's partitions when it starts (src.database.create_job_partitions),
+-- as standalone tables attached to the parents, which only takes a SHARE
+-- UPDATE EXCLUSIVE lock on them.  Deleting a job drops its partitions the
+-- same way, with DETACH PARTITION ... CONCURRENTLY
+-- (src.database.drop_job_partitions), which cannot run in a function.
+
+DROP TRIGGER IF EXISTS crawl_jobs_partitions ON crawl_jobs;
+DROP FUNCTION IF EXISTS crawl_jobs_create_partitions();
+
+-- Partitions are still named after their job, e.g. "url_nodes_<job id>".
+-- Indexes and foreign keys of the parents are added by ATTACH PARTITION.
+CREATE OR REPLACE FUNCTION create_job_partitions(job VARCHAR)
+RETURNS VOID AS $$
+DECLARE
+    parent TEXT;
+    partition TEXT;
+BEGIN
+    FOREACH parent IN ARRAY ARRAY['url_nodes', 'url_edges'] LOOP
+        partition := parent || '_' || job;
+        IF to_regclass(format('%I', partition)) IS NULL THEN
+            EXECUTE format(
+                'CREATE TABLE %I (LIKE %I INCLUDING DEFAULTS '
+                'INCLUDING GENERATED INCLUDING CONSTRAINTS)',
+                partition, parent
+            );
+            EXECUTE format(
+                'ALTER TABLE %I ATTACH PARTITION %I FOR VALUES IN (%L)',
+                parent, partition, job
+            );
+        END IF;
+    END LOOP;
+END;
+$$ LANGUAGE plpgsql;
@@ -0,0 +1,316 @@
+from scipy.sparse import csgraph, csr_matrix
+from sqlalchemy import select
+from src.models import CrawlJob, UrlEdge, UrlNode, url_hash
+from src.redis_client import get_redis
+from src.tasks.normalization import get_normalizer
+from urllib.parse import urlparse
+import base64
+import json
+import logging
+import numpy as np
+import redis
+import time
+
+
+logger = logging.getLogger("Analytics")
+
+# Rows read per round trip while loading a graph
+LOAD_CHUNK = 100000
+
+PAGERANK_ALPHA = 0.85
+PAGERANK_TOL = 1e-9
+PAGERANK_MAX_ITER = 100
+
+# Computed metrics are cached per job and crawl progress for METRICS_TTL
+METRICS_TTL = 24 * 3600
+
+# Per-node flags
+ORPHAN = 1
+DEAD_END = 2
+UNREACHABLE = 4
+
+
+class LinkGraph:
+    """A job's internal link graph as a CSR adjacency matrix.
+
+    Only internal nodes take part; links to and from external URLs are
+    dropped.  Row ``i`` of ``adjacency`` holds the out-links of the node
+    whose database id is ``ids[i]`` (``ids`` is sorted).
+    """
+
+    def __init__(self, ids, status, in_sitemap, sources, targets):
+        self.ids = ids
+        self.status = status
+        self.in_sitemap = in_sitemap
+        n = len(ids)
+        # Map database ids to row numbers, dropping edges that leave the
+        # internal node set
+        rows = np.searchsorted(ids, sources)
+        cols = np.searchsorted(ids, targets)
+        keep = (
+            (
+                (rows < n)
+                & (cols < n)
+                & (ids[np.minimum(rows, n - 1)] == sources)
+                & (ids[np.minimum(cols, n - 1)] == targets)
+                & (rows != cols)
+            )
+            if n
+            else np.zeros(len(sources), dtype=bool)
+        )
+        rows, cols = rows[keep], cols[keep]
+        self.adjacency = csr_matrix(
+            (np.ones(len(rows), dtype=np.float64), (rows, cols)),
+            shape=(n, n),
+        )
+        # Duplicate edges collapse into one link
+        self.adjacency.sum_duplicates()
+        self.adjacency.data[:] = 1
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def edge_count(self):
+        return self.adjacency.nnz
+
+    def out_degree(self):
+        return np.diff(self.adjacency.indptr)
+
+    def in_degree(self):
+        return np.bincount(self.adjacency.indices, minlength=len(self))
+
+    def index_of(self, node_ids):
+        """Row numbers of the given database ids that are in the graph"""
+        node_ids = np.asarray(node_ids, dtype=np.int64)
+        rows = np.searchsorted(self.ids, node_ids)
+        found = rows < len(self)
+        rows, node_ids = rows[found], node_ids[found]
+        return rows[self.ids[rows] == node_ids]
+
+
+def _fetch_columns(db, stmt, dtypes):
+    chunks = [[] for _ in dtypes]
+    result = db.execute(stmt.execution_options(yield_per=LOAD_CHUNK))
+    for partition in result.partitions():
+        for column, values in zip(chunks, zip(*partition)):
+            column.append(np.array(values))
+    return [
+        (
+            np.concatenate(column).astype(dtype)
+            if column
+            else np.empty(0, dtype=dtype)
+        )
+        for column, dtype in zip(chunks, dtypes)
+    ]
+
+
+def load_graph(db, job_id):
+    """Load the internal link graph of ``job_id``"""
+    ids, status, in_sitemap = _fetch_columns(
+        db,
+        select(UrlNode.id, UrlNode.status_code, UrlNode.in_sitemap)
+        .where(UrlNode.job_id == job_id, UrlNode.is_external.is_(False))
+        .order_by(UrlNode.id),
+        # A missing status (not fetched yet) reads as 0
+        (np.int64, np.float64, bool),
+    )
+    sources, targets = _fetch_columns(
+        db,
+        select(UrlEdge.source_id, UrlEdge.target_id).where(
+            UrlEdge.job_id == job_id
+        ),
+        (np.int64, np.int64),
+    )
+    status = np.nan_to_num(status).astype(np.int16)
+    return LinkGraph(ids, status, in_sitemap, sources, targets)
+
+
+def pagerank(adjacency, alpha=PAGERANK_ALPHA, tol=PAGERANK_TOL):
+    """PageRank by power iteration; dangling pages link everywhere"""
+    n = adjacency.shape[0]
+    if n == 0:
+        return np.empty(0)
+    out_degree = np.diff(adjacency.indptr)
+    dangling = out_degree == 0
+    # Transposed, column-stochastic transition matrix
+    inverse = np.divide(1.0, out_degree, out=np.zeros(n), where=~dangling)
+    transition = (adjacency.multiply(inverse[:, None])).T.tocsr()
+    rank = np.full(n, 1.0 / n)
+    for _ in range(PAGERANK_MAX_ITER):
+        previous = rank
+        rank = alpha * (transition @ rank + rank[dangling].sum() / n)
+        rank += (1 - alpha) / n
+        if np.abs(rank - previous).sum() < tol * n:
+            break
+    return rank / rank.sum()
+
+
+def bfs_depth(adjacency, starts):
+    """Click depth of every node from ``starts``; -1 if unreachable.
+
+    A level-synchronous BFS: each level gathers the out-links of the whole
+    frontier with one CSR row slice.
+    """
+    depth = np.full(adjacency.shape[0], -1, dtype=np.int32)
+    frontier = np.unique(np.asarray(starts, dtype=np.int64))
+    level = 0
+    while frontier.size:
+        depth[frontier] = level
+        reached = np.unique(adjacency[frontier].indices)
+        frontier = reached[depth[reached] < 0]
+        level += 1
+    return depth
+
+
+def strong_components(adjacency):
+    """Label every node with its strongly connected component"""
+    count, labels = csgraph.connected_components(
+        adjacency, directed=True, connection="strong"
+    )
+    return count, labels.astype(np.int32)
+
+
+def start_rows(graph, db, job):
+    """Rows BFS starts from: the start URL, else its site root, else seeds"""
+    normalize = get_normalizer(
+        query=(job.options or {}).get("url_query", "drop")
+    )
+    parsed = urlparse(job.start_url)
+    for url in (job.start_url, f"{parsed.scheme}://{parsed.netloc}"):
+        url = normalize(url)
+        node_id = db.scalar(
+            select(UrlNode.id).where(
+                UrlNode.job_id == job.id,
+                UrlNode.url_hash == url_hash(url),
+                UrlNode.url == url,
+            )
+        )
+        if node_id is not None:
+            rows = graph.index_of([node_id])
+            if rows.size:
+                return rows
+    seeds = db.scalars(
+        select(UrlNode.id).where(
+            UrlNode.job_id == job.id,
+            UrlNode.is_external.is_(False),
+            UrlNode.depth == 0,
+        )
+    ).all()
+    return graph.index_of(sorted(seeds))
+
+
+class GraphMetrics:
+    """Per-node SEO metrics of a job plus their summary"""
+
+    ARRAYS = {
+        "ids": np.int64,
+        "pagerank": np.float32,
+        "depth": np.int32,
+        "component": np.int32,
+        "flags": np.uint8,
+    }
+
+    def __init__(self, summary, **arrays):
+        self.summary = summary
+        for name in self.ARRAYS:
+            setattr(self, name, arrays[name])
+
+    @classmethod
+    def compute(cls, graph, starts):
+        started = time.perf_counter()
+        rank = pagerank(graph.adjacency)
+        depth = bfs_depth(graph.adjacency, starts)
+        count, component = strong_components(graph.adjacency)
+
+        in_degree = graph.in_degree()
+        fetched = (graph.status >= 200) & (graph.status < 300)
+        flags = np.zeros(len(graph), dtype=np.uint8)
+        # Sitemap URLs no crawled page links to; the start page needs none
+        orphan = graph.in_sitemap & (in_degree == 0)
+        orphan[starts] = False
+        flags[orphan] |= ORPHAN
+        # Pages without a single internal link to follow
+        flags[fetched & (graph.out_degree() == 0)] |= DEAD_END
+        flags[depth < 0] |= UNREACHABLE
+
+        reachable = depth[depth >= 0]
+        sizes = np.bincount(component) if len(graph) else np.zeros(0)
+        summary = {
+            "nodes": len(graph),
+            "edges": graph.edge_count,
+            "start_nodes": int(len(starts)),
+            "components": int(count),
+            "largest_component": int(sizes.max()) if sizes.size else 0,
+            "orphans": int(orphan.sum()),
+            "dead_ends": int((flags & DEAD_END).astype(bool).sum()),
+            "unreachable": int((depth < 0).sum()),
+            "max_depth": int(reachable.max()) if reachable.size else None,
+            "depths": {
+                str(d): int(n)
+                for d, n in enumerate(np.bincount(reachable))
+                if n
+            },
+            "seconds": round(time.perf_counter() - started, 3),
+        }
+        return cls(
+            summary,
+            ids=graph.ids,
+            pagerank=rank.astype(np.float32),
+            depth=depth,
+            component=component,
+            flags=flags,
+        )
+
+    def to_cache(self):
+        fields = {"summary": json.dumps(self.summary)}
+        for name, dtype in self.ARRAYS.items():
+            data = getattr(self, name).astype(dtype).tobytes()
+            fields[name] = base64.b64encode(data).decode("ascii")
+        return fields
+
+    @classmethod
+    def from_cache(cls, fields):
+        arrays = {
+            name: np.frombuffer(base64.b64decode(fields[name]), dtype=dtype)
+            for name, dtype in cls.ARRAYS.items()
+        }
+        return cls(json.loads(fields["summary"]), **arrays)
+
+
+def _cache_key(job):
+    # Any progress of the crawl invalidates the cached metrics
+    version = f"{job.processed_urls or 0}:{job.discovered_urls or 0}"
+    return f"graph:{job.id}:metrics:{version}"
+
+
+def get_metrics(db, job_id, client=None):
+    """Return the :class:`GraphMetrics` of a job, computing them if needed.
+
+    Results are cached in Redis per job and crawl progress, so finished
+    jobs are analysed once and running ones at most once per change.
+    Returns ``None`` for unknown jobs.
+    """
+    job = db.query(CrawlJob).filter_by(id=job_id).first()
+    if job is None:
+        return None
+    r = client or get_redis()
+    key = _cache_key(job)
+    try:
+        fields = r.hgetall(key)
+        if fields:
+            return GraphMetrics.from_cache(fields)
+    except redis.RedisError as e:
+        logger.warning(f"Metrics cache unavailable: {e}")
+
+    graph = load_graph(db, job_id)
+    metrics = GraphMetrics.compute(graph, start_rows(graph, db, job))
+    logger.info(f"Computed metrics of job {job_id}: {metrics.summary}")
+    try:
+        pipe = r.pipeline()
+        pipe.hset(key, mapping=metrics.to_cache())
+        pipe.expire(key, METRICS_TTL)
+        pipe.execute()
+    except redis.RedisError as e:
+        logger.warning(f"Metrics cache unavailable: {e}")
+    return metrics
@@ -1,12 +1,16 @@
-from flask import Flask, render_template, request, redirect, abort
+from flask import Flask, Response, render_template, request, redirect, abort
 from posthog import Posthog
 from src.database import run_migrations, SessionLocal
-from src.models import CrawlJob, UrlNode
+from src.instrumentation import render_metrics
+from src.models import CrawlJob, CrawlJobStats
 from src.routes.jobs import jobs_bp
 from src.routes.graph import graph_bp
 from src.routes.sitemap.sitemap_parser import sitemap_parser_bp
 from src.security import configure_security
-from src.tasks.crawler import crawl_website
+from src.tasks.crawler import submit_job
+from src.tasks.options import CrawlOptions
+from src.tasks.progress import snapshot
+from src.tasks.recrawl import find_previous_job
 import logging
 import uuid
 
@@ -39,6 +43,11 @@ def create_app():
     def jobs_list():
         return render_template("jobs.html")
 
+    @app.route("/metrics", methods=["GET"])
+    def metrics():
+        body, content_type = render_metrics()
+        return Response(body, content_type=content_type)
+
     @app.route("/graph/<job_id>", methods=["GET"])
     def graph_page(job_id):
         return render_template("graph.html", job_id=job_id)
@@ -47,22 +56,31 @@ def create_app():
     def start_crawl():
         if request.method == "POST":
             url = request.form["url"]
+            try:
+                options = CrawlOptions.from_dict(request.form)
+            except ValueError as e:
+                abort(400, description=str(e))
             db = SessionLocal()
 
             try:
+                previous = (
+                    find_previous_job(db, url) if options.recrawl else None
+                )
+
                 # 1. Create job record FIRST
                 job = CrawlJob(
                     id=str(uuid.uuid4()),  # Generate UUID before task
                     start_url=url,
                     status="pending",
+                    options=options.to_dict(),
+                    previous_job_id=previous.id if previous else None,
                 )
                 db.add(job)
                 db.commit()  # Ensure job exists in DB
 
-                # 2. Start async task AFTER commit
-                crawl_website.apply_async(
-                    args=[url], task_id=job.id
-                )  # Use same ID
+                # 2. Queue it AFTER commit; the scheduler starts its task,
+                # under the job's id, once there is room
+                submit_job(job.id, url, options)
 
                 # 3. Redirect with confirmed job ID
                 return redirect("/urls-results/" + str(job.id))
@@ -77,50 +95,37 @@ def create_app():
     @app.route("/urls-results/<job_id>")
     def url_results(job_id):
         db = SessionLocal()
-
-        # Get job metadata
-        job = db.query(CrawlJob).filter_by(id=job_id).first()
-
-        # Query graph data on-demand
-        internal_urls = (
-            db.query(UrlNode.url)
-            .filter_by(job_id=job_id, is_external=False)
-            .limit(200)
-            .all()
-        )
-
-        external_urls = (
-            db.query(UrlNode.url)
-            .filter_by(job_id=job_id, is_external=True)
-            .limit(200)
-            .all()
-        )
-
-        progress = (
-            round((job.processed_urls / job.total_urls * 100), 2)
-            if job.total_urls > 0
-            else 0
-        )
-
-        return render_template(
-            "crawler_results.html",
-            job_id=job_id,
-            status=job.status,
-            progress=progress,
-            start_url=job.start_url,
-            processed_urls=job.processed_urls,
-            total_urls=job.total_urls,
-            internal_urls=[
-                u[0] for u in internal_urls
-            ],  # Extract URLs from query results
-            external_urls=[u[0] for u in external_urls],
-            internal_count=db.query(UrlNode)
-            .filter_by(job_id=job_id, is_external=False)
-            .count(),
-            external_count=db.query(UrlNode)
-            .filter_by(job_id=job_id, is_external=True)
-            .count(),
-        )
+        try:
+            # Job metadata, counters and stats: two primary key lookups
+            job = db.query(CrawlJob).filter_by(id=job_id).first()
+            if job is None:
+                abort(404, description="Job not found")
+            stats = db.query(CrawlJobStats).filter_by(job_id=job_id).first()
+            progress = snapshot(job)
+
+            return render_template(
+                "crawler_results.html",
+                job_id=job_id,
+                status=job.status,
+                progress=progress["progress"],
+                start_url=job.start_url,
+                processed_urls=progress["processed"],
+                total_urls=progress["internal"],
+                error_urls=progress["errors"],
+                internal_urls=stats.internal_sample if stats else [],
+                external_urls=stats.external_sample if stats else [],
+                internal_count=progress["internal"],
+                external_count=progress["external"],
+                status_classes=sorted(
+                    (stats.status_classes if stats else {}).items()
+                ),
+                depths=sorted(
+                    (stats.depths if stats else {}).items(),
+                    key=lambda item: int(item[0]),
+                ),
+            )
+        finally:
+            db.close()
 
     # Security setup
     configure_security(app)
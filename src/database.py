@@ -1,6 +1,7 @@
 import os
 import psycopg2
 from psycopg2 import sql
+from src.instrumentation import instrument_engine
 
 
 def run_migrations():
@@ -28,14 +29,14 @@ def run_migrations():
             try:
                 with open(f"db/migrations/{filename}") as f:
                     migration_sql = f.read()
-                
+
                 # Execute migration in a transaction
                 cur.execute(migration_sql)
-                
+
                 # Use parameterized query to insert migration record
                 cur.execute(
-                    "INSERT INTO _migrations (version) VALUES (%s)", 
-                    (filename,)
+                    "INSERT INTO _migrations (version) VALUES (%s)",
+                    (filename,),
                 )
                 print(f"Applied migration: {filename}")
             except Exception as e:
@@ -48,7 +49,7 @@ def run_migrations():
 
 
 #
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, text
 from sqlalchemy.orm import sessionmaker
 
 # from sqlalchemy.ext.declarative import declarative_base
@@ -57,6 +58,7 @@ from sqlalchemy.orm import sessionmaker
 SQLALCHEMY_DATABASE_URL = os.getenv("DATABASE_URL")
 #
 engine = create_engine(SQLALCHEMY_DATABASE_URL)
+instrument_engine(engine)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 #
 # Base = declarative_base()
@@ -64,3 +66,49 @@ SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 #
 # def init_db():
 #     Base.metadata.create_all(bind=engine)
+
+
+# Parent tables of a job's partitions, in the order they are dropped
+PARTITIONED_TABLES = ("url_edges", "url_nodes")
+
+
+def create_job_partitions(db, job_id):
+    """Create a job's url_nodes and url_edges partitions if it has none.
+
+    Runs in a transaction of its own, before the job writes any node; see
+    db/migrations/014_job_partitions_off_insert_path.sql.
+    """
+    db.execute(text("SELECT create_job_partitions(:job)"), {"job": job_id})
+    db.commit()
+
+
+def drop_job_partitions(db, job_id):
+    """Drop a job's whole link graph; the crawl_jobs row is left alone.
+
+    Partitions are detached concurrently, so that running crawls and
+    exports of other jobs are neither blocked nor blocking, then dropped.
+    A detach interrupted earlier is finalized.
+    """
+    bind = db.get_bind()
+    quote = bind.dialect.identifier_preparer.quote
+    lookup = text(
+        "SELECT i.inhdetachpending "
+        "FROM (SELECT to_regclass(:name) AS oid) AS c "
+        "LEFT JOIN pg_inherits AS i ON i.inhrelid = c.oid "
+        "WHERE c.oid IS NOT NULL"
+    )
+    with bind.connect().execution_options(
+        isolation_level="AUTOCOMMIT"
+    ) as conn:
+        for parent in PARTITIONED_TABLES:
+            partition = quote(f"{parent}_{job_id}")
+            found = conn.execute(lookup, {"name": partition}).first()
+            if found is None:
+                continue
+            pending = found[0]
+            if pending is not None:
+                # Attached, or left detaching by an interrupted call
+                mode = "FINALIZE" if pending else "CONCURRENTLY"
+                detach = f"ALTER TABLE {parent} DETACH PARTITION {partition}"
+                conn.execute(text(f"{detach} {mode}"))
+            conn.execute(text(f"DROP TABLE {partition}"))
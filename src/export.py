@@ -0,0 +1,434 @@
+"""Streaming export of a job's link graph.
+
+Usage::
+
+    python -m src.export JOB_ID [--format csv] [--table edges] \\
+        [--compression gzip] [--output FILE]
+
+Every format is streamed out of PostgreSQL by ``COPY ... TO STDOUT``:
+PostgreSQL itself renders CSV, NDJSON lines and GraphML elements, and
+Parquet row groups are built from the CSV stream by pyarrow.  Memory stays
+constant whatever the size of the job.
+"""
+
+from sqlalchemy import Text, case, cast, func, literal, literal_column, select
+from sqlalchemy.dialects import postgresql
+from src.database import SessionLocal, engine
+from src.models import CrawlJob, UrlEdge, UrlNode
+import argparse
+import io
+import logging
+import queue
+import sys
+import threading
+import zlib
+
+try:
+    import pyarrow
+    import pyarrow.csv
+    import pyarrow.parquet
+except ImportError:  # optional: only needed for Parquet exports
+    pyarrow = None
+
+try:
+    import zstandard
+except ImportError:  # optional: gzip is always available
+    zstandard = None
+
+
+logger = logging.getLogger("Export")
+
+# COPY output is handed over in chunks of COPY_CHUNK bytes (it arrives one
+# row at a time), at most COPY_QUEUE of them waiting for the client
+COPY_CHUNK = 256 * 1024
+COPY_QUEUE = 16
+# CSV read per Parquet row group
+PARQUET_BLOCK = 16 * 1024 * 1024
+# Exports are large: favour speed over ratio
+GZIP_LEVEL = 1
+ZSTD_LEVEL = 3
+
+# Exported columns of each table; GraphML holds both tables
+TABLES = {
+    "nodes": (
+        UrlNode.id,
+        UrlNode.url,
+        UrlNode.is_external,
+        UrlNode.status_code,
+        UrlNode.depth,
+        UrlNode.in_sitemap,
+        UrlNode.content_type,
+        UrlNode.content_bytes,
+        UrlNode.fetch_ms,
+    ),
+    "edges": (UrlEdge.source_id, UrlEdge.target_id, UrlEdge.link_type),
+}
+
+# Format: (mimetype, file extension)
+FORMATS = {
+    "csv": ("text/csv", "csv"),
+    "ndjson": ("application/x-ndjson", "ndjson"),
+    "graphml": ("application/graphml+xml", "graphml"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+}
+
+# Compression: (mimetype, file extension); Parquet compresses its pages
+# with the same codec instead
+COMPRESSIONS = {
+    "gzip": ("application/gzip", "gz"),
+    "zstd": ("application/zstd", "zst"),
+}
+
+CSV = "FORMAT csv, HEADER"
+# Lines rendered by the query itself: quote and delimiter characters that
+# never occur in them (JSON and XML escape control characters) keep CSV
+# from quoting anything, so each value comes out verbatim
+VERBATIM = "FORMAT csv, QUOTE E'\\x01', DELIMITER E'\\x02'"
+
+GRAPHML_HEADER = (
+    '<?xml version="1.0" encoding="UTF-8"?>\n'
+    '<graphml xmlns="http://graphml.graphdrawing.org/xmlns">\n'
+    '<key id="url" for="node" attr.name="url" attr.type="string"/>\n'
+    '<key id="is_external" for="node" attr.name="is_external" '
+    'attr.type="boolean"/>\n'
+    '<key id="status_code" for="node" attr.name="status_code" '
+    'attr.type="int"/>\n'
+    '<key id="depth" for="node" attr.name="depth" attr.type="int"/>\n'
+    '<key id="link_type" for="edge" attr.name="link_type" '
+    'attr.type="string"/>\n'
+    '<graph edgedefault="directed">\n'
+)
+GRAPHML_FOOTER = "</graph>\n</graphml>\n"
+
+
+class ExportError(ValueError):
+    """An export that cannot be produced as asked"""
+
+
+def _table_query(job_id, table):
+    columns = TABLES[table]
+    return select(*columns).where(columns[0].table.c.job_id == job_id)
+
+
+class _CopyPipe:
+    """File-like target of ``COPY TO STDOUT`` feeding a bounded queue"""
+
+    def __init__(self):
+        self.chunks = queue.Queue(COPY_QUEUE)
+        self.buffer = bytearray()
+        self.closed = False
+
+    def write(self, data):
+        self.buffer += data
+        if len(self.buffer) >= COPY_CHUNK:
+            self.flush()
+
+    def flush(self):
+        if self.closed:
+            raise OSError("Export reader went away")
+        if self.buffer:
+            self.chunks.put(bytes(self.buffer))
+            self.buffer.clear()
+
+    def send(self, item):
+        """Hand the reader an end marker, unless it went away"""
+        # The reader drains the queue once, after setting closed: a put
+        # started before then gets its room, a later one would block
+        if not self.closed:
+            self.chunks.put(item)
+
+    def close(self):
+        """Stop the writer, unblocking it if it waits for room"""
+        self.closed = True
+        while True:
+            try:
+                self.chunks.get_nowait()
+            except queue.Empty:
+                break
+
+
+def _copy(query, options):
+    """Yield the output of ``COPY (query) TO STDOUT WITH (options)``.
+
+    COPY runs on its own connection in a thread, which the bounded queue
+    holds back while the client is slower than the database.
+    """
+    compiled = query.compile(dialect=postgresql.dialect())
+    pipe = _CopyPipe()
+    conn = engine.raw_connection()
+
+    def copy():
+        try:
+            with conn.cursor() as cur:
+                sql = cur.mogrify(str(compiled), compiled.params).decode()
+                cur.copy_expert(
+                    f"COPY ({sql}) TO STDOUT WITH ({options})", pipe
+                )
+            pipe.flush()
+            pipe.send(None)
+        except Exception as e:
+            # An interrupted COPY leaves the connection unusable
+            conn.invalidate()
+            pipe.send(e)
+        finally:
+            conn.close()
+
+    thread = threading.Thread(target=copy, daemon=True)
+    thread.start()
+    try:
+        while True:
+            chunk = pipe.chunks.get()
+            if chunk is None:
+                break
+            if isinstance(chunk, Exception):
+                raise chunk
+            yield chunk
+    finally:
+        pipe.close()
+
+
+def _ndjson(job_id, table):
+    rows = _table_query(job_id, table).subquery("t")
+    return _copy(
+        select(func.row_to_json(literal_column("t"))).select_from(rows),
+        VERBATIM,
+    )
+
+
+def _xml_text(value):
+    """Escape a text expression for XML element content"""
+    for char, entity in (("&", "&amp;"), ("<", "&lt;"), (">", "&gt;")):
+        value = func.replace(value, char, entity)
+    return value
+
+
+def _graphml_data(key, value):
+    # NULL, and so left out by concat(), when ``value`` is NULL
+    return (
+        literal(f'<data key="{key}">') + cast(value, Text) + literal("</data>")
+    )
+
+
+def _graphml(job_id):
+    nodes = select(
+        func.concat(
+            '<node id="n',
+            UrlNode.id,
+            '">',
+            _graphml_data("url", _xml_text(UrlNode.url)),
+            _graphml_data(
+                "is_external",
+                case((UrlNode.is_external, "true"), else_="false"),
+            ),
+            _graphml_data("status_code", UrlNode.status_code),
+            _graphml_data("depth", UrlNode.depth),
+            "</node>",
+        )
+    ).where(UrlNode.job_id == job_id)
+    edges = select(
+        func.concat(
+            '<edge source="n',
+            UrlEdge.source_id,
+            '" target="n',
+            UrlEdge.target_id,
+            '">',
+            _graphml_data("link_type", _xml_text(UrlEdge.link_type)),
+            "</edge>",
+        )
+    ).where(UrlEdge.job_id == job_id)
+    yield GRAPHML_HEADER.encode("utf-8")
+    yield from _copy(nodes, VERBATIM)
+    yield from _copy(edges, VERBATIM)
+    yield GRAPHML_FOOTER.encode("utf-8")
+
+
+class _ChunkReader(io.RawIOBase):
+    """Readable file over an iterator of byte chunks"""
+
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.pending = b""
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while not self.pending:
+            self.pending = next(self.chunks, None)
+            if self.pending is None:
+                self.pending = b""
+                return 0
+        size = min(len(buffer), len(self.pending))
+        buffer[:size] = self.pending[:size]
+        self.pending = self.pending[size:]
+        return size
+
+
+class _ParquetSink:
+    """Write-only file whose contents are collected and handed out"""
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+        self.closed = False
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def take(self):
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def _parquet_schema(table):
+    types = {
+        "id": pyarrow.int64(),
+        "url": pyarrow.string(),
+        "is_external": pyarrow.bool_(),
+        "status_code": pyarrow.int16(),
+        "depth": pyarrow.int32(),
+        "in_sitemap": pyarrow.bool_(),
+        "content_type": pyarrow.string(),
+        "content_bytes": pyarrow.int64(),
+        "fetch_ms": pyarrow.int32(),
+        "source_id": pyarrow.int64(),
+        "target_id": pyarrow.int64(),
+        "link_type": pyarrow.string(),
+    }
+    return pyarrow.schema(
+        [(column.name, types[column.name]) for column in TABLES[table]]
+    )
+
+
+def _parquet(job_id, table, compression):
+    """Yield a Parquet file built from the table's CSV stream"""
+    schema = _parquet_schema(table)
+    reader = pyarrow.csv.open_csv(
+        _ChunkReader(_copy(_table_query(job_id, table), CSV)),
+        read_options=pyarrow.csv.ReadOptions(block_size=PARQUET_BLOCK),
+        convert_options=pyarrow.csv.ConvertOptions(
+            column_types=schema,
+            true_values=["t"],
+            false_values=["f"],
+            # COPY quotes empty strings and leaves NULLs bare
+            strings_can_be_null=True,
+            quoted_strings_can_be_null=False,
+        ),
+    )
+    sink = _ParquetSink()
+    writer = pyarrow.parquet.ParquetWriter(
+        sink, schema, compression=compression or "snappy"
+    )
+    try:
+        for batch in reader:
+            writer.write_batch(batch)
+            yield sink.take()
+    finally:
+        writer.close()
+        reader.close()
+    yield sink.take()
+
+
+def _compress(chunks, compression):
+    if compression == "zstd":
+        compressor = zstandard.ZstdCompressor(level=ZSTD_LEVEL).compressobj()
+    else:
+        compressor = zlib.compressobj(
+            GZIP_LEVEL, zlib.DEFLATED, zlib.MAX_WBITS | 16
+        )
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def check_export(fmt, table, compression=None):
+    """Raise :class:`ExportError` unless the export can be produced here"""
+    if fmt not in FORMATS:
+        raise ExportError(f"Unknown export format: {fmt}")
+    if table not in TABLES:
+        raise ExportError(f"Unknown table: {table}")
+    if compression and compression not in COMPRESSIONS:
+        raise ExportError(f"Unknown compression: {compression}")
+    if fmt == "parquet" and pyarrow is None:
+        raise ExportError("Parquet export needs pyarrow installed")
+    if compression == "zstd" and zstandard is None and fmt != "parquet":
+        raise ExportError("zstd compression needs zstandard installed")
+
+
+def export_name(job_id, fmt, table, compression=None):
+    """Return the ``(file name, mimetype)`` of an export"""
+    mimetype, extension = FORMATS[fmt]
+    name = job_id if fmt == "graphml" else f"{job_id}-{table}"
+    name = f"{name}.{extension}"
+    if compression and fmt != "parquet":
+        mimetype, extension = COMPRESSIONS[compression]
+        name = f"{name}.{extension}"
+    return name, mimetype
+
+
+def export_job(job_id, fmt, table="edges", compression=None):
+    """Yield the bytes of a job's export.
+
+    ``table`` (``nodes`` or ``edges``) is ignored by GraphML, which holds
+    both.
+    """
+    check_export(fmt, table, compression)
+    if fmt == "parquet":
+        return _parquet(job_id, table, compression)
+    if fmt == "csv":
+        chunks = _copy(_table_query(job_id, table), CSV)
+    elif fmt == "ndjson":
+        chunks = _ndjson(job_id, table)
+    else:
+        chunks = _graphml(job_id)
+    return _compress(chunks, compression) if compression else chunks
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("job_id")
+    parser.add_argument("--format", default="csv", choices=FORMATS)
+    parser.add_argument("--table", default="edges", choices=TABLES)
+    parser.add_argument("--compression", choices=COMPRESSIONS)
+    parser.add_argument("--output", help="file to write (default: stdout)")
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        found = db.get(CrawlJob, args.job_id) is not None
+    finally:
+        db.close()
+    if not found:
+        parser.error(f"Job {args.job_id} not found")
+    try:
+        chunks = export_job(
+            args.job_id, args.format, args.table, args.compression
+        )
+    except ExportError as e:
+        parser.error(str(e))
+
+    output = open(args.output, "wb") if args.output else sys.stdout.buffer
+    try:
+        for chunk in chunks:
+            output.write(chunk)
+    finally:
+        if args.output:
+            output.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+from contextlib import contextmanager
+from functools import cache
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Histogram,
+    generate_latest,
+    multiprocess,
+    start_http_server,
+)
+from sqlalchemy import event
+import logging
+import os
+import time
+
+
+logger = logging.getLogger("Instrumentation")
+
+# Crawl stages timed by CrawlRecorder: "parse" is the extractor's pass over
+# the HTML, "extract" the normalization and classification of what it found
+# and "fingerprint" the duplicate check of jobs crawled with ``dedupe``
+STAGES = (
+    "robots",
+    "delay",
+    "fetch",
+    "fingerprint",
+    "parse",
+    "extract",
+    "db_write",
+    "commit",
+)
+
+# Few buckets keep every observation cheap: stages span 0.1ms to seconds
+STAGE_BUCKETS = (0.0005, 0.005, 0.025, 0.1, 0.5, 1, 2.5, 5, 10, 30)
+
+STAGE_SECONDS = Histogram(
+    "crawler_stage_seconds",
+    "Time spent per crawl stage",
+    ["stage"],
+    buckets=STAGE_BUCKETS,
+)
+PAGES = Counter(
+    "crawler_pages_total",
+    "Pages handled, by outcome",
+    ["outcome"],
+)
+LINKS = Counter(
+    "crawler_links_total",
+    "Links found on parsed pages",
+    ["kind"],
+)
+BYTES = Counter("crawler_bytes_total", "HTML body bytes downloaded")
+ERRORS = Counter(
+    "crawler_errors_total",
+    "Failed fetches and HTTP error responses",
+    ["kind"],
+)
+DB_QUERIES = Counter(
+    "crawler_db_queries_total",
+    "Database round trips, by statement",
+    ["statement"],
+)
+
+# Round trips of this process, for per-job profiles
+_db_queries = 0
+
+
+@cache
+def _child(metric, label):
+    # Looking a labelled child up costs as much as updating it
+    return metric.labels(label)
+
+
+def _count_query(conn, cursor, statement, parameters, context, executemany):
+    global _db_queries
+    _db_queries += 1
+    verb = statement.split(None, 1)[:1] or ["?"]
+    _child(DB_QUERIES, verb[0].upper()).inc()
+
+
+def instrument_engine(engine):
+    """Count the database round trips made through ``engine``"""
+    event.listen(engine, "before_cursor_execute", _count_query)
+
+
+class CrawlRecorder:
+    """Records stage timings and crawl counters into the Prometheus metrics.
+
+    With ``profile`` the same figures are also summed for the job, as
+    integers (times in microseconds), until :meth:`take_profile` hands them
+    over to be stored.
+    """
+
+    def __init__(self, profile=False):
+        self.profile = {} if profile else None
+        self._db_queries = _db_queries
+
+    def _add(self, key, amount=1):
+        if self.profile is not None:
+            self.profile[key] = self.profile.get(key, 0) + amount
+
+    def observe(self, stage, seconds):
+        _child(STAGE_SECONDS, stage).observe(seconds)
+        self._add(f"{stage}_count")
+        self._add(f"{stage}_us", round(seconds * 1e6))
+
+    @contextmanager
+    def stage(self, stage):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - started)
+
+    def page(self, outcome):
+        _child(PAGES, outcome).inc()
+        self._add(f"pages_{outcome}")
+
+    def links(self, internal, external):
+        _child(LINKS, "internal").inc(internal)
+        _child(LINKS, "external").inc(external)
+        self._add("links_internal", internal)
+        self._add("links_external", external)
+
+    def body(self, size):
+        BYTES.inc(size)
+        self._add("bytes", size)
+
+    def error(self, kind):
+        _child(ERRORS, kind).inc()
+        self._add(f"errors_{kind}")
+
+    def take_profile(self):
+        """Return the profile recorded since the last call, then reset it"""
+        if self.profile is None:
+            return None
+        queries = _db_queries
+        self._add("db_queries", queries - self._db_queries)
+        self._db_queries = queries
+        profile = {key: value for key, value in self.profile.items() if value}
+        self.profile = {}
+        return profile
+
+
+def profile_summary(profile):
+    """Turn a stored per-job profile into per-stage figures and counters"""
+    total = sum(profile.get(f"{stage}_us", 0) for stage in STAGES)
+    stages = {}
+    for stage in STAGES:
+        count = profile.get(f"{stage}_count", 0)
+        micros = profile.get(f"{stage}_us", 0)
+        if not count:
+            continue
+        stages[stage] = {
+            "count": count,
+            "seconds": round(micros / 1e6, 3),
+            "mean_ms": round(micros / count / 1e3, 3),
+            "share": round(micros / total, 4) if total else 0,
+        }
+    counters = {
+        key: value
+        for key, value in profile.items()
+        if not key.endswith(("_count", "_us"))
+    }
+    return {"stages": stages, "counters": counters}
+
+
+def metrics_registry():
+    """Registry to expose: the metrics of every process of a multiprocess
+    server (gunicorn workers, Celery prefork children) when
+    ``PROMETHEUS_MULTIPROC_DIR`` is set, else this process's
+    """
+    if not os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        return REGISTRY
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return registry
+
+
+def render_metrics():
+    """Return the metrics page body and its content type"""
+    return generate_latest(metrics_registry()), CONTENT_TYPE_LATEST
+
+
+def start_metrics_server(port):
+    """Serve ``/metrics`` on ``port`` from a background thread"""
+    start_http_server(port, registry=metrics_registry())
+    logger.info(f"Serving metrics on port {port}")
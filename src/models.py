@@ -1,5 +1,19 @@
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey
+from sqlalchemy import (
+    BigInteger,
+    Column,
+    Computed,
+    Integer,
+    String,
+    Boolean,
+    DateTime,
+    Float,
+    ForeignKey,
+    JSON,
+    PrimaryKeyConstraint,
+    UniqueConstraint,
+)
 from sqlalchemy.sql import func
+import hashlib
 
 # from src.database import Base
 from sqlalchemy.ext.declarative import declarative_base
@@ -14,23 +28,86 @@ class CrawlJob(Base):
     status = Column(String, default="PENDING")
     total_urls = Column(Integer, default=0)
     processed_urls = Column(Integer, default=0)
+    discovered_urls = Column(Integer, default=0)
+    external_urls = Column(Integer, default=0)
+    error_urls = Column(Integer, default=0)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     finished_at = Column(DateTime(timezone=True))
+    options = Column(JSON)
+    task_id = Column(String)
+    checkpoint_at = Column(DateTime(timezone=True))
+    # Set on recrawls: unchanged pages reuse this job's results
+    previous_job_id = Column(String, ForeignKey("crawl_jobs.id"))
+    links_checked_at = Column(DateTime(timezone=True))
+    # When the job first started running; its time budget counts from here
+    started_at = Column(DateTime(timezone=True))
 
 
+class CrawlJobStats(Base):
+    __tablename__ = "crawl_job_stats"
+    job_id = Column(String, ForeignKey("crawl_jobs.id"), primary_key=True)
+    status_classes = Column(JSON, default=dict)
+    depths = Column(JSON, default=dict)
+    internal_sample = Column(JSON, default=list)
+    external_sample = Column(JSON, default=list)
+    # Summed CrawlRecorder profile of jobs crawled with ``profile``
+    profile = Column(JSON, default=dict)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now())
+
+
+def url_hash(url):
+    """64-bit lookup key of a URL; matches the ``url_hash()`` SQL function"""
+    digest = hashlib.md5(url.encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big", signed=True)
+
+
+# url_nodes and url_edges are partitioned by job_id (one partition per job,
+# see db/migrations/007_partition_url_graph.sql), so their primary keys
+# include it.  Look nodes up by ``url_hash`` as well as ``url``: only the
+# hash is indexed.
 class UrlNode(Base):
     __tablename__ = "url_nodes"
-    id = Column(Integer, primary_key=True)
+    __table_args__ = (
+        PrimaryKeyConstraint("job_id", "id", name="url_nodes_pkey"),
+        UniqueConstraint("job_id", "url_hash", name="url_hash_unique_per_job"),
+    )
+    id = Column(BigInteger, autoincrement=True)
     job_id = Column(String, ForeignKey("crawl_jobs.id"))
     url = Column(String, nullable=False)
+    url_hash = Column(BigInteger, Computed("url_hash(url)", persisted=True))
     is_external = Column(Boolean, default=False)
     status_code = Column(Integer)
+    depth = Column(Integer)
+    in_sitemap = Column(Boolean, default=False)
+    # Validators of the page's response, its sitemap <lastmod> and the
+    # sitemap <priority> that orders the frontier
+    etag = Column(String)
+    last_modified = Column(String)
+    lastmod = Column(String)
+    priority = Column(Float)
+    # Cost of the fetch, see FetchResult
+    content_type = Column(String)
+    content_bytes = Column(BigInteger)
+    fetch_ms = Column(Integer)
+    truncated = Column(Boolean)
+    # Body fingerprints, see src/tasks/fingerprints.py, and the url_hash of
+    # the page this one duplicates
+    content_hash = Column(BigInteger)
+    simhash = Column(BigInteger)
+    duplicate_of = Column(BigInteger)
 
 
 class UrlEdge(Base):
     __tablename__ = "url_edges"
-    id = Column(Integer, primary_key=True)
+    __table_args__ = (
+        PrimaryKeyConstraint("job_id", "id", name="url_edges_pkey"),
+        UniqueConstraint(
+            "job_id", "source_id", "target_id", name="edge_unique"
+        ),
+    )
+    id = Column(BigInteger, autoincrement=True)
     job_id = Column(String, ForeignKey("crawl_jobs.id"))
-    source_id = Column(Integer, ForeignKey("url_nodes.id"))
-    target_id = Column(Integer, ForeignKey("url_nodes.id"))
+    # Node ids of the same job; no foreign keys across partitions
+    source_id = Column(BigInteger)
+    target_id = Column(BigInteger)
     link_type = Column(String)
@@ -0,0 +1,15 @@
+import os
+import redis
+
+
+REDIS_URL = os.getenv("REDIS_URL", "redis://redis:6379/0")
+
+_client = None
+
+
+def get_redis():
+    """Return the process-wide Redis client, creating it on first use"""
+    global _client
+    if _client is None:
+        _client = redis.Redis.from_url(REDIS_URL, decode_responses=True)
+    return _client
@@ -1,53 +1,433 @@
-from flask import Blueprint, jsonify, Response
+from flask import Blueprint, jsonify, request, Response
+from sqlalchemy import func, or_
+from src.analytics import DEAD_END, ORPHAN, UNREACHABLE, get_metrics
 from src.database import SessionLocal
 from src.models import UrlNode, UrlEdge
 import json
+import numpy as np
+import zlib
+
+try:
+    import zstandard
+except ImportError:  # optional: gzip is always available
+    zstandard = None
 
 graph_bp = Blueprint("graph", __name__)
 
+# Nodes per page of the columnar graph
+GRAPH_PAGE_SIZE = 10000
+GRAPH_MAX_PAGE_SIZE = 50000
+# Bounds of a neighbourhood query
+NEIGHBOURHOOD_MAX_HOPS = 3
+NEIGHBOURHOOD_MAX_NODES = 5000
+# Edge rows fetched and serialized at a time
+EDGE_CHUNK = 10000
+# Rows per page of a metric listing
+METRICS_PAGE_SIZE = 100
+METRICS_MAX_PAGE_SIZE = 1000
+# Pages listed in the metrics summary
+METRICS_TOP_PAGES = 20
+
 
 @graph_bp.route("/graph/<job_id>/data")
 def graph_data(job_id):
+    """Legacy per-object graph JSON; ``/columnar`` is far more compact"""
     db = SessionLocal()
 
     def generate():
-        yield '{"nodes": ['
-
-        # Stream nodes in chunks
-        nodes = db.query(UrlNode).filter_by(job_id=job_id)
-        first_node = True
-        for node in nodes.yield_per(100):  # 100 nodes per chunk
-            if not first_node:
-                yield ","
-            yield json.dumps(
-                {
-                    "id": node.id,
-                    "label": node.url,
-                    "external": node.is_external,
-                    "in_links": 0,  # Will be updated by edges
-                    "out_links": 0,
-                    "group": f"{0 if node.is_external else 1}",
-                }
+        try:
+            yield '{"nodes": ['
+
+            # Stream nodes a page at a time, with the degrees of the page's
+            # id range counted as for /columnar
+            after_id = 0
+            separator = ""
+            while True:
+                nodes = (
+                    db.query(UrlNode)
+                    .filter(UrlNode.job_id == job_id, UrlNode.id > after_id)
+                    .order_by(UrlNode.id)
+                    .limit(GRAPH_PAGE_SIZE)
+                    .all()
+                )
+                if not nodes:
+                    break
+                span = (nodes[0].id, nodes[-1].id)
+                in_degree = _degrees(db, job_id, UrlEdge.target_id, span)
+                out_degree = _degrees(db, job_id, UrlEdge.source_id, span)
+                for node in nodes:
+                    yield separator + json.dumps(
+                        {
+                            "id": node.id,
+                            "label": node.url,
+                            "external": node.is_external,
+                            "in_links": in_degree.get(node.id, 0),
+                            "out_links": out_degree.get(node.id, 0),
+                            "group": f"{0 if node.is_external else 1}",
+                        }
+                    )
+                    separator = ","
+                after_id = nodes[-1].id
+
+            yield '], "edges": ['
+
+            # Stream edges in chunks
+            edges = db.query(UrlEdge).filter_by(job_id=job_id)
+            first_edge = True
+            for edge in edges.yield_per(200):  # 200 edges per chunk
+                if not first_edge:
+                    yield ","
+                yield json.dumps(
+                    {
+                        "from": edge.source_id,
+                        "to": edge.target_id,
+                        "arrows": "to, from",
+                    }
+                )
+                first_edge = False
+
+            yield "]}"
+        finally:
+            db.close()
+
+    return Response(generate(), mimetype="application/json")
+
+
+def _compressor():
+    """Pick a streaming compressor from the request's Accept-Encoding"""
+    accepted = {
+        encoding.split(";")[0].strip()
+        for encoding in request.headers.get("Accept-Encoding", "").split(",")
+    }
+    if zstandard is not None and "zstd" in accepted:
+        return "zstd", zstandard.ZstdCompressor(level=3).compressobj()
+    if "gzip" in accepted:
+        return "gzip", zlib.compressobj(6, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+    return None, None
+
+
+def _compressed_response(chunks, headers=None):
+    encoding, compressor = _compressor()
+    headers = {"Vary": "Accept-Encoding", **(headers or {})}
+    if compressor is None:
+        return Response(chunks, mimetype="application/json", headers=headers)
+
+    def generate():
+        for chunk in chunks:
+            data = compressor.compress(chunk.encode("utf-8"))
+            if data:
+                yield data
+        yield compressor.flush()
+
+    headers["Content-Encoding"] = encoding
+    return Response(generate(), mimetype="application/json", headers=headers)
+
+
+def _degrees(db, job_id, column, ids):
+    """Count edges per ``column`` value for a node-id set or id range"""
+    if isinstance(ids, tuple):
+        criterion = column.between(*ids)
+    else:
+        criterion = column.in_(ids)
+    rows = (
+        db.query(column, func.count())
+        .filter(UrlEdge.job_id == job_id, criterion)
+        .group_by(column)
+    )
+    return dict(rows.all())
+
+
+def _columnar(nodes, in_degree, out_degree, edges, extra):
+    """Serialize a graph as parallel node arrays plus CSR edges.
+
+    ``edges`` yields ``(source_id, target_id)`` ordered by source, all of
+    them leaving one of ``nodes`` (themselves ordered by id).  Edge ``k``
+    of node ``i`` targets ``edges.targets[offsets[i] + k]``.
+    """
+    ids = [node.id for node in nodes]
+    yield '{"nodes": {'
+    yield f'"id": {json.dumps(ids)}, '
+    yield f'"url": {json.dumps([node.url for node in nodes])}, '
+    yield '"external": '
+    yield json.dumps([int(node.is_external) for node in nodes])
+    yield f', "status": {json.dumps([node.status_code for node in nodes])}, '
+    yield f'"in_degree": {json.dumps([in_degree.get(i, 0) for i in ids])}, '
+    yield f'"out_degree": {json.dumps([out_degree.get(i, 0) for i in ids])}'
+    yield '}, "edges": {"targets": ['
+
+    offsets = [0]
+    position = {node_id: index for index, node_id in enumerate(ids)}
+    count = 0
+    chunk = []
+    separator = ""
+    for source_id, target_id in edges:
+        # Close the offsets of every node up to this edge's source
+        while len(offsets) <= position[source_id]:
+            offsets.append(count)
+        chunk.append(target_id)
+        count += 1
+        if len(chunk) >= EDGE_CHUNK:
+            yield separator + json.dumps(chunk)[1:-1]
+            chunk = []
+            separator = ","
+    if chunk:
+        yield separator + json.dumps(chunk)[1:-1]
+    while len(offsets) <= len(ids):
+        offsets.append(count)
+
+    yield f'], "offsets": {json.dumps(offsets)}}}'
+    for key, value in extra.items():
+        yield f", {json.dumps(key)}: {json.dumps(value)}"
+    yield "}"
+
+
+@graph_bp.route("/graph/<job_id>/columnar")
+def graph_columnar(job_id):
+    """One page of a job's graph in columnar form, compressed on the fly.
+
+    Nodes come ordered by id, ``?limit=`` at a time; pass the previous
+    page's ``next`` (also in the ``X-Next-Cursor`` header) as ``?after=``
+    for the next page.  Each page carries real in/out degrees and the
+    out-edges of its nodes in CSR form: ``edges.offsets`` (one entry per
+    node plus one) indexes ``edges.targets``, which holds node ids.
+    """
+    try:
+        after = int(request.args.get("after", 0))
+        limit = int(request.args.get("limit", GRAPH_PAGE_SIZE))
+    except ValueError:
+        limit = 0
+    if limit < 1:
+        return jsonify({"error": "Bad limit or cursor"}), 400
+    limit = min(limit, GRAPH_MAX_PAGE_SIZE)
+
+    db = SessionLocal()
+    try:
+        nodes = (
+            db.query(
+                UrlNode.id,
+                UrlNode.url,
+                UrlNode.is_external,
+                UrlNode.status_code,
             )
-            first_node = False
-
-        yield '], "edges": ['
-
-        # Stream edges in chunks
-        edges = db.query(UrlEdge).filter_by(job_id=job_id)
-        first_edge = True
-        for edge in edges.yield_per(200):  # 200 edges per chunk
-            if not first_edge:
-                yield ","
-            yield json.dumps(
-                {
-                    "from": edge.source_id,
-                    "to": edge.target_id,
-                    "arrows": "to, from",
-                }
+            .filter(UrlNode.job_id == job_id, UrlNode.id > after)
+            .order_by(UrlNode.id)
+            .limit(limit)
+            .all()
+        )
+        # The page is every node of the job in [first, last]: id ranges
+        # are cheaper to filter on than long IN lists
+        first, last = (nodes[0].id, nodes[-1].id) if nodes else (0, -1)
+        in_degree = _degrees(db, job_id, UrlEdge.target_id, (first, last))
+        out_degree = _degrees(db, job_id, UrlEdge.source_id, (first, last))
+    except Exception:
+        db.close()
+        raise
+    next_cursor = last if len(nodes) == limit else None
+
+    def generate():
+        try:
+            edges = (
+                db.query(UrlEdge.source_id, UrlEdge.target_id)
+                .filter(
+                    UrlEdge.job_id == job_id,
+                    UrlEdge.source_id.between(first, last),
+                )
+                .order_by(UrlEdge.source_id, UrlEdge.target_id)
+                .yield_per(EDGE_CHUNK)
             )
-            first_edge = False
+            yield from _columnar(
+                nodes, in_degree, out_degree, edges, {"next": next_cursor}
+            )
+        finally:
+            db.close()
 
-        yield "]}"
+    headers = {}
+    if next_cursor is not None:
+        headers["X-Next-Cursor"] = str(next_cursor)
+    return _compressed_response(generate(), headers)
 
-    return Response(generate(), mimetype="application/json")
+
+@graph_bp.route("/graph/<job_id>/neighbourhood")
+def graph_neighbourhood(job_id):
+    """The subgraph within ``?hops=`` links of node ``?node=``.
+
+    Links are followed in both directions, up to
+    ``NEIGHBOURHOOD_MAX_NODES`` nodes; the response has the same columnar
+    form as ``/columnar`` and holds the edges between the returned nodes.
+    """
+    try:
+        node_id = int(request.args["node"])
+        hops = int(request.args.get("hops", 1))
+    except (KeyError, ValueError):
+        return jsonify({"error": "node and hops must be integers"}), 400
+    hops = max(0, min(hops, NEIGHBOURHOOD_MAX_HOPS))
+
+    db = SessionLocal()
+    try:
+        ids = {node_id}
+        frontier = {node_id}
+        truncated = False
+        for _ in range(hops):
+            if not frontier:
+                break
+            linked = db.query(UrlEdge.source_id, UrlEdge.target_id).filter(
+                UrlEdge.job_id == job_id,
+                or_(
+                    UrlEdge.source_id.in_(frontier),
+                    UrlEdge.target_id.in_(frontier),
+                ),
+            )
+            found = set()
+            for source_id, target_id in linked.yield_per(EDGE_CHUNK):
+                found.add(source_id)
+                found.add(target_id)
+            frontier = found - ids
+            room = NEIGHBOURHOOD_MAX_NODES - len(ids)
+            if len(frontier) > room:
+                frontier = set(sorted(frontier)[:room])
+                truncated = True
+            ids |= frontier
+
+        nodes = (
+            db.query(
+                UrlNode.id,
+                UrlNode.url,
+                UrlNode.is_external,
+                UrlNode.status_code,
+            )
+            .filter(UrlNode.job_id == job_id, UrlNode.id.in_(ids))
+            .order_by(UrlNode.id)
+            .all()
+        )
+        if not nodes:
+            db.close()
+            return jsonify({"error": "Node not found"}), 404
+        in_degree = _degrees(db, job_id, UrlEdge.target_id, ids)
+        out_degree = _degrees(db, job_id, UrlEdge.source_id, ids)
+    except Exception:
+        db.close()
+        raise
+
+    def generate():
+        try:
+            edges = (
+                db.query(UrlEdge.source_id, UrlEdge.target_id)
+                .filter(
+                    UrlEdge.job_id == job_id,
+                    UrlEdge.source_id.in_(ids),
+                    UrlEdge.target_id.in_(ids),
+                )
+                .order_by(UrlEdge.source_id, UrlEdge.target_id)
+                .yield_per(EDGE_CHUNK)
+            )
+            yield from _columnar(
+                nodes,
+                in_degree,
+                out_degree,
+                edges,
+                {"center": node_id, "hops": hops, "truncated": truncated},
+            )
+        finally:
+            db.close()
+
+    return _compressed_response(generate())
+
+
+def _node_rows(db, job_id, ids):
+    """Map node ids to their ``(url, status_code, depth)``"""
+    rows = db.query(
+        UrlNode.id, UrlNode.url, UrlNode.status_code, UrlNode.depth
+    ).filter(UrlNode.job_id == job_id, UrlNode.id.in_(ids))
+    return {row.id: row for row in rows}
+
+
+def _metric_pages(db, job_id, metrics, rows):
+    """Describe the nodes at ``rows`` of ``metrics``, in that order"""
+    ids = [int(metrics.ids[row]) for row in rows]
+    nodes = _node_rows(db, job_id, ids)
+    pages = []
+    for row, node_id in zip(rows, ids):
+        node = nodes.get(node_id)
+        depth = int(metrics.depth[row])
+        pages.append(
+            {
+                "id": node_id,
+                "url": node.url if node else None,
+                "status": node.status_code if node else None,
+                "pagerank": float(metrics.pagerank[row]),
+                "click_depth": depth if depth >= 0 else None,
+                "component": int(metrics.component[row]),
+            }
+        )
+    return pages
+
+
+@graph_bp.route("/graph/<job_id>/metrics")
+def graph_metrics(job_id):
+    """Link-graph metrics of a job: SCCs, click depths, orphans and more.
+
+    Metrics cover internal pages only and are computed once per crawl
+    progress; list the nodes behind a figure with ``/metrics/<name>``.
+    """
+    db = SessionLocal()
+    try:
+        metrics = get_metrics(db, job_id)
+        if metrics is None:
+            return jsonify({"error": "Job not found"}), 404
+        top = metrics.pagerank.argsort()[::-1][:METRICS_TOP_PAGES]
+        return jsonify(
+            {
+                **metrics.summary,
+                "top_pages": _metric_pages(db, job_id, metrics, top),
+            }
+        )
+    finally:
+        db.close()
+
+
+# Node listings of /metrics/<name>: flag selecting the nodes, or None to
+# list every internal node
+METRIC_LISTS = {
+    "pagerank": None,
+    "orphans": ORPHAN,
+    "dead_ends": DEAD_END,
+    "unreachable": UNREACHABLE,
+}
+
+
+@graph_bp.route("/graph/<job_id>/metrics/<name>")
+def graph_metric_list(job_id, name):
+    """Page through the nodes behind one metric, highest PageRank first"""
+    if name not in METRIC_LISTS:
+        return jsonify({"error": f"Unknown metric: {name}"}), 404
+    try:
+        offset = int(request.args.get("offset", 0))
+        limit = int(request.args.get("limit", METRICS_PAGE_SIZE))
+    except ValueError:
+        limit = 0
+    if limit < 1 or offset < 0:
+        return jsonify({"error": "Bad limit or offset"}), 400
+    limit = min(limit, METRICS_MAX_PAGE_SIZE)
+
+    db = SessionLocal()
+    try:
+        metrics = get_metrics(db, job_id)
+        if metrics is None:
+            return jsonify({"error": "Job not found"}), 404
+        flag = METRIC_LISTS[name]
+        if flag is None:
+            rows = np.arange(len(metrics.ids))
+        else:
+            rows = np.flatnonzero(metrics.flags & flag)
+        rows = rows[np.argsort(-metrics.pagerank[rows], kind="stable")]
+        page = rows[offset : offset + limit]
+        return jsonify(
+            {
+                "metric": name,
+                "total": int(len(rows)),
+                "offset": offset,
+                "pages": _metric_pages(db, job_id, metrics, page),
+            }
+        )
+    finally:
+        db.close()
@@ -1,41 +1,535 @@
-from flask import Blueprint, jsonify, request
-from src.database import SessionLocal
-from src.models import CrawlJob
-from src.tasks.crawler import app as celery_app
+from datetime import datetime
+from flask import Blueprint, Response, jsonify, request
+from sqlalchemy import func, or_, select, tuple_
+from sqlalchemy.orm import aliased
+from urllib.parse import urlencode
+from src.database import SessionLocal, drop_job_partitions
+from src.export import ExportError, check_export, export_job, export_name
+from src.instrumentation import profile_summary
+from src.models import CrawlJob, CrawlJobStats, UrlEdge, UrlNode
+from src.redis_client import get_redis
+from src.tasks.crawler import (
+    app as celery_app,
+    check_links,
+    release_job,
+    submit_job,
+)
+from src.tasks.options import CrawlOptions
+from src.tasks.progress import (
+    FINISHED_STATUSES,
+    progress_key,
+    publish_progress,
+    snapshot,
+)
+from src.tasks.scheduler import JobScheduler
+import base64
+import json
 
 jobs_bp = Blueprint("jobs", __name__)
 
+RESUMABLE_STATUSES = ("running", "failed", "aborted")
+JOB_STATUSES = ("pending", "running", "completed", "failed", "aborted")
+
+# Jobs per page of /jobs
+JOBS_PAGE_SIZE = 50
+JOBS_MAX_PAGE_SIZE = 200
+
+# Broken links per page of /jobs/<id>/broken-links, and the pages linking
+# to each one that are listed
+BROKEN_LINKS_PAGE_SIZE = 100
+BROKEN_LINKS_MAX_PAGE_SIZE = 1000
+BROKEN_LINK_SOURCES = 5
+
+# Duplicated pages per page of /jobs/<id>/duplicates, and the duplicates
+# listed for each one
+DUPLICATES_PAGE_SIZE = 100
+DUPLICATES_MAX_PAGE_SIZE = 1000
+DUPLICATES_LISTED = 5
+
+# Seconds between keep-alive comments on a quiet progress stream
+EVENTS_HEARTBEAT = 15
+
+
+def encode_cursor(job):
+    raw = f"{job.created_at.isoformat()}|{job.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor):
+    """Return the ``(created_at, id)`` of the last job of a page"""
+    raw = base64.urlsafe_b64decode(cursor.encode()).decode()
+    created_at, job_id = raw.split("|", 1)
+    return datetime.fromisoformat(created_at), job_id
+
 
 @jobs_bp.route("/jobs", methods=["GET"])
 def list_jobs():
+    """List jobs newest first, one keyset-paginated page at a time.
+
+    ``?status=running,failed`` filters by status and ``?limit=`` sets the
+    page size.  When there are more jobs, the ``X-Next-Cursor`` header (and
+    a ``Link: rel="next"`` header) carries the ``?cursor=`` of the next
+    page.
+    """
+    statuses = [s for s in request.args.get("status", "").split(",") if s]
+    if any(status not in JOB_STATUSES for status in statuses):
+        return jsonify({"status": "error", "error": "Unknown status"}), 400
+    try:
+        limit = int(request.args.get("limit", JOBS_PAGE_SIZE))
+        cursor = request.args.get("cursor")
+        after = decode_cursor(cursor) if cursor else None
+    except ValueError:
+        limit = 0
+    if limit < 1:
+        error = {"status": "error", "error": "Bad limit or cursor"}
+        return jsonify(error), 400
+    limit = min(limit, JOBS_MAX_PAGE_SIZE)
+
     db = SessionLocal()
     try:
-        jobs = db.query(CrawlJob).order_by(CrawlJob.created_at.desc()).all()
-        return jsonify(
+        query = db.query(CrawlJob)
+        if statuses:
+            query = query.filter(CrawlJob.status.in_(statuses))
+        if after:
+            query = query.filter(
+                tuple_(CrawlJob.created_at, CrawlJob.id) < tuple_(*after)
+            )
+        jobs = (
+            query.order_by(CrawlJob.created_at.desc(), CrawlJob.id.desc())
+            .limit(limit + 1)
+            .all()
+        )
+        more = len(jobs) > limit
+        jobs = jobs[:limit]
+        response = jsonify(
             [
                 {
                     "id": job.id,
                     "start_url": job.start_url,
                     "status": job.status,
                     "created_at": job.created_at.isoformat(),
+                    "previous_job_id": job.previous_job_id,
+                    "wait_seconds": (
+                        round(
+                            (job.started_at - job.created_at).total_seconds()
+                        )
+                        if job.started_at
+                        else None
+                    ),
                     "progress": f"{(job.processed_urls / job.total_urls * 100) if job.total_urls != 0 else 0:.1f}%",
                 }
                 for job in jobs
             ]
         )
+        if more:
+            next_cursor = encode_cursor(jobs[-1])
+            args = {**request.args.to_dict(), "cursor": next_cursor}
+            response.headers["X-Next-Cursor"] = next_cursor
+            response.headers["Link"] = (
+                f'<{request.base_url}?{urlencode(args)}>; rel="next"'
+            )
+        return response
     finally:
         db.close()
 
 
 @jobs_bp.route("/jobs/<job_id>/stop", methods=["POST"])
 def stop_job(job_id):
-    celery_app.control.revoke(job_id, terminate=True)
     db = SessionLocal()
     try:
         job = db.query(CrawlJob).filter_by(id=job_id).first()
+        # Resumed and chunked crawls run under a new task id
+        celery_app.control.revoke(
+            (job.task_id if job else None) or job_id, terminate=True
+        )
         if job:
             job.status = "aborted"
             db.commit()
+            publish_progress(job.id, snapshot(job))
+        release_job(job_id)
+        return jsonify({"status": "success"})
+    finally:
+        db.close()
+
+
+@jobs_bp.route("/jobs/<job_id>/resume", methods=["POST"])
+def resume_job(job_id):
+    """Continue a running, failed or aborted crawl from its checkpoint"""
+    db = SessionLocal()
+    try:
+        job = db.query(CrawlJob).filter_by(id=job_id).first()
+        if not job:
+            return jsonify({"status": "error", "error": "Job not found"}), 404
+        if job.status not in RESUMABLE_STATUSES:
+            return (
+                jsonify(
+                    {
+                        "status": "error",
+                        "error": f"Cannot resume a {job.status} job",
+                    }
+                ),
+                409,
+            )
+
+        if job.status == "running":
+            # Stop the live task, or it would crawl alongside the resumed
+            # one; batch chains of a distributed job stop once it is pending
+            celery_app.control.revoke(job.task_id or job_id, terminate=True)
+
+        # Pending until the scheduler admits it (again, if it was running);
+        # the task marks it running
+        release_job(job.id)
+        job.status = "pending"
+        job.finished_at = None
+        db.commit()
+
+        submit_job(
+            job.id, job.start_url, CrawlOptions.from_dict(job.options), True
+        )
+        publish_progress(job.id, snapshot(job))
+        return jsonify({"status": "success", "job_status": job.status})
+    finally:
+        db.close()
+
+
+@jobs_bp.route("/jobs/<job_id>", methods=["DELETE"])
+def delete_job(job_id):
+    """Delete a finished job along with its link graph and stats"""
+    db = SessionLocal()
+    try:
+        job = db.query(CrawlJob).filter_by(id=job_id).first()
+        if not job:
+            return jsonify({"status": "error", "error": "Job not found"}), 404
+        if job.status not in FINISHED_STATUSES:
+            return (
+                jsonify(
+                    {
+                        "status": "error",
+                        "error": f"Cannot delete a {job.status} job",
+                    }
+                ),
+                409,
+            )
+        # The graph is dropped on a connection of its own; leave no
+        # transaction of this one open while it waits for other readers
+        db.rollback()
+        drop_job_partitions(db, job_id)
+        db.query(CrawlJob).filter_by(id=job_id).delete()
+        db.commit()
         return jsonify({"status": "success"})
     finally:
         db.close()
+
+
+def _job_progress(job_id):
+    db = SessionLocal()
+    try:
+        job = db.query(CrawlJob).filter_by(id=job_id).first()
+        return None if job is None else snapshot(job)
+    finally:
+        db.close()
+
+
+@jobs_bp.route("/jobs/<job_id>/events", methods=["GET"])
+def job_events(job_id):
+    """Stream a job's progress counters as Server-Sent Events.
+
+    The current counters are sent first, then every update the crawl
+    publishes, until the job finishes.
+    """
+    if _job_progress(job_id) is None:
+        return jsonify({"status": "error", "error": "Job not found"}), 404
+
+    def generate():
+        pubsub = get_redis().pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(progress_key(job_id))
+        try:
+            # Read after subscribing so that no update falls in between
+            data = _job_progress(job_id)
+            yield f"data: {json.dumps(data)}\n\n"
+            while data["status"] not in FINISHED_STATUSES:
+                message = pubsub.get_message(timeout=EVENTS_HEARTBEAT)
+                if message is None:
+                    yield ": keep-alive\n\n"
+                    continue
+                data = json.loads(message["data"])
+                yield f"data: {json.dumps(data)}\n\n"
+        finally:
+            pubsub.close()
+
+    return Response(
+        generate(),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@jobs_bp.route("/jobs/<job_id>/check-links", methods=["POST"])
+def check_job_links(job_id):
+    """Check the status of a finished job's external links"""
+    db = SessionLocal()
+    try:
+        job = db.query(CrawlJob).filter_by(id=job_id).first()
+        if not job:
+            return jsonify({"status": "error", "error": "Job not found"}), 404
+        if job.status not in FINISHED_STATUSES:
+            return (
+                jsonify(
+                    {
+                        "status": "error",
+                        "error": f"Cannot check links of a {job.status} job",
+                    }
+                ),
+                409,
+            )
+        task = check_links.delay(job.id, job.options)
+        return jsonify({"status": "success", "task_id": task.id})
+    finally:
+        db.close()
+
+
+@jobs_bp.route("/scheduler", methods=["GET"])
+def scheduler_state():
+    """Running jobs and the queues of jobs waiting to be admitted.
+
+    Every waiting job comes with its position in its queue and how long
+    it has waited; running jobs with how long they waited to be admitted.
+    """
+    return jsonify({"status": "success", **JobScheduler().snapshot()})
+
+
+@jobs_bp.route("/jobs/<job_id>/profile", methods=["GET"])
+def job_profile(job_id):
+    """Per-stage times and counters of a job crawled with ``profile``"""
+    db = SessionLocal()
+    try:
+        job = db.query(CrawlJob).filter_by(id=job_id).first()
+        if not job:
+            return jsonify({"status": "error", "error": "Job not found"}), 404
+        stats = db.query(CrawlJobStats).filter_by(job_id=job_id).first()
+        return jsonify(
+            {
+                "status": "success",
+                "job_status": job.status,
+                "profile": profile_summary(stats.profile if stats else {}),
+            }
+        )
+    finally:
+        db.close()
+
+
+def _link_sources(db, job_id, target_ids):
+    """Up to BROKEN_LINK_SOURCES pages linking to each of ``target_ids``"""
+    source = aliased(UrlNode)
+    ranked = (
+        select(
+            UrlEdge.target_id,
+            source.url,
+            func.row_number()
+            .over(partition_by=UrlEdge.target_id, order_by=UrlEdge.source_id)
+            .label("rank"),
+            func.count().over(partition_by=UrlEdge.target_id).label("total"),
+        )
+        .join(
+            source,
+            (source.job_id == UrlEdge.job_id)
+            & (source.id == UrlEdge.source_id),
+        )
+        .where(UrlEdge.job_id == job_id, UrlEdge.target_id.in_(target_ids))
+        .subquery()
+    )
+    sources = {}
+    for target_id, url, _, total in db.execute(
+        select(ranked).where(ranked.c.rank <= BROKEN_LINK_SOURCES)
+    ):
+        entry = sources.setdefault(target_id, {"total": total, "urls": []})
+        entry["urls"].append(url)
+    return sources
+
+
+@jobs_bp.route("/jobs/<job_id>/broken-links", methods=["GET"])
+def broken_links(job_id):
+    """External links of a job that answered with an error or not at all.
+
+    Links come ordered by id, ``?limit=`` at a time, each with the number
+    of pages linking to it and the first few of them; pass the previous
+    page's ``next`` as ``?after=`` for the next page.  A status of -1
+    means no response.
+    """
+    try:
+        after = int(request.args.get("after", 0))
+        limit = int(request.args.get("limit", BROKEN_LINKS_PAGE_SIZE))
+    except ValueError:
+        limit = 0
+    if limit < 1:
+        error = {"status": "error", "error": "Bad limit or cursor"}
+        return jsonify(error), 400
+    limit = min(limit, BROKEN_LINKS_MAX_PAGE_SIZE)
+
+    db = SessionLocal()
+    try:
+        job = db.query(CrawlJob).filter_by(id=job_id).first()
+        if not job:
+            return jsonify({"status": "error", "error": "Job not found"}), 404
+        links = (
+            db.query(UrlNode.id, UrlNode.url, UrlNode.status_code)
+            .filter(
+                UrlNode.job_id == job_id,
+                UrlNode.is_external.is_(True),
+                or_(UrlNode.status_code >= 400, UrlNode.status_code < 0),
+                UrlNode.id > after,
+            )
+            .order_by(UrlNode.id)
+            .limit(limit)
+            .all()
+        )
+        sources = (
+            _link_sources(db, job_id, [link.id for link in links])
+            if links
+            else {}
+        )
+        empty = {"total": 0, "urls": []}
+        return jsonify(
+            {
+                "links_checked_at": (
+                    job.links_checked_at.isoformat()
+                    if job.links_checked_at
+                    else None
+                ),
+                "links": [
+                    {
+                        "id": link.id,
+                        "url": link.url,
+                        "status_code": link.status_code,
+                        "linked_from": sources.get(link.id, empty),
+                    }
+                    for link in links
+                ],
+                "next": links[-1].id if len(links) == limit else None,
+            }
+        )
+    finally:
+        db.close()
+
+
+def _duplicate_pages(db, job_id, hashes):
+    """Up to DUPLICATES_LISTED duplicates of each page of ``hashes``"""
+    ranked = (
+        select(
+            UrlNode.duplicate_of,
+            UrlNode.url,
+            func.row_number()
+            .over(partition_by=UrlNode.duplicate_of, order_by=UrlNode.id)
+            .label("rank"),
+            func.count()
+            .over(partition_by=UrlNode.duplicate_of)
+            .label("total"),
+        )
+        .where(UrlNode.job_id == job_id, UrlNode.duplicate_of.in_(hashes))
+        .subquery()
+    )
+    duplicates = {}
+    for original, url, _, total in db.execute(
+        select(ranked).where(ranked.c.rank <= DUPLICATES_LISTED)
+    ):
+        entry = duplicates.setdefault(original, {"total": total, "urls": []})
+        entry["urls"].append(url)
+    return duplicates
+
+
+@jobs_bp.route("/jobs/<job_id>/duplicates", methods=["GET"])
+def duplicate_pages(job_id):
+    """Pages of a job crawled with ``dedupe`` that other pages duplicate.
+
+    Pages come ordered by id, ``?limit=`` at a time, each with its number
+    of duplicates and the first few of them; pass the previous page's
+    ``next`` as ``?after=`` for the next page.  Duplicates were stored
+    without following their links.
+    """
+    try:
+        after = int(request.args.get("after", 0))
+        limit = int(request.args.get("limit", DUPLICATES_PAGE_SIZE))
+    except ValueError:
+        limit = 0
+    if limit < 1:
+        error = {"status": "error", "error": "Bad limit or cursor"}
+        return jsonify(error), 400
+    limit = min(limit, DUPLICATES_MAX_PAGE_SIZE)
+
+    db = SessionLocal()
+    try:
+        job = db.query(CrawlJob).filter_by(id=job_id).first()
+        if not job:
+            return jsonify({"status": "error", "error": "Job not found"}), 404
+        duplicate = aliased(UrlNode)
+        duplicated = (
+            select(duplicate.duplicate_of)
+            .where(
+                duplicate.job_id == job_id,
+                duplicate.duplicate_of.is_not(None),
+            )
+            .scalar_subquery()
+        )
+        pages = (
+            db.query(UrlNode.id, UrlNode.url, UrlNode.url_hash)
+            .filter(
+                UrlNode.job_id == job_id,
+                UrlNode.url_hash.in_(duplicated),
+                UrlNode.id > after,
+            )
+            .order_by(UrlNode.id)
+            .limit(limit)
+            .all()
+        )
+        duplicates = (
+            _duplicate_pages(db, job_id, [page.url_hash for page in pages])
+            if pages
+            else {}
+        )
+        empty = {"total": 0, "urls": []}
+        return jsonify(
+            {
+                "pages": [
+                    {
+                        "id": page.id,
+                        "url": page.url,
+                        "duplicates": duplicates.get(page.url_hash, empty),
+                    }
+                    for page in pages
+                ],
+                "next": pages[-1].id if len(pages) == limit else None,
+            }
+        )
+    finally:
+        db.close()
+
+
+@jobs_bp.route("/jobs/<job_id>/export", methods=["GET"])
+def export_job_graph(job_id):
+    """Stream a job's graph as a file download.
+
+    ``?format=csv|ndjson|graphml|parquet`` (default csv) picks the format,
+    ``?table=nodes|edges`` (default edges) the table of tabular formats and
+    ``?compression=gzip|zstd`` compresses the file.
+    """
+    fmt = request.args.get("format", "csv")
+    table = request.args.get("table", "edges")
+    compression = request.args.get("compression") or None
+    try:
+        check_export(fmt, table, compression)
+    except ExportError as e:
+        return jsonify({"status": "error", "error": str(e)}), 400
+
+    db = SessionLocal()
+    try:
+        if db.get(CrawlJob, job_id) is None:
+            return jsonify({"status": "error", "error": "Job not found"}), 404
+    finally:
+        db.close()
+
+    name, mimetype = export_name(job_id, fmt, table, compression)
+    return Response(
+        export_job(job_id, fmt, table, compression),
+        mimetype=mimetype,
+        headers={"Content-Disposition": f'attachment; filename="{name}"'},
+    )
@@ -0,0 +1,221 @@
+from concurrent.futures import ThreadPoolExecutor
+from src.redis_client import get_redis
+from src.routes.sitemap.sitemap_parser import (
+    SITEMAP_TIMEOUT,
+    SITEMAP_WORKERS,
+    iter_sitemap_urls,
+)
+import hashlib
+import json
+import logging
+import requests
+import time
+import uuid
+
+logger = logging.getLogger("SitemapCache")
+
+# Results are served without revalidation for CACHE_TTL seconds and kept for
+# conditional revalidation for CACHE_MAX_AGE seconds.
+CACHE_TTL = 600
+CACHE_MAX_AGE = 24 * 3600
+# A fill holds a lock that lapses LOCK_TTL seconds after it last renewed it,
+# every LOCK_RENEW seconds at most; identical requests wait for it polling
+# every COALESCE_POLL seconds instead of fetching the tree again.
+LOCK_TTL = 300
+LOCK_RENEW = 60
+COALESCE_POLL = 0.2
+# URLs de-duplicated, stored and read back per Redis round trip
+CACHE_CHUNK = 1000
+
+
+# The lock is only renewed or released by the fill whose token it holds.
+_RENEW_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('EXPIRE', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+_UNLOCK_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+# Drop a fill's keys, publishing its URLs and metadata first if it
+# completed (ARGV[2] is then the metadata) and still holds the lock.
+_FINISH_SCRIPT = """
+redis.call('DEL', KEYS[3])
+if redis.call('GET', KEYS[1]) ~= ARGV[1] then
+    redis.call('DEL', KEYS[2])
+    return 0
+end
+if ARGV[2] ~= '' then
+    redis.call('RENAME', KEYS[2], KEYS[4])
+    redis.call('EXPIRE', KEYS[4], ARGV[3])
+    redis.call('SET', KEYS[5], ARGV[2], 'EX', ARGV[3])
+else
+    redis.call('DEL', KEYS[2])
+end
+redis.call('DEL', KEYS[1])
+return 1
+"""
+
+
+class _Keys:
+    def __init__(self, sitemap_url):
+        digest = hashlib.sha1(sitemap_url.encode("utf-8")).hexdigest()
+        self.prefix = f"sitemap:{digest}"
+        self.meta = f"{self.prefix}:meta"
+        self.urls = f"{self.prefix}:urls"
+        self.lock = f"{self.prefix}:lock"
+
+    def fill(self, token):
+        """The URL list and seen-set of one fill"""
+        return (
+            f"{self.prefix}:fill:{token}:urls",
+            f"{self.prefix}:fill:{token}:seen",
+        )
+
+
+def _load_meta(r, keys):
+    raw = r.get(keys.meta)
+    if raw is None or not r.exists(keys.urls):
+        return None
+    return json.loads(raw)
+
+
+def _not_modified(item):
+    url, (etag, last_modified) = item
+    headers = {}
+    if etag:
+        headers["If-None-Match"] = etag
+    if last_modified:
+        headers["If-Modified-Since"] = last_modified
+    if not headers:
+        return False
+    try:
+        response = requests.get(
+            url, headers=headers, timeout=SITEMAP_TIMEOUT, stream=True
+        )
+        response.close()
+        return response.status_code == 304
+    except requests.RequestException:
+        return False
+
+
+def revalidate(validators):
+    """Return True if every sitemap document answers 304 Not Modified"""
+    if not validators:
+        return False
+    with ThreadPoolExecutor(max_workers=SITEMAP_WORKERS) as executor:
+        return all(executor.map(_not_modified, validators.items()))
+
+
+def _read_cached(r, keys):
+    start = 0
+    while True:
+        chunk = r.lrange(keys.urls, start, start + CACHE_CHUNK - 1)
+        yield from chunk
+        if len(chunk) < CACHE_CHUNK:
+            return
+        start += CACHE_CHUNK
+
+
+def _fill(r, keys, sitemap_url, token):
+    """Stream the sitemap tree, yielding and caching each URL once.
+
+    The URLs are collected under keys of the fill's own, renewing the lock
+    as they come, and replace the cached ones at the end unless the lock
+    lapsed meanwhile and another fill took over.
+    """
+    fill_urls, fill_seen = keys.fill(token)
+    renew = r.register_script(_RENEW_SCRIPT)
+    validators = {}
+    count = 0
+    completed = False
+    renewed = time.monotonic()
+
+    def store(chunk):
+        pipe = r.pipeline()
+        for url in chunk:
+            pipe.sadd(fill_seen, url)
+        new = [url for url, added in zip(chunk, pipe.execute()) if added]
+        pipe = r.pipeline()
+        if new:
+            pipe.rpush(fill_urls, *new)
+        pipe.expire(fill_urls, LOCK_TTL)
+        pipe.expire(fill_seen, LOCK_TTL)
+        pipe.execute()
+        return new
+
+    try:
+        chunk = []
+        for url in iter_sitemap_urls(sitemap_url, validators=validators):
+            chunk.append(url)
+            if time.monotonic() - renewed >= LOCK_RENEW:
+                if not renew(keys=[keys.lock], args=[token, LOCK_TTL]):
+                    logger.warning(f"Lost the fill lock of {sitemap_url}")
+                renewed = time.monotonic()
+            if len(chunk) >= CACHE_CHUNK:
+                new = store(chunk)
+                count += len(new)
+                yield from new
+                chunk = []
+        new = store(chunk)
+        count += len(new)
+        yield from new
+        completed = True
+    finally:
+        meta = ""
+        if completed and count:
+            meta = json.dumps(
+                {
+                    "fetched_at": time.time(),
+                    "count": count,
+                    "validators": validators,
+                }
+            )
+        r.register_script(_FINISH_SCRIPT)(
+            keys=[keys.lock, fill_urls, fill_seen, keys.urls, keys.meta],
+            args=[token, meta, CACHE_MAX_AGE],
+        )
+
+
+def cached_sitemap_urls(sitemap_url, client=None):
+    """Yield the de-duplicated URLs of a sitemap tree through the cache.
+
+    Fresh results are read back from Redis.  Stale ones are revalidated with
+    conditional requests (ETag / Last-Modified) on every sitemap document
+    and only refetched if one of them changed.  Identical concurrent
+    requests are coalesced behind a lock: one request fetches and caches
+    the tree while streaming it, the others wait and then read the cache.
+    """
+    r = client or get_redis()
+    keys = _Keys(sitemap_url)
+    while True:
+        meta = _load_meta(r, keys)
+        if meta and time.time() - meta["fetched_at"] < CACHE_TTL:
+            yield from _read_cached(r, keys)
+            return
+
+        token = uuid.uuid4().hex
+        if r.set(keys.lock, token, nx=True, ex=LOCK_TTL):
+            if meta and revalidate(meta["validators"]):
+                logger.info(f"Sitemap {sitemap_url} not modified")
+                meta["fetched_at"] = time.time()
+                pipe = r.pipeline()
+                pipe.set(keys.meta, json.dumps(meta), ex=CACHE_MAX_AGE)
+                pipe.expire(keys.urls, CACHE_MAX_AGE)
+                pipe.execute()
+                r.register_script(_UNLOCK_SCRIPT)(
+                    keys=[keys.lock], args=[token]
+                )
+                yield from _read_cached(r, keys)
+                return
+            yield from _fill(r, keys, sitemap_url, token)
+            return
+
+        # Another request is fetching this sitemap; wait for its result
+        time.sleep(COALESCE_POLL)
@@ -1,53 +1,249 @@
-from flask import Blueprint, request, jsonify
-import requests
-from bs4 import BeautifulSoup
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from flask import Blueprint, Response, request, jsonify
+from lxml import etree
 from urllib.parse import urljoin
+import gzip
+import io
+import json
+import logging
+import queue
+import requests
+import threading
 
 sitemap_parser_bp = Blueprint("sitemap_parser", __name__)
 
+logger = logging.getLogger("SitemapParser")
 
-def get_sitemap_urls(base_url):
-    """Fetch all URLs from sitemap.xml or sitemap_index.xml"""
-    sitemap_urls = []
-    for sitemap_path in ["", "/sitemap.xml", "/sitemap_index.xml"]:
-        try:
-            response = requests.get(urljoin(base_url, sitemap_path), timeout=5)
-            soup = BeautifulSoup(response.content, "lxml-xml")
-            if soup.find_all("sitemapindex"):
-                # Handle nested sitemaps
-                sitemap_urls.extend(
-                    parse_sitemap_index(urljoin(base_url, sitemap_path))
-                )
+SITEMAP_PATHS = ["", "/sitemap.xml", "/sitemap_index.xml"]
+# (connect, read) timeouts for every sitemap request
+SITEMAP_TIMEOUT = (5, 30)
+# Child sitemaps fetched in parallel
+SITEMAP_WORKERS = 8
+# Entries handed from a fetch thread to the consumer at a time, and how many
+# such chunks may wait before fetch threads block (backpressure)
+SITEMAP_CHUNK = 500
+SITEMAP_QUEUE_SIZE = 64
+# Nested sitemap indexes followed at most this deep
+SITEMAP_MAX_DEPTH = 3
+
+GZIP_MAGIC = b"\x1f\x8b"
+
+NDJSON = "application/x-ndjson"
+
+SitemapEntry = namedtuple("SitemapEntry", ["loc", "lastmod", "priority"])
+
+_local = threading.local()
+
+
+def _session():
+    # requests sessions are not safe to share between threads
+    if not hasattr(_local, "session"):
+        _local.session = requests.Session()
+    return _local.session
+
+
+def open_sitemap(url):
+    """Open ``url`` and return ``(response, stream)``.
+
+    The stream transparently un-gzips both ``Content-Encoding: gzip`` and
+    gzipped ``.xml.gz`` bodies; the body is never read into memory as a
+    whole.
+    """
+    response = _session().get(url, stream=True, timeout=SITEMAP_TIMEOUT)
+    response.raise_for_status()
+    response.raw.decode_content = True
+    # gzip probes for trailing members after the body has been consumed
+    response.raw.auto_close = False
+    stream = io.BufferedReader(response.raw)
+    if stream.peek(2)[:2] == GZIP_MAGIC:
+        stream = gzip.GzipFile(fileobj=stream)
+    return response, stream
+
+
+def _text(elem, name):
+    child = elem.find(f"{{*}}{name}")
+    if child is None or child.text is None:
+        return None
+    return child.text.strip()
+
+
+def iter_sitemap_document(url, validators=None):
+    """Incrementally parse one sitemap or sitemap index.
+
+    Yields ``("url", SitemapEntry)`` for page entries and ``("sitemap",
+    loc)`` for child sitemaps.  Parsed elements are discarded as soon as
+    they are read, so memory stays flat however large the file is.  If a
+    ``validators`` dict is given, the document's ``(ETag, Last-Modified)``
+    is recorded in it once the document has been parsed.
+    """
+    response, stream = open_sitemap(url)
+    found = False
+    try:
+        for _, elem in etree.iterparse(
+            stream,
+            events=("end",),
+            tag=("{*}url", "{*}sitemap"),
+            resolve_entities=False,
+            no_network=True,
+            huge_tree=True,
+        ):
+            loc = _text(elem, "loc")
+            if loc:
+                found = True
+                if etree.QName(elem).localname == "sitemap":
+                    yield "sitemap", loc
+                else:
+                    priority = _text(elem, "priority")
+                    try:
+                        priority = float(priority) if priority else None
+                    except ValueError:
+                        priority = None
+                    yield "url", SitemapEntry(
+                        loc, _text(elem, "lastmod"), priority
+                    )
+            elem.clear()
+            while elem.getprevious() is not None:
+                del elem.getparent()[0]
+        if found and validators is not None:
+            validators[url] = (
+                response.headers.get("ETag"),
+                response.headers.get("Last-Modified"),
+            )
+    finally:
+        stream.close()
+        response.close()
+
+
+def _fetch_document(url, depth, results, stop, validators):
+    """Worker: stream one document's entries into ``results`` in chunks"""
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                results.put(item, timeout=0.5)
+                return
+            except queue.Full:
+                continue
+
+    chunk = []
+    try:
+        for kind, value in iter_sitemap_document(url, validators):
+            if stop.is_set():
+                return
+            if kind == "sitemap":
+                put(("sitemap", (value, depth + 1)))
+                continue
+            chunk.append(value)
+            if len(chunk) >= SITEMAP_CHUNK:
+                put(("urls", chunk))
+                chunk = []
+    except Exception as e:
+        # Missing candidates and non-XML pages are expected here
+        logger.debug(f"Skipping sitemap {url}: {e}")
+    finally:
+        if chunk:
+            put(("urls", chunk))
+        put(("done", url))
+
+
+def iter_sitemap_entries(
+    base_url, max_workers=SITEMAP_WORKERS, validators=None
+):
+    """Yield a :class:`SitemapEntry` for every URL in the site's sitemaps.
+
+    The usual sitemap locations of ``base_url`` are tried, sitemap indexes
+    are followed and child sitemaps are fetched concurrently.  Entries are
+    yielded as they are parsed, so callers can feed them straight into a
+    bulk insert; URLs listed in several sitemaps may be yielded more than
+    once.  ``validators`` collects the cache validators of every sitemap
+    document that was read (see :func:`iter_sitemap_document`).
+    """
+    results = queue.Queue(maxsize=SITEMAP_QUEUE_SIZE)
+    stop = threading.Event()
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    visited = set()
+    pending = 0
+
+    def submit(url, depth):
+        nonlocal pending
+        if url in visited or depth > SITEMAP_MAX_DEPTH:
+            return
+        visited.add(url)
+        pending += 1
+        executor.submit(_fetch_document, url, depth, results, stop, validators)
+
+    try:
+        for path in SITEMAP_PATHS:
+            submit(urljoin(base_url, path), 0)
+        while pending:
+            kind, value = results.get()
+            if kind == "urls":
+                yield from value
+            elif kind == "sitemap":
+                submit(*value)
             else:
-                urls = [loc.text for loc in soup.find_all("loc")]
-                if urls:
-                    sitemap_urls.extend(urls)
-        except Exception:
-            continue
-    return list(set(sitemap_urls)) if sitemap_urls else [base_url]
+                pending -= 1
+    finally:
+        stop.set()
+        executor.shutdown(wait=False, cancel_futures=True)
 
 
-def parse_sitemap_index(sitemap_index_url):
-    response = requests.get(sitemap_index_url)
-    soup = BeautifulSoup(response.content, "lxml-xml")
-    sitemap_urls = [loc.text for loc in soup.find_all("loc")]
-    all_urls = []
-    for sitemap_url in sitemap_urls:
-        sitemap_response = requests.get(sitemap_url)
-        sitemap_soup = BeautifulSoup(sitemap_response.content, "lxml-xml")
-        urls = [url_loc.text for url_loc in sitemap_soup.find_all("loc")]
-        all_urls.extend(urls)
+def iter_sitemap_pages(base_url, validators=None):
+    """Yield sitemap entries of ``base_url``, or a bare entry for it if none"""
+    found = False
+    for entry in iter_sitemap_entries(base_url, validators=validators):
+        found = True
+        yield entry
+    if not found:
+        yield SitemapEntry(base_url, None, None)
 
-    return all_urls
+
+def iter_sitemap_urls(base_url, validators=None):
+    """Yield sitemap URLs of ``base_url``, or ``base_url`` if there are none"""
+    for entry in iter_sitemap_pages(base_url, validators):
+        yield entry.loc
+
+
+def get_sitemap_urls(base_url):
+    """Fetch all URLs from sitemap.xml or sitemap_index.xml"""
+    return list(set(iter_sitemap_urls(base_url)))
+
+
+def _ndjson(urls):
+    count = 0
+    try:
+        for url in urls:
+            count += 1
+            yield json.dumps({"url": url}) + "\n"
+        yield json.dumps({"success": True, "count": count}) + "\n"
+    except Exception as e:
+        # Headers are already sent; report the failure in-band
+        yield json.dumps({"success": False, "error": str(e)}) + "\n"
 
 
 @sitemap_parser_bp.route("/parse", methods=["POST"])
 def parse_sitemap():
+    """Return the URLs of a sitemap tree, optionally streamed as NDJSON.
+
+    Clients that send ``"stream": true`` or ``Accept: application/x-ndjson``
+    receive one ``{"url": ...}`` line per URL as soon as it is available,
+    followed by a ``{"success": ..., "count": ...}`` summary line.
+    """
+    # Imported here: the cache module imports this one
+    from src.routes.sitemap.cache import cached_sitemap_urls
+
     data = request.get_json()
     sitemap_url = data.get("url")
+    stream = data.get("stream") or request.accept_mimetypes.best == NDJSON
+
+    if stream:
+        return Response(
+            _ndjson(cached_sitemap_urls(sitemap_url)), mimetype=NDJSON
+        )
 
     try:
-        urls = get_sitemap_urls(sitemap_url)
+        urls = list(cached_sitemap_urls(sitemap_url))
         return jsonify({"success": True, "urls": urls, "count": len(urls)})
     except Exception as e:
         return jsonify({"success": False, "error": str(e)}), 500
@@ -1 +1,9 @@
-from src.tasks import crawler
+import importlib
+
+
+# The crawler is imported on first use, not with the package: parser
+# processes import src.tasks.parse_worker, and nothing else.
+def __getattr__(name):
+    if name == "crawler":
+        return importlib.import_module("src.tasks.crawler")
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -1,16 +1,50 @@
-from bs4 import BeautifulSoup
 from celery import Celery
+from celery.exceptions import SoftTimeLimitExceeded
+from celery.signals import worker_ready
+from collections import OrderedDict, deque
 from datetime import datetime
-from robotexclusionrulesparser import RobotExclusionRulesParser
-from src.database import SessionLocal
-from src.models import CrawlJob, UrlNode, UrlEdge
-from urllib.parse import urljoin, urlparse
-from src.routes.sitemap.sitemap_parser import get_sitemap_urls
-import re
+from src.database import SessionLocal, create_job_partitions
+from src.instrumentation import CrawlRecorder, start_metrics_server
+from src.models import CrawlJob, UrlNode, url_hash
+from urllib.parse import urlparse
+from src.routes.sitemap.sitemap_parser import iter_sitemap_pages
+from src.tasks.fetcher import (
+    DATE_LENGTH,
+    CrawlEngine,
+    FetchResult,
+    fetch_url,
+    fitting,
+)
+from src.tasks.fingerprints import (
+    fingerprint,
+    make_fingerprint_index,
+    restore_fingerprints,
+)
+from src.tasks.frontier import RedisFrontier, make_frontier
+from src.tasks.graph_writer import GraphWriter
+from src.tasks.link_checker import LinkChecker, check_external_links
+from src.tasks.normalization import get_normalizer
+from src.tasks.options import CrawlOptions
+from src.tasks.parsing import ParsePool
+from src.tasks.politeness import HostThrottle, get_robots_cache
+from src.tasks.progress import (
+    FINISHED_STATUSES,
+    ProgressTracker,
+    publish_progress,
+    snapshot,
+)
+from src.tasks.recrawl import PreviousCrawl
+from src.tasks.scheduler import (
+    TASK_PRIORITIES,
+    JobScheduler,
+    job_fanout,
+    turn_seconds,
+)
+from src.tasks.scope import CrawlBudget, CrawlScope
 import requests
 import time
 import logging
-import ssl
+import os
 
 
 logger = logging.getLogger("CrawlerTask")
@@ -19,271 +53,954 @@ logging.basicConfig(level=logging.INFO)
 app = Celery(
     "crawler", broker="redis://redis:6379/0", backend="redis://redis:6379/0"
 )
+# Worker settings, the task time limits among them
+app.config_from_object("config.celeryconfig")
+# Serve tasks by message priority so that interactive jobs' turns go
+# before queued bulk ones (see TASK_PRIORITIES); a worker reserving
+# several tasks ahead would defeat it
+app.conf.update(
+    broker_transport_options={
+        "priority_steps": list(range(10)),
+        "sep": ":",
+        "queue_order_strategy": "priority",
+    },
+    worker_prefetch_multiplier=1,
+)
+
+# Seconds an idle distributed batch chain waits before polling the frontier
+# again while other batches of its job are still in flight.
+BATCH_RETRY_DELAY = 2
+
+# Rows loaded per query when a frontier is rebuilt from its checkpoint.
+RESTORE_CHUNK = 10000
+
+# Sitemap URLs added to the frontier at a time while seeding a crawl.
+SEED_CHUNK = 1000
+
+# Jobs whose distributed batch CrawlContext a worker process keeps, see
+# batch_context; the least recently used is closed first.
+BATCH_CONTEXTS = 4
+_batch_contexts = OrderedDict()
+
+
+def make_normalizer(options):
+    """Return the URL normalizer configured by the job's options"""
+    return get_normalizer(query=options.url_query)
 
 
-def normalize_url(u):
-    logger.info(f"Normalizing url: {u}")
-    p = urlparse(u)
-    ret = f"{p.scheme}://{p.netloc}{p.path}".rstrip("/")
-    logger.debug(f"Normalized URD: {ret}")
-    return ret
+def site_domain(base_url, normalize):
+    """Return the host a crawl of ``base_url`` stays on"""
+    return urlparse(normalize(base_url) or base_url).netloc
 
 
-def process_url(url, job_id, db, robots):
-    """Process a single URL and store results"""
+@worker_ready.connect
+def serve_worker_metrics(**kwargs):
+    """Expose the worker's metrics when ``CELERY_METRICS_PORT`` is set"""
+    port = os.getenv("CELERY_METRICS_PORT")
+    if port:
+        start_metrics_server(int(port))
+
+
+class CrawlContext:
+    """Per-task crawl state shared by the fetch, parse and store helpers.
+
+    On recrawls ``previous`` is the :class:`PreviousCrawl` whose unchanged
+    pages are reused.  ``parser`` is the parse stage fetched pages go
+    through.  With ``fingerprints``, the job's fingerprint index, pages
+    duplicating an earlier one are stored without parsing them.  Only links
+    in the job's ``scope`` are queued.  Stages and counters are recorded by
+    the writer's recorder.
+    """
+
+    def __init__(
+        self,
+        options,
+        writer,
+        robots,
+        throttle=None,
+        previous=None,
+        fingerprints=None,
+    ):
+        self.options = options
+        self.writer = writer
+        self.robots = robots
+        self.previous = previous
+        self.fingerprints = fingerprints
+        self.scope = CrawlScope(options)
+        self.recorder = writer.recorder
+        self.throttle = throttle or HostThrottle()
+        self.crawl_delay = host_delay(options, robots)
+        # Set by the caller to get URLs of cooling hosts handed back in
+        # ``deferred`` instead of sleeping (see schedule_batch)
+        self.defer_cooldown = False
+        self.deferred = []
+        self.cooldown = 0
+        self.normalize = make_normalizer(options)
+        self.parser = ParsePool(
+            options.extractor,
+            options.url_query,
+            workers=options.parse_workers,
+            max_pending=options.parse_queue,
+            recorder=self.recorder,
+        )
+        self.engine = make_engine(
+            options, robots, self.throttle, self.recorder
+        )
+        # Keep-alive connections for the sequential path
+        self.session = requests.Session()
+
+    def close(self):
+        self.parser.close()
+        self.session.close()
+        if self.engine is not None:
+            self.engine.close()
+
+
+def make_previous(job, db):
+    """Return the :class:`PreviousCrawl` of a recrawl job, else None"""
+    if not job.previous_job_id:
+        return None
+    return PreviousCrawl(db, job.id, job.previous_job_id)
+
+
+def fetch_page(url, ctx, previous=None):
+    """Fetch a single URL on the sequential path.
+
+    With the ``previous`` crawl's page the request is conditional.  Request
+    errors (timeouts, SSL, connection and DNS failures, broken bodies) give
+    a result without a status code, as on the async path.
+    """
 
     logger.info(f"Processing URL: {url}")
+    headers = previous.conditional_headers() if previous else None
     try:
-        # Respect robots.txt rules
-        if not robots.is_allowed("*", url):
-            logger.info(f"Not allow to parse HTML by robots.txt")
-            return set()
-
-        # Respect crawl delay
-        time.sleep(robots.get_crawl_delay("*") or 1)
-
-        response = requests.get(url, timeout=10)
-        soup = BeautifulSoup(response.text, "html.parser")
-        domain = urlparse(url).netloc
-
-        # Create or get URL node
-        url_node = db.query(UrlNode).filter_by(url=url, job_id=job_id).first()
-        if not url_node:
-            url_node = UrlNode(
-                job_id=job_id,
-                url=url,
-                is_external=False,
-                status_code=response.status_code,
-            )
-            db.add(url_node)
-            db.flush()
-        else:
-            # Update status code for existing node
-            url_node.status_code = response.status_code
-
-        # Find all links
-        links = set()
-
-        # HTML links
-        for a in soup.find_all("a", href=True):
-            if a["href"].strip() in ("", "#", url):  # Skip common self-links
-                continue
-
-            links.add(normalize_url(a["href"]))
-
-        # JavaScript links (static analysis)
-        for script in soup.find_all("script"):
-            if script.string:
-                links.update(
-                    re.findall(
-                        r"(?:window\.location|href|fetch|axios\.get|url)\s*[=:]\s*['\"]([^'\"]+)",
-                        script.string,
-                    )
+        return fetch_url(
+            ctx.session,
+            url,
+            timeout=ctx.options.request_timeout,
+            max_bytes=ctx.options.max_bytes,
+            head_first=ctx.options.head_first,
+            headers=headers,
+        )
+    except requests.exceptions.Timeout as t:
+        logger.info(f"Request timeout for URL {url}: {t}")
+        return FetchResult(url, None, None, "timeout")
+    except requests.RequestException as e:
+        logger.info(f"Request error for URL {url}: {e}")
+        return FetchResult(url, None, None, str(e))
+
+
+def record_result(result, recorder):
+    """Record the fetch time, body size and error of a fetch result"""
+    if result.elapsed_ms is not None:
+        recorder.observe("fetch", result.elapsed_ms / 1000)
+    if result.text is not None:
+        recorder.body(result.size)
+    if result.status_code is None:
+        recorder.error("timeout" if result.error == "timeout" else "request")
+    elif result.status_code >= 400:
+        recorder.error(f"{result.status_code // 100}xx")
+
+
+def record_links(targets, recorder):
+    external = sum(1 for _, is_external in targets if is_external)
+    recorder.links(len(targets) - external, external)
+
+
+def handle_result(result, depth, ctx, previous=None):
+    """Store a fetch result, yielding the ``(url, depth, links)`` it completes.
+
+    HTML bodies are handed to the parse stage, so what comes out may be
+    earlier pages whose parsing finished meanwhile, or nothing yet, unless
+    they duplicate an earlier page.  A 304 answer to a conditional request
+    reuses the ``previous`` page.
+    """
+    url = result.url
+    record_result(result, ctx.recorder)
+    if result.status_code is None:
+        ctx.recorder.page("failed")
+        mark_url_visited(url, ctx.writer)
+        yield url, depth, set()
+    elif result.status_code == 304 and previous is not None:
+        yield url, depth, carry_page(
+            url, previous, ctx, depth, result.metadata()
+        )
+    elif result.text is None:
+        yield url, depth, store_page(
+            url, result.status_code, None, ctx, depth, result.metadata()
+        )
+    else:
+        metadata = result.metadata()
+        if ctx.fingerprints is not None and 200 <= result.status_code < 300:
+            original = match_fingerprint(url, result.text, metadata, ctx)
+            if original is not None:
+                metadata["duplicate_of"] = original
+                yield url, depth, store_page(
+                    url, result.status_code, None, ctx, depth, metadata
                 )
+                return
+        ctx.recorder.page("parsed")
+        yield from buffer_parsed(
+            ctx.parser.submit(
+                url, result.text, (depth, result.status_code, metadata)
+            ),
+            ctx,
+        )
+
+
+def match_fingerprint(url, html, metadata, ctx):
+    """Fingerprint a page's body into its ``metadata``.
+
+    Returns the url_hash of the earlier page of the job the body
+    duplicates, or None if the page is an original.
+    """
+    with ctx.recorder.stage("fingerprint"):
+        metadata.update(fingerprint(html, near=ctx.options.dedupe == "near"))
+        return ctx.fingerprints.match(
+            url_hash(url), metadata["content_hash"], metadata["simhash"]
+        )
+
+
+def buffer_parsed(parsed, ctx):
+    """Buffer pages coming out of the parse stage; yield their links"""
+    for url, (depth, status_code, metadata), (targets, links) in parsed:
+        ctx.writer.add_page(url, status_code, targets, depth=depth, **metadata)
+        record_links(targets, ctx.recorder)
+        logger.info(f"Buffered {len(targets)} links from {url}")
+        yield url, depth, links
+
+
+def carry_page(url, page, ctx, depth=None, metadata=None):
+    """Buffer an unchanged page with the links of its previous crawl.
+
+    The links come loaded with ``page`` (see :meth:`PreviousCrawl.lookup`).
+
+    ``metadata`` of a 304 response is recorded on the node; its validators
+    replace the stored ones.  Returns the page's internal links, like
+    :func:`store_page`.
+    """
+    links = page.links
+    ctx.recorder.page("reused")
+    record_links(links, ctx.recorder)
+    ctx.writer.add_page(
+        url,
+        page.status_code,
+        links,
+        depth=depth,
+        **{
+            "etag": page.etag,
+            "last_modified": page.last_modified,
+            **{k: v for k, v in (metadata or {}).items() if v is not None},
+        },
+    )
+    logger.info(f"Reused {len(links)} links of unchanged page {url}")
+    return {target for target, is_external in links if not is_external}
 
-        validLinks = set()
-        # Process each link
-        for link in links:
-            absolute_url = normalize_url(urljoin(url, link))
-            parsed = urlparse(absolute_url)
 
-            # Skip self-links before DB operations
-            if absolute_url == url:  # Or compare node IDs if already exists
-                continue
-            is_external = parsed.netloc != domain
+def store_page(url, status_code, html, ctx, depth=None, metadata=None):
+    """Parse a fetched page inline and buffer its node and outgoing links.
+
+    ``html`` is None when the body was not downloaded (not HTML, or over
+    the byte limit) or duplicates another page's (``duplicate_of`` in
+    ``metadata``): the page is stored without links.  ``metadata`` is
+    recorded on the page's node (see :meth:`FetchResult.metadata`).
+    Returns the page's internal links.
+    """
+    if html is None:
+        duplicate = (metadata or {}).get("duplicate_of") is not None
+        ctx.recorder.page("duplicate" if duplicate else "stored")
+        ctx.writer.add_page(
+            url, status_code, [], depth=depth, **(metadata or {})
+        )
+        logger.info(f"Stored {url} without parsing its body")
+        return set()
+
+    ctx.recorder.page("parsed")
+    targets, links = ctx.parser.parse(url, html)
+    ctx.writer.add_page(
+        url, status_code, targets, depth=depth, **(metadata or {})
+    )
+    record_links(targets, ctx.recorder)
+    logger.info(f"Buffered {len(targets)} links from {url}")
+    return links
 
-            if not is_external:
-                validLinks.add(link)
 
-            if url in validLinks:
-                continue
+def schedule_batch(batch, ctx):
+    """Yield ``(url, depth)`` entries of ``batch`` as their host allows.
 
-            # Create target node
-            target_node = (
-                db.query(UrlNode)
-                .filter_by(url=absolute_url, job_id=job_id)
-                .first()
+    Each URL waits for its host's shared fetch slot; URLs of other hosts
+    are served while a host cools down.  When every remaining host is
+    cooling down this sleeps for the shortest wait, unless it is
+    longer than ``max_host_wait`` and ``ctx.defer_cooldown`` is set: then
+    the rest of the batch is left in ``ctx.deferred`` and the wait in
+    ``ctx.cooldown`` so that the worker can do other work meanwhile.
+    """
+    pending = deque(batch)
+    ready_at = {}
+    while pending:
+        now = time.monotonic()
+        for _ in range(len(pending)):
+            url, depth = pending.popleft()
+            host = urlparse(url).netloc
+            if ready_at.get(host, now) <= now:
+                wait = ctx.throttle.acquire(host, ctx.crawl_delay)
+                if not wait:
+                    yield url, depth
+                    break
+                ready_at[host] = now + wait
+            pending.append((url, depth))
+        else:
+            # Every remaining host is cooling down
+            wait = (
+                min(ready_at[urlparse(url).netloc] for url, _ in pending)
+                - time.monotonic()
             )
-            if not target_node:
-                target_node = UrlNode(
-                    job_id=job_id,
-                    url=absolute_url,
-                    is_external=is_external,
-                    status_code=None,
-                )
-                db.add(target_node)
-                db.flush()
+            if ctx.defer_cooldown and wait > ctx.options.max_host_wait:
+                ctx.deferred = list(pending)
+                ctx.cooldown = wait
+                return
+            with ctx.recorder.stage("delay"):
+                time.sleep(max(wait, 0))
 
-            # Create edge if not exists
-            if (
-                not db.query(UrlEdge)
-                .filter_by(
-                    job_id=job_id,
-                    source_id=url_node.id,
-                    target_id=target_node.id,
-                )
-                .first()
-            ):
-                edge = UrlEdge(
-                    job_id=job_id,
-                    source_id=url_node.id,
-                    target_id=target_node.id,
-                    link_type="hyperlink",
-                )
-                db.add(edge)
-                db.flush()
-            logger.info(
-                f"Added link to graph {job_id}: {url_node.id}->{target_node.id}"
+
+def process_batch(batch, ctx):
+    """Fetch and store a frontier batch, yielding ``(url, depth, links)``.
+
+    Without an engine the URLs allowed by robots.txt are fetched one at a
+    time, as :func:`schedule_batch` releases them.  With a
+    :class:`CrawlEngine` they are fetched concurrently and handled as they
+    arrive.  Either way bodies are parsed by ``ctx.parser`` while fetching
+    goes on, and the batch is done once the parse stage is drained.  On
+    recrawls, pages whose sitemap ``<lastmod>`` did not move are reused
+    without a request and the others are fetched conditionally.
+    """
+    depths = {}
+    for url, depth in batch:
+        with ctx.recorder.stage("robots"):
+            allowed = ctx.robots.is_allowed("*", url)
+        if allowed:
+            depths[url] = depth
+        else:
+            logger.info(f"Not allow to parse HTML by robots.txt: {url}")
+            ctx.recorder.page("robots")
+            mark_url_visited(url, ctx.writer)
+            yield url, depth, set()
+
+    previous = ctx.previous.lookup(depths) if ctx.previous else {}
+    for url, page in previous.items():
+        if page.lastmod_unchanged:
+            depth = depths.pop(url)
+            yield url, depth, carry_page(url, page, ctx, depth)
+
+    if ctx.engine is None:
+        for url, depth in schedule_batch(depths.items(), ctx):
+            page = previous.get(url)
+            result = fetch_page(url, ctx, page)
+            yield from handle_result(result, depth, ctx, page)
+    else:
+        headers = {
+            url: page.conditional_headers() for url, page in previous.items()
+        }
+        for result in ctx.engine.iter_fetch(list(depths), headers):
+            yield from handle_result(
+                result, depths[result.url], ctx, previous.get(result.url)
             )
+    yield from buffer_parsed(ctx.parser.drain(), ctx)
+
+
+def get_pending_urls(job_id, db, limit=100, after_id=0):
+    """Get pending URLs from database with keyset pagination"""
+    return (
+        db.query(UrlNode)
+        .filter(
+            UrlNode.job_id == job_id,
+            UrlNode.status_code.is_(None),
+            UrlNode.is_external.is_(False),
+            UrlNode.id > after_id,
+        )
+        .order_by(UrlNode.id)
+        .limit(limit)
+        .all()
+    )
 
-        db.commit()
-        return validLinks
-    except requests.exceptions.Timeout as t:
-        logger.info(f"Request timeout for URL {url}: {t}")
-        return set()
-    except ssl.SSLError as ssl:
-        logger.info(f"Request for a invalid SSL URL {url}: {ssl}")
-        return set()
-    except Exception as e:
-        db.rollback()
-        raise e
 
+def restore_frontier(job_id, frontier, db, scope=None):
+    """Rebuild a frontier from the nodes checkpointed for ``job_id``.
 
-def get_pending_urls(job_id, db, limit=100):
-    """Get pending URLs from database with pagination"""
-    return db.query(UrlNode).filter_by(
-        job_id=job_id, 
-        status_code=None
-    ).limit(limit).all()
+    Every stored URL counts as seen.  Internal URLs without a status code
+    were discovered but not processed before the checkpoint, so they are
+    queued again with their sitemap priority if they are in ``scope``;
+    everything else is never refetched.
+    """
+    frontier.clear()
+    seen = []
+    for (url,) in (
+        db.query(UrlNode.url).filter_by(job_id=job_id).yield_per(RESTORE_CHUNK)
+    ):
+        seen.append(url)
+        if len(seen) >= RESTORE_CHUNK:
+            frontier.mark_seen(seen)
+            seen = []
+    frontier.mark_seen(seen)
+
+    after_id = 0
+    while True:
+        pending = get_pending_urls(job_id, db, RESTORE_CHUNK, after_id)
+        if not pending:
+            break
+        entries = [(node.url, node.depth or 0) for node in pending]
+        if scope is not None:
+            entries = [
+                (url, depth)
+                for url, depth in entries
+                if scope.allows(url, depth)
+            ]
+        frontier.requeue(
+            entries,
+            {
+                node.url: node.priority
+                for node in pending
+                if node.priority is not None
+            },
+        )
+        after_id = pending[-1].id
+    logger.info(
+        f"Restored frontier of job {job_id}: "
+        f"{frontier.seen_count} seen, {len(frontier)} pending"
+    )
+
+
+def mark_url_visited(url, writer):
+    """Mark a URL that produced no HTTP response as visited.
+
+    The node is given a sentinel status code so that
+    :pyfunc:`get_pending_urls` will no longer treat it as unprocessed.  A
+    negative value (``-1``) is used to denote that the request was skipped
+    (robots.txt) or failed (timeout, SSL error, etc.).
+    """
+    writer.add_node(url, status_code=-1)
 
 
-def mark_url_visited(url, job_id, db):
-    """Mark URL as visited in database.
+def load_robots(base_url):
+    """Return robots.txt rules for the site of ``base_url`` (cached)"""
+    return get_robots_cache().get(base_url)
+
+
+def host_delay(options, robots):
+    """Seconds between requests to a host, on either fetch path"""
+    return robots.get_crawl_delay("*") or options.crawl_delay
+
+
+def make_engine(options, robots, throttle=None, recorder=None):
+    """Create the concurrent fetch engine if the job asks for it"""
+    if options.engine != "async":
+        return None
+    return CrawlEngine(
+        concurrency=options.concurrency,
+        per_host_concurrency=options.per_host_concurrency,
+        timeout=options.request_timeout,
+        host_delay=host_delay(options, robots),
+        throttle=throttle,
+        max_bytes=options.max_bytes,
+        head_first=options.head_first,
+        recorder=recorder,
+    )
+
+
+def seed_frontier(entries, domain, frontier, writer, normalize, scope=None):
+    """Queue the internal URLs of sitemap ``entries`` as depth-0 nodes.
+
+    Entries are read in chunks.  Only URLs new to the frontier are
+    buffered for the database, with their ``<lastmod>`` and ``<priority>``,
+    and the writer flushes them in bulk while the iterable is still being
+    read.  URLs out of ``scope`` are left out.
+    """
+    chunk = {}
+
+    def queue():
+        priorities = {url: entry.priority for url, entry in chunk.items()}
+        for new_url in frontier.add_many(chunk, priorities=priorities):
+            writer.add_node(
+                new_url,
+                depth=0,
+                in_sitemap=True,
+                lastmod=fitting(chunk[new_url].lastmod, DATE_LENGTH),
+                priority=chunk[new_url].priority,
+            )
 
-    If the URL has not yet received any HTTP status code (i.e. still ``None``),
-    assign a sentinel value so that :pyfunc:`get_pending_urls` will no longer
-    treat it as unprocessed.  A negative value (``-1``) is used to denote that
-    the request was skipped (robots.txt) or failed (timeout, SSL error, etc.).
+    for entry in entries:
+        normalized_url = normalize(entry.loc)
+        if (
+            normalized_url
+            and urlparse(normalized_url).netloc == domain
+            and (scope is None or scope.allows(normalized_url))
+        ):
+            chunk[normalized_url] = entry
+        if len(chunk) >= SEED_CHUNK:
+            queue()
+            writer.maybe_flush()
+            chunk = {}
+    queue()
+    writer.flush()
+
+
+def queue_links(links, depth, frontier, scope=None):
+    """Add the normalized internal links found on a page to the frontier.
+
+    Links out of ``scope`` are not queued.
     """
-    url_node = db.query(UrlNode).filter_by(url=url, job_id=job_id).first()
-    if url_node and url_node.status_code is None:
-        # Use -1 to indicate that the URL was processed but produced no valid HTTP response
-        url_node.status_code = -1
+    if scope is not None:
+        links = scope.filter(links, depth + 1)
+    return frontier.add_many(links, depth + 1)
+
+
+def checkpoint(job, writer, db):
+    """Persist buffered results and counters so the crawl can resume"""
+    writer.flush()
+    job.checkpoint_at = datetime.now()
     db.commit()
+    JobScheduler().heartbeat(job.id)
+    logger.info(f"Checkpointed job {job.id} at {job.processed_urls} URLs")
+
+
+def set_job_status(job, db, status):
+    """Commit a new status for ``job`` and push it to progress subscribers.
+
+    A finished job hands its place in the scheduler to a waiting one.
+    """
+    job.status = status
+    if status == "running" and job.started_at is None:
+        job.started_at = datetime.now()
+    if status == "completed":
+        job.finished_at = datetime.now()
+    db.commit()
+    publish_progress(job.id, snapshot(job))
+    if status in FINISHED_STATUSES:
+        release_job(job.id)
+
+
+def submit_job(job_id, base_url, options, resume=False):
+    """Queue a crawl job with the scheduler; it starts once admitted"""
+    scheduler = JobScheduler()
+    scheduler.submit(job_id, base_url, options, resume)
+    start_admitted(scheduler)
+
+
+def release_job(job_id):
+    """Free a finished job's place and start the jobs admitted into it"""
+    scheduler = JobScheduler()
+    scheduler.finish(job_id)
+    start_admitted(scheduler)
+
+
+def start_admitted(scheduler):
+    """Start the crawl task of every job the scheduler admits now.
+
+    A new job's first task runs under the job's id, which is what the
+    Celery task of a job is looked up by.
+    """
+    for job_id, entry in scheduler.admit():
+        logger.info(f"Admitted job {job_id} ({entry['queue']})")
+        crawl_website.apply_async(
+            args=[entry["base_url"], entry["options"]],
+            kwargs={"job_id": job_id, "resume": entry["resume"]},
+            task_id=None if entry["resume"] else job_id,
+            priority=TASK_PRIORITIES[entry["queue"]],
+        )
+        # The lease runs from when the task is queued; the task renews it
+        # when it starts, however long it waited
+        scheduler.heartbeat(job_id)
+
+
+def continue_crawl(job, options, db, handover=False):
+    """Hand ``job`` over to a fresh task that resumes its checkpoint.
+
+    The task is queued behind the other jobs' tasks of the same priority:
+    this is how running jobs take turns at the workers.  With ``handover``
+    the job's Redis frontier is up to date and the task carries on with it
+    instead of rebuilding it from the checkpoint.
+    """
+    task = crawl_website.apply_async(
+        args=[job.start_url, options.to_dict()],
+        kwargs={"job_id": job.id, "resume": True, "handover": handover},
+        priority=TASK_PRIORITIES[options.queue],
+    )
+    job.task_id = task.id
+    db.commit()
+    JobScheduler().heartbeat(job.id)
 
 
 @app.task(bind=True)
-def crawl_website(self, base_url):
-    """Main crawl task with improved memory management"""
+def crawl_website(
+    self, base_url, options=None, job_id=None, resume=False, handover=False
+):
+    """Main crawl task with improved memory management.
+
+    With ``resume`` the task continues an existing job from its last
+    checkpoint instead of seeding it from the sitemap.  The same mechanism
+    splits long crawls into turns of at most ``chunk_seconds`` (see
+    :func:`turn_seconds`), each run by a new task so that no single task
+    hits the worker time limit and running jobs share the workers.  A turn
+    is ``handover``: it takes the Redis frontier and fingerprints of the
+    previous turn as they are, and only rebuilds them if they are gone.
+    """
+    options = CrawlOptions.from_dict(options)
+    job_id = job_id or self.request.id
     db = SessionLocal()
-    robots = RobotExclusionRulesParser()
-    robots.fetch(
-        urlparse(base_url).scheme
-        + "://"
-        + urlparse(base_url).netloc
-        + "/robots.txt"
-    )
 
-    domain = urlparse(base_url).netloc
+    normalize = make_normalizer(options)
+    domain = site_domain(base_url, normalize)
     self.is_aborted = False
+    started = time.monotonic()
+    job = None
+    ctx = None
+    writer = None
     try:
         # Initialize job
-        job = db.query(CrawlJob).filter_by(id=self.request.id).first()
+        job = db.query(CrawlJob).filter_by(id=job_id).first()
         if not job:
-            raise ValueError(f"Job {self.request.id} not found")
-        
-        # Get initial URLs from sitemap
-        sitemap_urls = get_sitemap_urls(base_url)
-        job.total_urls = len(sitemap_urls)
-        job.status = "running"
-        db.commit()
-        
-        # Add initial URLs to database
-        for url in sitemap_urls:
-            normalized_url = normalize_url(url)
-            if urlparse(normalized_url).netloc == domain:
-                existing_node = db.query(UrlNode).filter_by(
-                    url=normalized_url, job_id=job.id
-                ).first()
-                if not existing_node:
-                    url_node = UrlNode(
-                        job_id=job.id,
-                        url=normalized_url,
-                        is_external=False,
-                        status_code=None,
-                    )
-                    db.add(url_node)
-        db.commit()
-        
-        processed_count = 0
-        
+            raise ValueError(f"Job {job_id} not found")
+        if resume and job.status not in ("pending", "running"):
+            logger.info(f"Job {job_id} is {job.status}, not resuming")
+            release_job(job_id)
+            return
+        scheduler = JobScheduler()
+        scheduler.heartbeat(job_id)
+        # Outside the request that inserted the job, so that creating
+        # them does not hold up writers of other jobs
+        create_job_partitions(db, job.id)
+        robots = load_robots(base_url)
+
+        writer = GraphWriter(
+            db,
+            job.id,
+            flush_size=options.flush_size,
+            flush_interval=options.flush_interval,
+            progress=ProgressTracker(job.id),
+            recorder=CrawlRecorder(profile=options.profile),
+        )
+
+        frontier = make_frontier(options.frontier, job.id)
+        fingerprints = make_fingerprint_index(options, job.id)
+        scope = CrawlScope(options)
+
+        if resume:
+            if not (handover and frontier.seen_count):
+                restore_frontier(job.id, frontier, db, scope)
+                if fingerprints is not None:
+                    restore_fingerprints(job.id, fingerprints, db)
+            job.task_id = self.request.id
+            if job.status == "pending":
+                # Resumed through the scheduler
+                set_job_status(job, db, "running")
+            else:
+                db.commit()
+        else:
+            job.task_id = self.request.id
+            set_job_status(job, db, "running")
+
+            # Seed the frontier from the sitemap as it streams in
+            entries = iter_sitemap_pages(base_url)
+            seed_frontier(entries, domain, frontier, writer, normalize, scope)
+
+        if options.mode == "distributed":
+            # Hand the frontier over to batch tasks on any worker
+            for _ in range(job_fanout(options)):
+                crawl_batch.apply_async(
+                    args=[job.id, base_url, options.to_dict()],
+                    priority=TASK_PRIORITIES[options.queue],
+                )
+            return
+
+        ctx = CrawlContext(
+            options,
+            writer,
+            robots,
+            previous=make_previous(job, db),
+            fingerprints=fingerprints,
+        )
+        last_checkpoint = time.monotonic()
+        budget = CrawlBudget(options, job.started_at)
+        processed = job.processed_urls or 0
+
         # Process URLs in batches to avoid memory issues
         while True:
             if self.is_aborted:
-                job.status = "aborted"
-                db.commit()
+                set_job_status(job, db, "aborted")
                 return
-                
-            # Get batch of pending URLs
-            pending_urls = get_pending_urls(job.id, db, limit=50)
-            if not pending_urls:
+
+            if options.chunk_seconds and time.monotonic() - started >= (
+                turn_seconds(options, scheduler.contended())
+            ):
+                checkpoint(job, writer, db)
+                continue_crawl(job, options, db, handover=True)
+                return
+
+            # Get batch of pending URLs, the most important first
+            limit = budget.batch_limit(options.batch_size, processed)
+            if not limit:
+                logger.info(f"Job {job.id} is out of budget, finishing it")
                 break
-                
-            for url_node in pending_urls:
+            batch = frontier.pop_batch(limit)
+            if not batch:
+                break
+
+            for url, depth, valid_urls in process_batch(batch, ctx):
                 if self.is_aborted:
-                    job.status = "aborted"
-                    db.commit()
+                    writer.flush()
+                    set_job_status(job, db, "aborted")
                     return
-                    
-                url = url_node.url
-                if urlparse(url).netloc != domain:
-                    continue
-                    
-                valid_urls = process_url(url, job.id, db, robots)
-                mark_url_visited(url, job.id, db)
-                processed_count += 1
-                
-                # Update progress
-                job.processed_urls = processed_count
-                job.total_urls = db.query(UrlNode).filter_by(job_id=job.id).count()
-                db.commit()
-                
-                self.update_state(
-                    state="PROGRESS",
-                    meta={
-                        "progress": round((processed_count / job.total_urls * 100), 2) if job.total_urls > 0 else 0,
-                        "current_url": url,
-                        "processed": processed_count,
-                        "total": job.total_urls,
-                    },
-                )
-                
-                # Add new URLs to database for processing
-                for new_url in valid_urls:
-                    normalized_new_url = normalize_url(urljoin(url, new_url))
-                    if urlparse(normalized_new_url).netloc == domain:
-                        existing_node = db.query(UrlNode).filter_by(
-                            url=normalized_new_url, job_id=job.id
-                        ).first()
-                        if not existing_node:
-                            new_url_node = UrlNode(
-                                job_id=job.id,
-                                url=normalized_new_url,
-                                is_external=False,
-                                status_code=None,
-                            )
-                            db.add(new_url_node)
-                db.commit()
 
-        # Finalize
-        job.status = "completed"
-        job.finished_at = datetime.now()
-        db.commit()
+                # Queue newly discovered internal URLs
+                processed += 1
+                queue_links(valid_urls, depth, frontier, ctx.scope)
 
+            if (
+                time.monotonic() - last_checkpoint
+                >= options.checkpoint_interval
+            ):
+                checkpoint(job, writer, db)
+                last_checkpoint = time.monotonic()
+
+        writer.flush()
+
+        # Finalize
+        frontier.clear()
+        if fingerprints is not None:
+            fingerprints.clear()
+        set_job_status(job, db, "completed")
+        start_link_check(job.id, options)
+
+    except SoftTimeLimitExceeded:
+        # Out of time mid-chunk: keep what was fetched and carry on in a new
+        # task; URLs of the interrupted batch are still pending in the DB,
+        # which the new task rebuilds the frontier from
+        logger.info(f"Soft time limit reached for job {job_id}")
+        db.rollback()
+        if job is None:
+            raise
+        if writer is not None:
+            checkpoint(job, writer, db)
+        continue_crawl(job, options, db)
     except Exception as e:
-        job.status = "failed"
-        db.commit()
+        db.rollback()
+        if job is not None:
+            set_job_status(job, db, "failed")
+        else:
+            release_job(job_id)
         raise e
+    finally:
+        if ctx is not None:
+            ctx.close()
+        db.close()
+
+
+@app.task(bind=True)
+def crawl_batch(self, job_id, base_url, options):
+    """Crawl one frontier batch of a distributed job, then chain the next.
+
+    ``crawl_website`` starts ``fanout`` independent chains of this task,
+    within the per-job quota.  Each run claims a batch from the job's Redis
+    frontier, so any number of workers on any number of nodes can share a
+    job; per-host crawl delays are coordinated through a Redis
+    :class:`HostThrottle`.  Every run is a turn at the workers, queued
+    behind the other jobs' tasks, and claims ``weight`` batches' worth of
+    URLs.  The chain whose batch leaves the frontier drained finalizes the
+    job.  Batches are sized to the job's page budget; once it is spent, or
+    the time budget runs out, the pending URLs are dropped and the job
+    finishes the same way.  Batches already in flight may overshoot the
+    page budget.  A failed batch is put back on the frontier, and so is the
+    batch of a worker lost mid-batch once its claim's lease runs out.
+    """
+    options = CrawlOptions.from_dict(options)
+    frontier = RedisFrontier(job_id)
+    db = SessionLocal()
+    try:
+        job = db.query(CrawlJob).filter_by(id=job_id).first()
+        if job is None or job.status != "running":
+            logger.info(f"Job {job_id} is not running, stopping batch chain")
+            drop_batch_context(job_id)
+            return
+        JobScheduler().heartbeat(job_id)
+
+        limit = CrawlBudget(options, job.started_at).batch_limit(
+            options.batch_size * options.weight, job.processed_urls or 0
+        )
+        if not limit:
+            logger.info(f"Job {job_id} is out of budget, finishing it")
+            if frontier.stop():
+                finish_distributed_job(job, options, frontier, db)
+            return
+
+        claim, batch = frontier.claim_batch(limit)
+        if not batch:
+            # Releasing the empty claim finishes a drained frontier, one
+            # whose seeds were all out of scope included; otherwise other
+            # batches in flight, or lost ones put back, may still need it
+            if frontier.release_batch(claim):
+                finish_distributed_job(job, options, frontier, db)
+            elif frontier.inflight > 0 or len(frontier):
+                crawl_batch.apply_async(
+                    args=[job_id, base_url, options.to_dict()],
+                    countdown=BATCH_RETRY_DELAY,
+                    priority=TASK_PRIORITIES[options.queue],
+                )
+            return
+
+        cooldown = 0
+        try:
+            processed, cooldown = crawl_claimed_batch(
+                claim, batch, job, base_url, options, frontier, db
+            )
+            logger.info(f"Batch of job {job_id}: {processed} URLs")
+        except Exception:
+            # Put the batch back for a later turn and keep the chain alive
+            db.rollback()
+            logger.exception(f"Batch of job {job_id} failed")
+            drop_batch_context(job_id)
+            frontier.unclaim(claim)
+        finally:
+            finished = frontier.release_batch(claim)
+
+        if finished:
+            finish_distributed_job(job, options, frontier, db)
+        else:
+            # A cooling host's batch was handed back: come back when it is
+            # ready and leave the worker to other jobs until then
+            crawl_batch.apply_async(
+                args=[job_id, base_url, options.to_dict()],
+                countdown=cooldown,
+                priority=TASK_PRIORITIES[options.queue],
+            )
+    finally:
+        db.close()
+
+
+def finish_distributed_job(job, options, frontier, db):
+    """Complete a distributed job, drop its Redis state and its place"""
+    completed = (
+        db.query(CrawlJob)
+        .filter_by(id=job.id, status="running")
+        .update(
+            {"status": "completed", "finished_at": datetime.now()},
+            synchronize_session=False,
+        )
+    )
+    db.commit()
+    frontier.clear()
+    drop_batch_context(job.id)
+    fingerprints = make_fingerprint_index(options, job.id)
+    if fingerprints is not None:
+        fingerprints.clear()
+    publish_progress(job.id, snapshot(job))
+    release_job(job.id)
+    if completed:
+        start_link_check(job.id, options)
+
+
+def batch_context(job, base_url, options, db):
+    """Return this worker's :class:`CrawlContext` for batches of ``job``.
+
+    The parse pool, fetch engine and session are set up once per worker
+    process and job, and kept while the site's cached robots.txt rules
+    stand; the contexts of the ``BATCH_CONTEXTS`` most recent jobs are
+    kept.  The writer and the previous crawl are bound to ``db``.
+    """
+    robots = load_robots(base_url)
+    ctx = _batch_contexts.pop(job.id, None)
+    if ctx is not None and ctx.robots is not robots:
+        ctx.close()
+        ctx = None
+    writer = GraphWriter(
+        db,
+        job.id,
+        flush_size=options.flush_size,
+        flush_interval=options.flush_interval,
+        progress=ProgressTracker(job.id),
+        recorder=(
+            CrawlRecorder(profile=options.profile)
+            if ctx is None
+            else ctx.recorder
+        ),
+    )
+    if ctx is None:
+        ctx = CrawlContext(
+            options,
+            writer,
+            robots,
+            fingerprints=make_fingerprint_index(options, job.id),
+        )
+        ctx.defer_cooldown = True
+    else:
+        ctx.writer = writer
+    _batch_contexts[job.id] = ctx
+    while len(_batch_contexts) > BATCH_CONTEXTS:
+        _, oldest = _batch_contexts.popitem(last=False)
+        oldest.close()
+
+    ctx.previous = make_previous(job, db)
+    ctx.deferred = []
+    ctx.cooldown = 0
+    return ctx
+
+
+def drop_batch_context(job_id):
+    """Close this worker's batch context of a job, if it has one"""
+    ctx = _batch_contexts.pop(job_id, None)
+    if ctx is not None:
+        ctx.close()
+
+
+def crawl_claimed_batch(claim, batch, job, base_url, options, frontier, db):
+    """Fetch, store and expand a claimed batch.
+
+    URLs whose host is cooling down for longer than ``max_host_wait`` are
+    put back on the frontier.  Returns the number of pages processed and
+    the seconds until the host is ready again (0 if nothing was put back).
+    """
+    ctx = batch_context(job, base_url, options, db)
+    processed = 0
+    for url, depth, valid_urls in process_batch(batch, ctx):
+        processed += 1
+        queue_links(valid_urls, depth, frontier, ctx.scope)
+    ctx.writer.flush()
+    frontier.unclaim(claim, ctx.deferred)
+    return processed, ctx.cooldown
+
+
+def start_link_check(job_id, options):
+    """Queue the external link check of a completed job if it asked for it"""
+    if options.check_external:
+        check_links.delay(job_id, options.to_dict())
+
+
+@app.task(bind=True)
+def check_links(self, job_id, options=None):
+    """Check the external links of a job and store their status codes.
+
+    Only external nodes without a status are checked, so an interrupted
+    check picks up where it stopped: on the soft time limit, it carries on
+    in a new task.
+    """
+    options = CrawlOptions.from_dict(options)
+    checker = LinkChecker(
+        concurrency=options.link_check_concurrency,
+        per_host_concurrency=options.per_host_concurrency,
+        timeout=options.request_timeout,
+    )
+    db = SessionLocal()
+    try:
+        checked = check_external_links(db, job_id, checker)
+        db.query(CrawlJob).filter_by(id=job_id).update(
+            {"links_checked_at": datetime.now()}, synchronize_session=False
+        )
+        db.commit()
+        logger.info(f"Checked {checked} external links of job {job_id}")
+        return checked
+    except SoftTimeLimitExceeded:
+        logger.info(f"Soft time limit reached checking links of {job_id}")
+        db.rollback()
+        check_links.delay(job_id, options.to_dict())
     finally:
         db.close()
 
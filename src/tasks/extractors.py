@@ -0,0 +1,105 @@
+from bs4 import BeautifulSoup
+from collections import namedtuple
+from lxml import etree
+import re
+
+
+# Links assigned or passed to common navigation APIs in inline scripts
+SCRIPT_LINK_RE = re.compile(
+    r"(?:window\.location|href|fetch|axios\.get|url)\s*[=:]\s*['\"]([^'\"]+)"
+)
+
+# libxml2 stops reporting anything after the first </html> end tag, where
+# html.parser and browsers carry on; it closes no element that matters
+# for links, so it is dropped
+HTML_END_RE = re.compile(r"</html\s*>", re.IGNORECASE)
+
+# Raw link values found on a page: ``anchors`` are ``<a href>`` values
+# (self-links already skipped), ``scripts`` are matches of SCRIPT_LINK_RE
+# in inline ``<script>`` bodies.
+Links = namedtuple("Links", ["anchors", "scripts"])
+
+
+def _skip_href(href, url):
+    # Skip common self-links
+    return href.strip() in ("", "#", url)
+
+
+def extract_links_bs4(html, url):
+    """Reference extractor: full ``html.parser`` tree, walked twice"""
+    soup = BeautifulSoup(html, "html.parser")
+
+    anchors = [
+        a["href"]
+        for a in soup.find_all("a", href=True)
+        if not _skip_href(a["href"], url)
+    ]
+
+    scripts = []
+    for script in soup.find_all("script"):
+        if script.string:
+            scripts.extend(SCRIPT_LINK_RE.findall(script.string))
+
+    return Links(anchors, scripts)
+
+
+class _LinkCollector:
+    """lxml parser target that collects links without building a tree"""
+
+    def __init__(self, url):
+        self.url = url
+        self.anchors = []
+        self.scripts = []
+        self._script = None
+
+    def start(self, tag, attrib):
+        if tag == "a":
+            href = attrib.get("href")
+            if href is not None and not _skip_href(href, self.url):
+                self.anchors.append(href)
+        elif tag == "script":
+            self._script = []
+
+    def data(self, data):
+        if self._script is not None:
+            self._script.append(data)
+
+    def end(self, tag):
+        if tag == "script" and self._script is not None:
+            body = "".join(self._script)
+            if body:
+                self.scripts.extend(SCRIPT_LINK_RE.findall(body))
+            self._script = None
+
+    def comment(self, text):
+        pass
+
+    def close(self):
+        return Links(self.anchors, self.scripts)
+
+
+def extract_links_lxml(html, url):
+    """Single-pass extractor driven by libxml2's HTML parser events"""
+    collector = _LinkCollector(url)
+    # Bytes avoid lxml's refusal of str input with an encoding declaration
+    parser = etree.HTMLParser(target=collector, encoding="utf-8")
+    try:
+        parser.feed(HTML_END_RE.sub("", html).encode("utf-8", "replace"))
+        return parser.close()
+    except etree.LxmlError:
+        # Empty or hopelessly broken documents: keep what was collected
+        return collector.close()
+
+
+EXTRACTORS = {
+    "bs4": extract_links_bs4,
+    "lxml": extract_links_lxml,
+}
+
+
+def get_extractor(name):
+    """Return the link extractor registered as ``name``"""
+    try:
+        return EXTRACTORS[name]
+    except KeyError:
+        raise ValueError(f"Unknown link extractor: {name}")
@@ -0,0 +1,414 @@
+from collections import namedtuple
+from urllib.parse import urlparse
+import aiohttp
+import asyncio
+import logging
+import time
+
+
+logger = logging.getLogger("Fetcher")
+
+# Bodies larger than this are abandoned mid-download and never parsed
+MAX_BODY_BYTES = 5 * 1024 * 1024
+BODY_CHUNK = 64 * 1024
+# Only these bodies are downloaded and parsed; a missing Content-Type is
+# given the benefit of the doubt
+HTML_TYPES = ("text/html", "application/xhtml+xml")
+# Widths of the node columns response headers and sitemap dates are stored
+# in.  A validator or a date cut short is wrong, so longer ones are dropped;
+# a content type is cut.
+ETAG_LENGTH = 512
+DATE_LENGTH = 64
+CONTENT_TYPE_LENGTH = 255
+
+
+class FetchResult(
+    namedtuple(
+        "FetchResult",
+        [
+            "url",
+            "status_code",
+            "text",
+            "error",
+            "etag",
+            "last_modified",
+            "content_type",
+            "size",
+            "elapsed_ms",
+            "truncated",
+        ],
+        defaults=(None,) * 6,
+    )
+):
+    """Outcome of one fetch.
+
+    ``text`` is None unless an HTML body was read in full.  ``size`` is the
+    number of body bytes read, or the announced Content-Length of a body
+    that was skipped; ``truncated`` is set when the body exceeded the byte
+    limit.  ``etag`` and ``last_modified`` are the cache validators.
+    """
+
+    __slots__ = ()
+
+    def metadata(self):
+        """Columns of the page's node recorded from this response"""
+        return {
+            "etag": fitting(self.etag, ETAG_LENGTH),
+            "last_modified": fitting(self.last_modified, DATE_LENGTH),
+            "content_type": (
+                self.content_type[:CONTENT_TYPE_LENGTH]
+                if self.content_type
+                else None
+            ),
+            "content_bytes": self.size,
+            "fetch_ms": self.elapsed_ms,
+            "truncated": self.truncated,
+        }
+
+
+def fitting(value, length):
+    """``value`` if it fits a column of ``length`` characters, else None"""
+    if value is None or len(value) > length:
+        return None
+    return value
+
+
+def is_html(content_type):
+    if not content_type:
+        return True
+    return content_type.split(";")[0].strip().lower() in HTML_TYPES
+
+
+def _length(headers):
+    try:
+        return int(headers.get("Content-Length"))
+    except (TypeError, ValueError):
+        return None
+
+
+def _skip_body(headers, max_bytes):
+    """Why a response body should not be downloaded, or None"""
+    if not is_html(headers.get("Content-Type")):
+        return "type"
+    length = _length(headers)
+    if length is not None and length > max_bytes:
+        return "size"
+    return None
+
+
+def _decode(body, encoding):
+    try:
+        return body.decode(encoding or "utf-8", errors="replace")
+    except LookupError:
+        # Unknown charset label
+        return body.decode("utf-8", errors="replace")
+
+
+def _result(url, status, headers, text, size, started, truncated=False):
+    return FetchResult(
+        url,
+        status,
+        text,
+        None,
+        headers.get("ETag"),
+        headers.get("Last-Modified"),
+        headers.get("Content-Type"),
+        size,
+        round((time.perf_counter() - started) * 1000),
+        truncated,
+    )
+
+
+def fetch_url(
+    session,
+    url,
+    timeout=10,
+    max_bytes=MAX_BODY_BYTES,
+    head_first=False,
+    headers=None,
+):
+    """Fetch ``url`` with ``session``, streaming at most ``max_bytes``.
+
+    Non-HTML responses and bodies announced or found to be larger than
+    ``max_bytes`` are not read (or no further), so memory stays bounded.
+    With ``head_first`` a HEAD request vets the URL before the GET.
+    Request errors propagate to the caller.
+    """
+    started = time.perf_counter()
+    if head_first:
+        head = session.head(
+            url, headers=headers, timeout=timeout, allow_redirects=True
+        )
+        skip = head.ok and _skip_body(head.headers, max_bytes)
+        if skip:
+            return _result(
+                url,
+                head.status_code,
+                head.headers,
+                None,
+                _length(head.headers),
+                started,
+                skip == "size",
+            )
+
+    with session.get(
+        url, headers=headers, timeout=timeout, stream=True
+    ) as response:
+        skip = _skip_body(response.headers, max_bytes)
+        if skip:
+            return _result(
+                url,
+                response.status_code,
+                response.headers,
+                None,
+                _length(response.headers),
+                started,
+                skip == "size",
+            )
+        body = bytearray()
+        for chunk in response.iter_content(BODY_CHUNK):
+            body += chunk
+            if len(body) > max_bytes:
+                logger.info(f"Body of {url} exceeds the byte limit")
+                return _result(
+                    url,
+                    response.status_code,
+                    response.headers,
+                    None,
+                    len(body),
+                    started,
+                    True,
+                )
+        text = _decode(body, response.encoding)
+        return _result(
+            url,
+            response.status_code,
+            response.headers,
+            text,
+            len(body),
+            started,
+        )
+
+
+class AsyncFetcher:
+    """Pooled keep-alive HTTP client with global and per-host limits.
+
+    ``concurrency`` caps the number of requests in flight across all hosts,
+    ``per_host_concurrency`` caps them per host and ``host_delay`` spaces
+    consecutive requests to the same host (robots.txt crawl delay) without
+    blocking requests to other hosts.  When a ``throttle`` is given the
+    spacing is shared with other workers instead of kept per process.
+    Time spent waiting for a host is recorded by ``recorder`` as the
+    ``delay`` stage.
+    """
+
+    def __init__(
+        self,
+        concurrency=16,
+        per_host_concurrency=4,
+        timeout=10,
+        host_delay=0,
+        throttle=None,
+        max_bytes=MAX_BODY_BYTES,
+        head_first=False,
+        recorder=None,
+    ):
+        self.concurrency = concurrency
+        self.per_host_concurrency = per_host_concurrency
+        self.timeout = timeout
+        self.host_delay = host_delay
+        self.max_bytes = max_bytes
+        self.head_first = head_first
+        self.throttle = throttle
+        self.recorder = recorder
+        self._session = None
+        self._global = None
+        self._hosts = {}
+        self._host_next = {}
+        self._host_locks = {}
+
+    async def open(self):
+        connector = aiohttp.TCPConnector(
+            limit=self.concurrency,
+            limit_per_host=self.per_host_concurrency,
+            keepalive_timeout=30,
+            ttl_dns_cache=300,
+        )
+        self._session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=self.timeout),
+        )
+        self._global = asyncio.Semaphore(self.concurrency)
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def __aenter__(self):
+        await self.open()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    def _host_semaphore(self, host):
+        if host not in self._hosts:
+            self._hosts[host] = asyncio.Semaphore(self.per_host_concurrency)
+            self._host_locks[host] = asyncio.Lock()
+        return self._hosts[host]
+
+    async def _wait_for_host(self, host):
+        """Reserve the next request slot for ``host`` and sleep until it"""
+        if not self.host_delay:
+            return
+        if self.throttle is not None:
+            # A Redis round trip: keep it off the event loop
+            wait = await asyncio.get_running_loop().run_in_executor(
+                None, self.throttle.reserve, host, self.host_delay
+            )
+        else:
+            async with self._host_locks[host]:
+                now = time.monotonic()
+                start = max(now, self._host_next.get(host, now))
+                self._host_next[host] = start + self.host_delay
+            wait = start - now
+        if wait > 0:
+            await asyncio.sleep(wait)
+            if self.recorder is not None:
+                self.recorder.observe("delay", wait)
+
+    async def fetch(self, url, headers=None):
+        host = urlparse(url).netloc
+        async with self._host_semaphore(host):
+            await self._wait_for_host(host)
+            async with self._global:
+                try:
+                    return await self._fetch(url, headers)
+                except asyncio.TimeoutError:
+                    logger.info(f"Request timeout for URL {url}")
+                    return FetchResult(url, None, None, "timeout")
+                except aiohttp.ClientError as e:
+                    logger.info(f"Request failed for URL {url}: {e}")
+                    return FetchResult(url, None, None, str(e))
+
+    async def _fetch(self, url, headers):
+        """Async counterpart of :func:`fetch_url`"""
+        started = time.perf_counter()
+        if self.head_first:
+            async with self._session.head(
+                url, headers=headers, allow_redirects=True
+            ) as head:
+                skip = head.ok and _skip_body(head.headers, self.max_bytes)
+                if skip:
+                    return _result(
+                        url,
+                        head.status,
+                        head.headers,
+                        None,
+                        _length(head.headers),
+                        started,
+                        skip == "size",
+                    )
+
+        async with self._session.get(url, headers=headers) as response:
+            skip = _skip_body(response.headers, self.max_bytes)
+            if skip:
+                return _result(
+                    url,
+                    response.status,
+                    response.headers,
+                    None,
+                    _length(response.headers),
+                    started,
+                    skip == "size",
+                )
+            body = bytearray()
+            async for chunk in response.content.iter_chunked(BODY_CHUNK):
+                body += chunk
+                if len(body) > self.max_bytes:
+                    logger.info(f"Body of {url} exceeds the byte limit")
+                    return _result(
+                        url,
+                        response.status,
+                        response.headers,
+                        None,
+                        len(body),
+                        started,
+                        True,
+                    )
+            text = _decode(body, response.charset)
+            return _result(
+                url,
+                response.status,
+                response.headers,
+                text,
+                len(body),
+                started,
+            )
+
+    async def fetch_many(self, urls, headers=None):
+        """Fetch ``urls``; ``headers`` maps a URL to its request headers"""
+        headers = headers or {}
+        return await asyncio.gather(
+            *(self.fetch(url, headers.get(url)) for url in urls)
+        )
+
+
+class CrawlEngine:
+    """Runs an :class:`AsyncFetcher` on a private loop for sync callers.
+
+    Celery tasks are synchronous, so the engine keeps one event loop and one
+    client session alive for the whole crawl; connections are reused across
+    batches instead of being re-established for every page.
+    """
+
+    def __init__(self, **kwargs):
+        self._loop = asyncio.new_event_loop()
+        self._fetcher = AsyncFetcher(**kwargs)
+        self._loop.run_until_complete(self._fetcher.open())
+
+    def fetch_many(self, urls, headers=None):
+        return self._loop.run_until_complete(
+            self._fetcher.fetch_many(urls, headers)
+        )
+
+    def iter_fetch(self, urls, headers=None):
+        """Yield the results of ``urls`` as they arrive, in any order.
+
+        Requests only progress while the caller waits for the next result,
+        so each one should be handed off quickly (e.g. to a
+        :class:`~src.tasks.parsing.ParsePool`).  Closing the iterator early
+        cancels the requests still in flight.
+        """
+        headers = headers or {}
+        pending = {
+            self._loop.create_task(self._fetcher.fetch(url, headers.get(url)))
+            for url in urls
+        }
+        try:
+            while pending:
+                done, pending = self._loop.run_until_complete(
+                    asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                )
+                for task in done:
+                    yield task.result()
+        finally:
+            for task in pending:
+                task.cancel()
+            if pending:
+                self._loop.run_until_complete(
+                    asyncio.gather(*pending, return_exceptions=True)
+                )
+
+    def close(self):
+        try:
+            self._loop.run_until_complete(self._fetcher.close())
+        finally:
+            self._loop.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
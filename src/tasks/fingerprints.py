@@ -0,0 +1,296 @@
+from sqlalchemy import select
+from src.models import UrlNode
+from src.redis_client import get_redis
+from src.tasks.frontier import REDIS_KEY_TTL
+import hashlib
+import numpy as np
+
+
+DEDUPE_MODES = ("off", "exact", "near")
+
+# SimHash bits are split into BANDS bands: two fingerprints within
+# BANDS - 1 bits of each other agree on at least one whole band, so the
+# bands are the only lookup keys near-duplicate search needs.
+BANDS = 4
+BAND_BITS = 64 // BANDS
+MAX_DISTANCE = BANDS - 1
+# Originals kept per band value.  Boilerplate-heavy sites put many pages
+# in one band value; capping its bucket keeps every lookup bounded, at the
+# cost of missing near duplicates that agree only on a crowded band.
+BUCKET_SIZE = 64
+
+MASK64 = (1 << 64) - 1
+
+# Byte 8-grams kept for the SimHash, one in SAMPLE_RATE on average, once a
+# page has more than SAMPLE_FLOOR of them
+SAMPLE_RATE = 8
+SAMPLE_FLOOR = 512
+
+# splitmix64 finalizer constants
+_MIX1 = np.uint64(0xBF58476D1CE4E5B9)
+_MIX2 = np.uint64(0x94D049BB133111EB)
+
+# Return the url_hash of the page a fingerprint duplicates, registering the
+# fingerprint as an original if there is none.  Near-duplicate candidates
+# are read from the bands the SimHash falls in and compared band by band
+# with plain arithmetic (a band fits a Lua number exactly).  A near
+# duplicate's content hash is mapped to its original too, so that further
+# exact copies resolve in one lookup.  An original is appended to the
+# buckets holding fewer than ARGV[5] entries.
+_MATCH_SCRIPT = """
+local original = redis.call('HGET', KEYS[1], ARGV[1])
+if original then
+    return original
+end
+local distance = tonumber(ARGV[3])
+local function differ(a, b)
+    local n = 0
+    for _ = 1, 16 do
+        if a % 2 ~= b % 2 then
+            n = n + 1
+        end
+        a = math.floor(a / 2)
+        b = math.floor(b / 2)
+    end
+    return n
+end
+local size = tonumber(ARGV[5])
+local fields = {}
+local band = {}
+for i = 6, #ARGV do
+    fields[#fields + 1] = (i - 6) .. ':' .. ARGV[i]
+    band[#band + 1] = tonumber(ARGV[i])
+end
+local buckets = {}
+local counts = {}
+for f, field in ipairs(fields) do
+    local entries = redis.call('HGET', KEYS[2], field) or ''
+    buckets[f] = entries
+    counts[f] = 0
+    for entry in string.gmatch(entries, '[^;]+') do
+        counts[f] = counts[f] + 1
+        local values = {}
+        for value in string.gmatch(entry, '[^,]+') do
+            values[#values + 1] = value
+        end
+        local n = 0
+        for i = 1, #band do
+            n = n + differ(band[i], tonumber(values[i]))
+            if n > distance then
+                break
+            end
+        end
+        if n <= distance then
+            local other = values[#values]
+            redis.call('HSET', KEYS[1], ARGV[1], other)
+            return other
+        end
+    end
+end
+redis.call('HSET', KEYS[1], ARGV[1], ARGV[2])
+redis.call('EXPIRE', KEYS[1], ARGV[4])
+if #fields > 0 then
+    local entry = table.concat(band, ',') .. ',' .. ARGV[2] .. ';'
+    for f, field in ipairs(fields) do
+        if counts[f] < size then
+            redis.call('HSET', KEYS[2], field, buckets[f] .. entry)
+        end
+    end
+    redis.call('EXPIRE', KEYS[2], ARGV[4])
+end
+return false
+"""
+
+
+def simhash(data):
+    """64-bit SimHash of ``data`` bytes, as a signed integer.
+
+    Features are the distinct byte 8-grams of the (lowercased) page,
+    markup included, so pages with the same text but different links
+    differ, and text repeated on a page weighs no more than once.  They
+    are hashed and counted with numpy: a page costs a fraction of a
+    millisecond, less than extracting its links.
+    """
+    array = np.frombuffer(data, dtype=np.uint8)
+    if len(array) < 8:
+        array = np.frombuffer(data.ljust(8, b"\0"), dtype=np.uint8)
+    # The 8-grams starting at every offset, as little-endian words
+    size = (len(array) - 7) // 8 * 8
+    grams = np.concatenate(
+        [
+            array[offset : offset + size].view(np.uint64)
+            for offset in range(8)
+            if offset + size <= len(array)
+        ]
+    )
+    grams = grams ^ (grams >> np.uint64(30))
+    grams = grams * _MIX1
+    grams = grams ^ (grams >> np.uint64(27))
+    grams = grams * _MIX2
+    grams = grams ^ (grams >> np.uint64(31))
+    if len(grams) > SAMPLE_FLOOR:
+        grams = grams[grams % np.uint64(SAMPLE_RATE) == 0]
+    grams = np.unique(grams)
+    bits = np.unpackbits(grams.view(np.uint8).reshape(-1, 8), axis=1)
+    majority = np.packbits(bits.sum(axis=0) * 2 > len(grams))
+    return int.from_bytes(majority.tobytes(), "little", signed=True)
+
+
+def fingerprint(html, near=True):
+    """Return the ``content_hash`` and ``simhash`` node fields of a body.
+
+    ``content_hash`` identifies the exact body; ``simhash`` is None unless
+    ``near``.
+    """
+    data = html.lower().encode("utf-8", "replace")
+    digest = hashlib.blake2b(data, digest_size=8).digest()
+    return {
+        "content_hash": int.from_bytes(digest, "big", signed=True),
+        "simhash": simhash(data) if near else None,
+    }
+
+
+def distance(a, b):
+    """Number of bits two SimHashes differ in"""
+    return ((a ^ b) & MASK64).bit_count()
+
+
+def bands(value):
+    """The ``BANDS`` band values of a SimHash, as unsigned integers"""
+    value &= MASK64
+    mask = (1 << BAND_BITS) - 1
+    return [(value >> (i * BAND_BITS)) & mask for i in range(BANDS)]
+
+
+class FingerprintIndex:
+    """In-process index of the original pages of a job, by fingerprint.
+
+    :meth:`match` looks a fetched page's fingerprint up and registers it
+    if it matches nothing: the first page seen with a body is its original
+    and later pages with the same body, or a SimHash at most ``distance``
+    bits away, are its duplicates.  Pages are identified by their
+    ``url_hash``.  Each band value keeps at most ``BUCKET_SIZE`` originals.
+    """
+
+    def __init__(self, job_id=None, distance=MAX_DISTANCE):
+        self.job_id = job_id
+        self.distance = distance
+        self._exact = {}
+        self._bands = [{} for _ in range(BANDS)]
+
+    def __len__(self):
+        return len(self._exact)
+
+    def match(self, page_hash, content_hash, simhash=None):
+        """Return the url_hash of the page duplicated, else None"""
+        original = self._exact.get(content_hash)
+        if original is not None:
+            return original
+        if simhash is not None:
+            keys = bands(simhash)
+            for band, key in zip(self._bands, keys):
+                for other, other_page in band.get(key, ()):
+                    if distance(simhash, other) <= self.distance:
+                        self._exact[content_hash] = other_page
+                        return other_page
+        self.add_many([(page_hash, content_hash, simhash)])
+        return None
+
+    def add_many(self, entries):
+        """Register ``(url_hash, content_hash, simhash)`` originals"""
+        for page_hash, content_hash, simhash in entries:
+            self._exact[content_hash] = page_hash
+            if simhash is None:
+                continue
+            for band, key in zip(self._bands, bands(simhash)):
+                bucket = band.setdefault(key, [])
+                if len(bucket) < BUCKET_SIZE:
+                    bucket.append((simhash, page_hash))
+
+    def clear(self):
+        self._exact.clear()
+        for band in self._bands:
+            band.clear()
+
+
+class RedisFingerprintIndex:
+    """:class:`FingerprintIndex` kept in Redis, shared by a job's workers.
+
+    A HASH maps content hashes to url_hashes and another maps each band
+    value to the originals falling in it, stored as
+    ``"band0,band1,band2,band3,url_hash;"`` entries, at most
+    ``BUCKET_SIZE`` of them.  Lookup and registration run as one script,
+    so two workers never both register copies of one body as originals.
+    """
+
+    def __init__(self, job_id, distance=MAX_DISTANCE, client=None):
+        self.job_id = job_id
+        self.distance = distance
+        self.redis = client or get_redis()
+        self.exact_key = f"crawl:{job_id}:fingerprints"
+        self.bands_key = f"crawl:{job_id}:fingerprint_bands"
+        self._match = self.redis.register_script(_MATCH_SCRIPT)
+
+    def __len__(self):
+        return self.redis.hlen(self.exact_key)
+
+    def _args(self, page_hash, content_hash, simhash):
+        args = [
+            content_hash,
+            page_hash,
+            self.distance,
+            REDIS_KEY_TTL,
+            BUCKET_SIZE,
+        ]
+        return args if simhash is None else args + bands(simhash)
+
+    def match(self, page_hash, content_hash, simhash=None):
+        original = self._match(
+            keys=[self.exact_key, self.bands_key],
+            args=self._args(page_hash, content_hash, simhash),
+        )
+        return None if original is None else int(original)
+
+    def add_many(self, entries):
+        pipe = self.redis.pipeline(transaction=False)
+        for entry in entries:
+            self._match(
+                keys=[self.exact_key, self.bands_key],
+                args=self._args(*entry),
+                client=pipe,
+            )
+        pipe.execute()
+
+    def clear(self):
+        self.redis.delete(self.exact_key, self.bands_key)
+
+
+def make_fingerprint_index(options, job_id):
+    """Create the job's fingerprint index, or None without deduplication.
+
+    The index lives where the job's frontier does.
+    """
+    if options.dedupe == "off":
+        return None
+    if options.frontier == "redis":
+        return RedisFingerprintIndex(job_id, options.simhash_distance)
+    return FingerprintIndex(job_id, options.simhash_distance)
+
+
+def restore_fingerprints(job_id, index, db, chunk=10000):
+    """Rebuild a fingerprint index from the original pages stored so far"""
+    index.clear()
+    stmt = select(
+        UrlNode.url_hash, UrlNode.content_hash, UrlNode.simhash
+    ).where(
+        UrlNode.job_id == job_id,
+        UrlNode.content_hash.is_not(None),
+        UrlNode.duplicate_of.is_(None),
+    )
+    entries = []
+    for entry in db.execute(stmt).yield_per(chunk):
+        entries.append(tuple(entry))
+        if len(entries) >= chunk:
+            index.add_many(entries)
+            entries = []
+    index.add_many(entries)
@@ -0,0 +1,374 @@
+from src.redis_client import get_redis
+import heapq
+import itertools
+import time
+import uuid
+
+
+FRONTIERS = ("memory", "redis")
+
+# Frontier keys outlive an interrupted crawl long enough to resume it, but
+# do not leak forever if the job is abandoned.
+REDIS_KEY_TTL = 7 * 24 * 3600
+
+# Seconds a claimed batch may stay in flight, well over the Celery
+# task_time_limit: only the claims of lost workers outlive it
+CLAIM_LEASE = 10 * 60
+
+# Sitemap <priority> of URLs without one, the protocol's default
+DEFAULT_PRIORITY = 0.5
+
+
+def queue_score(depth, priority=None):
+    """Queue order of a URL: shallower first, then higher sitemap priority.
+
+    Priorities lie in [0, 1], so they only order URLs of the same depth.
+    """
+    if priority is None:
+        priority = DEFAULT_PRIORITY
+    return depth * 2 + 1 - min(max(priority, 0.0), 1.0)
+
+
+class MemoryFrontier:
+    """In-process priority frontier with an exact seen-set.
+
+    Every URL ever added is remembered, so :meth:`add` is an O(1) set
+    membership check instead of a database lookup, and each URL is queued
+    at most once per job.  URLs come out in :func:`queue_score` order,
+    first in first out among equals.
+    """
+
+    def __init__(self, job_id=None):
+        self.job_id = job_id
+        self._seen = set()
+        self._queue = []
+        self._order = itertools.count()
+
+    def __len__(self):
+        return len(self._queue)
+
+    @property
+    def seen_count(self):
+        return len(self._seen)
+
+    def _push(self, url, depth, priority):
+        entry = (queue_score(depth, priority), next(self._order), url, depth)
+        heapq.heappush(self._queue, entry)
+
+    def add(self, url, depth=0, priority=None):
+        """Queue ``url`` unless it was seen before; return True if queued"""
+        if url in self._seen:
+            return False
+        self._seen.add(url)
+        self._push(url, depth, priority)
+        return True
+
+    def add_many(self, urls, depth=0, priorities=None):
+        """Queue every unseen URL in ``urls`` and return the new ones.
+
+        ``priorities`` maps URLs to their sitemap priority.
+        """
+        priorities = priorities or {}
+        return [
+            url for url in urls if self.add(url, depth, priorities.get(url))
+        ]
+
+    def mark_seen(self, urls):
+        """Record ``urls`` as seen without queueing them"""
+        self._seen.update(urls)
+
+    def requeue(self, entries, priorities=None):
+        """Queue ``(url, depth)`` pairs even if they were seen before"""
+        priorities = priorities or {}
+        for url, depth in entries:
+            self._seen.add(url)
+            self._push(url, depth, priorities.get(url))
+
+    def pop_batch(self, limit):
+        """Remove and return up to ``limit`` ``(url, depth)`` pairs"""
+        batch = []
+        while self._queue and len(batch) < limit:
+            _, _, url, depth = heapq.heappop(self._queue)
+            batch.append((url, depth))
+        return batch
+
+    def clear(self):
+        self._seen.clear()
+        self._queue.clear()
+
+
+# SADD and ZADD must happen atomically so that two workers sharing a job
+# never queue the same URL twice.  Arguments after the depth and TTL are
+# (url, score) pairs.
+_ADD_SCRIPT = """
+local added = {}
+for i = 3, #ARGV, 2 do
+    if redis.call('SADD', KEYS[1], ARGV[i]) == 1 then
+        redis.call('ZADD', KEYS[2], ARGV[i + 1], ARGV[1] .. ' ' .. ARGV[i])
+        added[#added + 1] = ARGV[i]
+    end
+end
+redis.call('EXPIRE', KEYS[1], ARGV[2])
+redis.call('EXPIRE', KEYS[2], ARGV[2])
+return added
+"""
+
+
+# Put the batches of claims whose lease ran out back on the queue.  Keys
+# are the queue, the claims in flight scored by lease deadline and their
+# entries; ARGV[2] is the current time.  Entries of a claim are stored as
+# its ZPOPMIN reply, members and scores joined by newlines.
+_RECLAIM = """
+local now = tonumber(ARGV[2])
+for _, claim in ipairs(redis.call('ZRANGEBYSCORE', KEYS[2], '-inf', now)) do
+    local entries = redis.call('HGET', KEYS[3], claim)
+    if entries then
+        local values = {}
+        for value in string.gmatch(entries, '[^\\n]+') do
+            values[#values + 1] = value
+        end
+        for i = 1, #values, 2 do
+            redis.call('ZADD', KEYS[1], values[i + 1], values[i])
+        end
+        redis.call('HDEL', KEYS[3], claim)
+    end
+    redis.call('ZREM', KEYS[2], claim)
+end
+"""
+
+# Pop a batch and record it as in flight under its claim in one step, so
+# that a drained queue with nothing in flight really means the crawl is
+# finished.
+_CLAIM_SCRIPT = (
+    _RECLAIM
+    + """
+local popped = redis.call('ZPOPMIN', KEYS[1], ARGV[3])
+local entries = {}
+for i = 1, #popped, 2 do
+    entries[#entries + 1] = popped[i]
+end
+if #entries > 0 then
+    redis.call('ZADD', KEYS[2], ARGV[4], ARGV[5])
+    redis.call('HSET', KEYS[3], ARGV[5], table.concat(popped, '\\n'))
+    redis.call('EXPIRE', KEYS[2], ARGV[1])
+    redis.call('EXPIRE', KEYS[3], ARGV[1])
+end
+return entries
+"""
+)
+
+_RELEASE_SCRIPT = (
+    """
+redis.call('ZREM', KEYS[2], ARGV[3])
+redis.call('HDEL', KEYS[3], ARGV[3])
+"""
+    + _RECLAIM
+    + """
+if redis.call('ZCARD', KEYS[2]) == 0 and redis.call('ZCARD', KEYS[1]) == 0
+then
+    return redis.call('SET', KEYS[4], 1, 'NX', 'EX', ARGV[1]) and 1 or 0
+end
+return 0
+"""
+)
+
+# Put the entries of a claim back on the queue with the scores they were
+# claimed with, so they keep their depth and sitemap priority.  ARGV after
+# the TTL and the claim are the members to put back; all of them if none.
+_UNCLAIM_SCRIPT = """
+local entries = redis.call('HGET', KEYS[2], ARGV[2])
+if not entries then
+    return 0
+end
+local only = {}
+for i = 3, #ARGV do
+    only[ARGV[i]] = true
+end
+local values = {}
+for value in string.gmatch(entries, '[^\\n]+') do
+    values[#values + 1] = value
+end
+local count = 0
+for i = 1, #values, 2 do
+    if #ARGV < 3 or only[values[i]] then
+        redis.call('ZADD', KEYS[1], values[i + 1], values[i])
+        count = count + 1
+    end
+end
+redis.call('EXPIRE', KEYS[1], ARGV[1])
+return count
+"""
+
+# Drop the pending URLs of a job out of budget, and those of lost claims.
+# Batches still in flight finish it when released, as on a drained
+# frontier.
+_STOP_SCRIPT = (
+    _RECLAIM
+    + """
+redis.call('DEL', KEYS[1])
+if redis.call('ZCARD', KEYS[2]) == 0 then
+    return redis.call('SET', KEYS[4], 1, 'NX', 'EX', ARGV[1]) and 1 or 0
+end
+return 0
+"""
+)
+
+
+class RedisFrontier:
+    """Frontier kept in Redis: a SET of seen URLs and a ZSET of pending ones.
+
+    Membership checks are O(1) server-side and the state survives the
+    worker process, so it can be shared by several workers of one job.
+    Queue entries are stored as ``"<depth> <url>"`` members scored by
+    :func:`queue_score`.
+    """
+
+    def __init__(self, job_id, client=None):
+        self.job_id = job_id
+        self.redis = client or get_redis()
+        self.seen_key = f"crawl:{job_id}:seen"
+        self.queue_key = f"crawl:{job_id}:pending"
+        self.inflight_key = f"crawl:{job_id}:inflight"
+        self.claims_key = f"crawl:{job_id}:claims"
+        self.done_key = f"crawl:{job_id}:done"
+        self._batch_keys = [
+            self.queue_key,
+            self.inflight_key,
+            self.claims_key,
+            self.done_key,
+        ]
+        self._add = self.redis.register_script(_ADD_SCRIPT)
+        self._claim = self.redis.register_script(_CLAIM_SCRIPT)
+        self._release = self.redis.register_script(_RELEASE_SCRIPT)
+        self._unclaim = self.redis.register_script(_UNCLAIM_SCRIPT)
+        self._stop = self.redis.register_script(_STOP_SCRIPT)
+
+    def __len__(self):
+        return self.redis.zcard(self.queue_key)
+
+    @property
+    def seen_count(self):
+        return self.redis.scard(self.seen_key)
+
+    def add(self, url, depth=0, priority=None):
+        return bool(self.add_many([url], depth, {url: priority}))
+
+    def add_many(self, urls, depth=0, priorities=None):
+        priorities = priorities or {}
+        args = []
+        for url in urls:
+            args += [url, queue_score(depth, priorities.get(url))]
+        if not args:
+            return []
+        return self._add(
+            keys=[self.seen_key, self.queue_key],
+            args=[depth, REDIS_KEY_TTL, *args],
+        )
+
+    def mark_seen(self, urls):
+        urls = list(urls)
+        if urls:
+            self.redis.sadd(self.seen_key, *urls)
+            self.redis.expire(self.seen_key, REDIS_KEY_TTL)
+
+    def requeue(self, entries, priorities=None):
+        entries = list(entries)
+        if not entries:
+            return
+        priorities = priorities or {}
+        pipe = self.redis.pipeline()
+        pipe.sadd(self.seen_key, *(url for url, _ in entries))
+        pipe.zadd(
+            self.queue_key,
+            {
+                f"{depth} {url}": queue_score(depth, priorities.get(url))
+                for url, depth in entries
+            },
+        )
+        pipe.expire(self.seen_key, REDIS_KEY_TTL)
+        pipe.expire(self.queue_key, REDIS_KEY_TTL)
+        pipe.execute()
+
+    def pop_batch(self, limit):
+        popped = self.redis.zpopmin(self.queue_key, limit)
+        return _decode(entry for entry, _ in popped)
+
+    def claim_batch(self, limit):
+        """Pop a batch for a distributed worker and mark it as in flight.
+
+        Returns ``(claim, batch)``.  Every non-empty claim must be followed
+        by :meth:`release_batch` once the batch's discoveries have been
+        added back to the frontier.  The batch of a claim never released,
+        its worker lost, goes back on the queue once the claim's
+        ``CLAIM_LEASE`` runs out.
+        """
+        claim = uuid.uuid4().hex
+        now = time.time()
+        batch = _decode(
+            self._claim(
+                keys=self._batch_keys,
+                args=[REDIS_KEY_TTL, now, limit, now + CLAIM_LEASE, claim],
+            )
+        )
+        return claim, batch
+
+    def unclaim(self, claim, entries=None):
+        """Put ``(url, depth)`` entries of a claim back on the queue.
+
+        All of the claim's entries by default.  They are queued with the
+        score they were claimed with; the claim stays in flight until
+        :meth:`release_batch`.  Returns the number of entries put back.
+        """
+        members = []
+        if entries is not None:
+            members = [f"{depth} {url}" for url, depth in entries]
+            if not members:
+                return 0
+        return self._unclaim(
+            keys=[self.queue_key, self.claims_key],
+            args=[REDIS_KEY_TTL, claim, *members],
+        )
+
+    def release_batch(self, claim):
+        """Finish a claimed batch; True for exactly one caller once drained"""
+        return bool(
+            self._release(
+                keys=self._batch_keys,
+                args=[REDIS_KEY_TTL, time.time(), claim],
+            )
+        )
+
+    def stop(self):
+        """Drop the pending URLs of a job that ran out of budget.
+
+        True for exactly one caller once no batch is in flight, like
+        :meth:`release_batch` on a drained frontier.
+        """
+        return bool(
+            self._stop(
+                keys=self._batch_keys, args=[REDIS_KEY_TTL, time.time()]
+            )
+        )
+
+    @property
+    def inflight(self):
+        """Claims in flight whose lease has not run out"""
+        return self.redis.zcount(self.inflight_key, time.time(), "+inf")
+
+    def clear(self):
+        self.redis.delete(self.seen_key, *self._batch_keys)
+
+
+def _decode(entries):
+    batch = []
+    for entry in entries:
+        depth, url = entry.split(" ", 1)
+        batch.append((url, int(depth)))
+    return batch
+
+
+def make_frontier(kind, job_id):
+    """Create the frontier backend selected by the job options"""
+    if kind == "redis":
+        return RedisFrontier(job_id)
+    return MemoryFrontier(job_id)
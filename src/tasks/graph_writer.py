@@ -0,0 +1,231 @@
+from sqlalchemy import func
+from sqlalchemy.dialects.postgresql import insert
+from src.instrumentation import CrawlRecorder
+from src.models import UrlNode, UrlEdge
+import logging
+import time
+
+
+logger = logging.getLogger("GraphWriter")
+
+# Rows per executemany INSERT.  Statements take their rows as parameters,
+# not as .values(rows): SQLAlchemy then compiles each statement once and
+# batches the rows into multi-row VALUES itself (insertmanyvalues), where
+# compiling a 1000-row VALUES clause cost more than running it.
+INSERT_CHUNK = 1000
+
+# Node columns recorded from responses and sitemaps; a known value is never
+# replaced by None
+NODE_FIELDS = (
+    "etag",
+    "last_modified",
+    "lastmod",
+    "priority",
+    "content_type",
+    "content_bytes",
+    "fetch_ms",
+    "truncated",
+    "content_hash",
+    "simhash",
+    "duplicate_of",
+)
+
+
+def _chunks(rows, size=INSERT_CHUNK):
+    for i in range(0, len(rows), size):
+        yield rows[i : i + size]
+
+
+class GraphWriter:
+    """Buffers URL nodes and edges and writes them as bulk upserts.
+
+    Nodes are upserted on ``url_hash_unique_per_job`` and edges inserted with
+    ``ON CONFLICT DO NOTHING`` on ``edge_unique``, so a flush costs a handful
+    of statements instead of several round trips per link.  The buffer is
+    flushed once it holds ``flush_size`` rows or ``flush_interval`` seconds
+    after the previous flush, whichever comes first.  With a ``progress``
+    tracker every flush also updates the job's counters in its transaction,
+    and stores the job profile taken from ``recorder`` if it keeps one.
+    """
+
+    def __init__(
+        self,
+        db,
+        job_id,
+        flush_size=2000,
+        flush_interval=5.0,
+        progress=None,
+        recorder=None,
+    ):
+        self.db = db
+        self.job_id = job_id
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.progress = progress
+        self.recorder = recorder or CrawlRecorder()
+        self._nodes = {}
+        self._edges = set()
+        self._last_flush = time.monotonic()
+
+    def __len__(self):
+        return len(self._nodes) + len(self._edges)
+
+    def add_node(
+        self,
+        url,
+        is_external=False,
+        status_code=None,
+        depth=None,
+        in_sitemap=False,
+        **fields,
+    ):
+        """Buffer a node; ``fields`` are values of :data:`NODE_FIELDS`.
+
+        A known status code or field is never replaced by ``None``, a node
+        keeps the smallest depth it was discovered at and stays flagged as
+        a sitemap URL once it was.
+        """
+        unknown = set(fields) - set(NODE_FIELDS)
+        if unknown:
+            raise TypeError(f"Unknown node fields: {sorted(unknown)}")
+        buffered = self._nodes.get(url)
+        if buffered is None:
+            self._nodes[url] = {
+                "is_external": is_external,
+                "status_code": status_code,
+                "depth": depth,
+                "in_sitemap": in_sitemap,
+                **dict.fromkeys(NODE_FIELDS),
+                **fields,
+            }
+            return
+        fields["status_code"] = status_code
+        for name, value in fields.items():
+            if value is not None:
+                buffered[name] = value
+        if depth is not None and (
+            buffered["depth"] is None or depth < buffered["depth"]
+        ):
+            buffered["depth"] = depth
+        buffered["in_sitemap"] = buffered["in_sitemap"] or in_sitemap
+
+    def add_page(
+        self,
+        url,
+        status_code,
+        links,
+        link_type="hyperlink",
+        depth=None,
+        **fields,
+    ):
+        """Buffer a fetched page and its ``(target_url, is_external)`` links.
+
+        ``fields`` are recorded on the page's node, see :meth:`add_node`.
+        """
+        self.add_node(url, status_code=status_code, depth=depth, **fields)
+        target_depth = None if depth is None else depth + 1
+        for target, is_external in links:
+            if target == url:
+                continue
+            self.add_node(target, is_external=is_external, depth=target_depth)
+            self._edges.add((url, target, link_type))
+        self.maybe_flush()
+
+    def maybe_flush(self):
+        if (
+            len(self) >= self.flush_size
+            or time.monotonic() - self._last_flush >= self.flush_interval
+        ):
+            self.flush()
+
+    def flush(self):
+        """Write all buffered nodes and edges and commit"""
+        self._last_flush = time.monotonic()
+        if not self._nodes:
+            return
+        started = time.perf_counter()
+
+        # Sorted rows keep lock order stable between concurrent writers.
+        nodes = UrlNode.__table__
+        node_rows = [
+            {"job_id": self.job_id, "url": url, **node}
+            for url, node in sorted(self._nodes.items())
+        ]
+        node_ids = {}
+        new_nodes = []
+        conflict = [nodes.c.job_id, nodes.c.url_hash]
+        for chunk in _chunks(node_rows):
+            # Only rows this statement inserts come back: those are new
+            stmt = (
+                insert(nodes)
+                .on_conflict_do_nothing(index_elements=conflict)
+                .returning(nodes.c.url, nodes.c.id, nodes.c.is_external)
+            )
+            for url, node_id, is_external in self.db.execute(stmt, chunk):
+                node_ids[url] = node_id
+                new_nodes.append((url, is_external))
+
+            # The others already exist: merge the buffered fields into them
+            existing = [row for row in chunk if row["url"] not in node_ids]
+            if not existing:
+                continue
+            stmt = insert(nodes)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=conflict,
+                set_={
+                    "status_code": func.coalesce(
+                        stmt.excluded.status_code, nodes.c.status_code
+                    ),
+                    "depth": func.least(stmt.excluded.depth, nodes.c.depth),
+                    "in_sitemap": stmt.excluded.in_sitemap
+                    | nodes.c.in_sitemap,
+                    **{
+                        name: func.coalesce(stmt.excluded[name], nodes.c[name])
+                        for name in NODE_FIELDS
+                    },
+                },
+            ).returning(nodes.c.url, nodes.c.id)
+            node_ids.update(self.db.execute(stmt, existing).all())
+
+        edges = UrlEdge.__table__
+        edge_rows = [
+            {
+                "job_id": self.job_id,
+                "source_id": node_ids[source],
+                "target_id": node_ids[target],
+                "link_type": link_type,
+            }
+            for source, target, link_type in sorted(self._edges)
+        ]
+        stmt = insert(edges).on_conflict_do_nothing(
+            index_elements=[
+                edges.c.job_id,
+                edges.c.source_id,
+                edges.c.target_id,
+            ]
+        )
+        for chunk in _chunks(edge_rows):
+            self.db.execute(stmt, chunk)
+
+        self.recorder.observe("db_write", time.perf_counter() - started)
+        snapshot = None
+        if self.progress is not None:
+            pages = [
+                (row["status_code"], row["depth"])
+                for row in node_rows
+                if row["status_code"] is not None
+            ]
+            snapshot = self.progress.record_flush(
+                self.db, pages, new_nodes, self.recorder.take_profile()
+            )
+
+        with self.recorder.stage("commit"):
+            self.db.commit()
+        if self.progress is not None:
+            self.progress.publish(snapshot)
+        logger.info(
+            f"Flushed graph {self.job_id}: "
+            f"{len(node_rows)} nodes, {len(edge_rows)} edges"
+        )
+        self._nodes.clear()
+        self._edges.clear()
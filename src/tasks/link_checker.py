@@ -0,0 +1,168 @@
+from sqlalchemy import BigInteger, Integer, column, update, values
+from src.models import UrlNode
+from src.redis_client import get_redis
+from urllib.parse import urlparse
+import aiohttp
+import asyncio
+import hashlib
+import logging
+import redis
+
+
+logger = logging.getLogger("LinkChecker")
+
+# Check results are shared by all jobs for LINK_CHECK_TTL seconds
+LINK_CHECK_TTL = 3600
+# External nodes loaded, checked and written back at a time
+CHECK_CHUNK = 2000
+# Rows per bulk UPDATE
+UPDATE_CHUNK = 1000
+# Status recorded when no response came back, as for crawled pages
+NO_RESPONSE = -1
+
+
+def _cache_key(url):
+    return f"linkcheck:{hashlib.sha1(url.encode('utf-8')).hexdigest()}"
+
+
+class LinkChecker:
+    """Concurrent HTTP status checks of external URLs.
+
+    Each URL gets a HEAD request, redirects followed; a failing HEAD is
+    retried as a GET, because many servers answer HEAD wrongly.  Bodies
+    are never read.  ``concurrency`` caps requests in flight and
+    ``per_host_concurrency`` those to a single host.
+    """
+
+    def __init__(self, concurrency=64, per_host_concurrency=2, timeout=10):
+        self.concurrency = concurrency
+        self.per_host_concurrency = per_host_concurrency
+        self.timeout = timeout
+
+    async def _status(self, session, url):
+        try:
+            async with session.head(url, allow_redirects=True) as response:
+                if response.status < 400:
+                    return response.status
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            pass
+        try:
+            async with session.get(url, allow_redirects=True) as response:
+                return response.status
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+            logger.info(f"Link check failed for {url}: {e!r}")
+            return NO_RESPONSE
+
+    async def check_many(self, urls):
+        """Return ``{url: status_code}`` for ``urls``"""
+        connector = aiohttp.TCPConnector(
+            limit=self.concurrency,
+            limit_per_host=self.per_host_concurrency,
+            ttl_dns_cache=300,
+        )
+        # aiohttp's timeout includes waiting for a pooled connection, so
+        # requests queue on semaphores before they reach the connector
+        in_flight = asyncio.Semaphore(self.concurrency)
+        hosts = {}
+
+        async def check(session, url):
+            host = urlparse(url).netloc
+            if host not in hosts:
+                hosts[host] = asyncio.Semaphore(self.per_host_concurrency)
+            async with hosts[host], in_flight:
+                return url, await self._status(session, url)
+
+        async with aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=self.timeout),
+        ) as session:
+            return dict(
+                await asyncio.gather(*(check(session, url) for url in urls))
+            )
+
+    def check(self, urls):
+        """Synchronous :meth:`check_many`"""
+        return asyncio.run(self.check_many(urls))
+
+
+def cached_statuses(urls, client):
+    """Return the ``{url: status_code}`` of ``urls`` checked recently"""
+    try:
+        cached = client.mget([_cache_key(url) for url in urls])
+    except redis.RedisError as e:
+        logger.warning(f"Link check cache unavailable: {e}")
+        return {}
+    return {
+        url: int(status)
+        for url, status in zip(urls, cached)
+        if status is not None
+    }
+
+
+def cache_statuses(statuses, client):
+    try:
+        pipe = client.pipeline()
+        for url, status in statuses.items():
+            pipe.set(_cache_key(url), status, ex=LINK_CHECK_TTL)
+        pipe.execute()
+    except redis.RedisError as e:
+        logger.warning(f"Link check cache unavailable: {e}")
+
+
+def write_statuses(db, job_id, rows):
+    """Set the status of ``(node_id, status_code)`` rows, in bulk"""
+    nodes = UrlNode.__table__
+    for i in range(0, len(rows), UPDATE_CHUNK):
+        checked = values(
+            column("id", BigInteger),
+            column("status", Integer),
+            name="checked",
+        ).data(rows[i : i + UPDATE_CHUNK])
+        db.execute(
+            update(nodes)
+            .where(nodes.c.job_id == job_id, nodes.c.id == checked.c.id)
+            .values(status_code=checked.c.status)
+        )
+
+
+def check_external_links(db, job_id, checker, client=None):
+    """Check every unchecked external node of a job; return the count.
+
+    Nodes are processed in chunks: statuses cached by any job are reused,
+    the rest are checked concurrently and cached, and the chunk's statuses
+    are written back in one transaction.
+    """
+    r = client or get_redis()
+    checked = 0
+    after_id = 0
+    while True:
+        nodes = (
+            db.query(UrlNode.id, UrlNode.url)
+            .filter(
+                UrlNode.job_id == job_id,
+                UrlNode.status_code.is_(None),
+                UrlNode.is_external.is_(True),
+                UrlNode.id > after_id,
+            )
+            .order_by(UrlNode.id)
+            .limit(CHECK_CHUNK)
+            .all()
+        )
+        if not nodes:
+            break
+        urls = [url for _, url in nodes]
+        statuses = cached_statuses(urls, r)
+        fresh = checker.check([url for url in urls if url not in statuses])
+        cache_statuses(fresh, r)
+        statuses.update(fresh)
+        write_statuses(
+            db, job_id, [(node_id, statuses[url]) for node_id, url in nodes]
+        )
+        db.commit()
+        checked += len(nodes)
+        after_id = nodes[-1].id
+        logger.info(
+            f"Checked {checked} external links of job {job_id} "
+            f"({len(urls) - len(fresh)} cached)"
+        )
+    return checked
@@ -0,0 +1,174 @@
+from functools import lru_cache
+from urllib.parse import urljoin, urlsplit, parse_qsl, urlencode
+
+
+# Query handling: drop it (the crawler's historical behaviour), keep it as
+# is, or keep it with its parameters sorted so that reordered queries
+# collapse into one URL.
+QUERY_MODES = ("drop", "keep", "sort")
+
+DEFAULT_PORTS = {"http": "80", "https": "443"}
+
+# Width of the url column of url_nodes
+MAX_URL_LENGTH = 2000
+
+# Normalized URLs memoized per normalizer; nav links repeat on every page
+# of a site, so even a modest cache absorbs most calls.
+CACHE_SIZE = 65536
+# Pages whose base URL split is memoized; links of a page come together
+BASE_CACHE_SIZE = 1024
+
+
+def remove_dot_segments(path):
+    """Resolve ``.`` and ``..`` segments (RFC 3986, section 5.2.4)"""
+    if "." not in path:
+        return path
+    output = []
+    for segment in path.split("/"):
+        if segment == "..":
+            if len(output) > 1:
+                output.pop()
+        elif segment != ".":
+            output.append(segment)
+    # A trailing dot segment still denotes a directory
+    if path.endswith(("/.", "/..")):
+        output.append("")
+    return "/".join(output)
+
+
+class Normalizer:
+    """Turns raw links into canonical absolute URLs.
+
+    Every URL is reduced to ``scheme://host[:port]/path[?query]``: the
+    fragment is dropped, scheme and host are lowercased, default ports are
+    removed, dot segments are resolved and a trailing slash is stripped.
+    Links that are not ``http``/``https`` (``mailto:``, ``javascript:``
+    ...) or longer than ``MAX_URL_LENGTH`` normalize to ``None``.  Results
+    are memoized in bounded LRU caches of ``cache_size`` entries: one by
+    absolute URL, one by relative link and the part of its base URL it
+    resolves against (see :meth:`_scope`), so that the join is memoized
+    too.
+    """
+
+    def __init__(
+        self,
+        query="drop",
+        lowercase_host=True,
+        strip_default_port=True,
+        resolve_dots=True,
+        strip_trailing_slash=True,
+        cache_size=CACHE_SIZE,
+    ):
+        if query not in QUERY_MODES:
+            raise ValueError(f"Unknown query mode: {query}")
+        self.query = query
+        self.lowercase_host = lowercase_host
+        self.strip_default_port = strip_default_port
+        self.resolve_dots = resolve_dots
+        self.strip_trailing_slash = strip_trailing_slash
+        self._cached = lru_cache(maxsize=cache_size)(self._normalize)
+        self._joined = lru_cache(maxsize=cache_size)(self._join)
+        self._bases = lru_cache(maxsize=BASE_CACHE_SIZE)(self._split_base)
+
+    def __call__(self, url, base=None):
+        """Normalize ``url``, resolved against ``base`` if it is relative"""
+        if base is None or url.startswith(("http://", "https://")):
+            return self._cached(url)
+        url = url.strip()
+        return self._joined(self._scope(url, base), url)
+
+    def normalize_many(self, urls, base=None):
+        """Normalize ``urls`` found on ``base``.
+
+        Returns the distinct normalized URLs in order of first appearance;
+        links that do not normalize are left out.
+        """
+        normalized = dict.fromkeys(self(url, base) for url in urls)
+        normalized.pop(None, None)
+        return list(normalized)
+
+    def cache_info(self):
+        return self._cached.cache_info()
+
+    def join_cache_info(self):
+        return self._joined.cache_info()
+
+    def _scope(self, url, base):
+        # The part of ``base`` that resolving ``url`` depends on: the site
+        # root for root- and scheme-relative links, the directory for
+        # relative paths, all of it for query, fragment and empty links
+        if url.startswith("//") and url[2:3] in ("", "?", "#"):
+            # No host after all: resolved like a query or fragment link
+            return base
+        if url.startswith("/"):
+            return self._bases(base)[0]
+        if not url or url[0] in "?#":
+            return base
+        return self._bases(base)[1]
+
+    def _split_base(self, base):
+        """The site root and directory URLs of ``base``"""
+        parts = urlsplit(base)
+        root = f"{parts.scheme}://{parts.netloc}/"
+        path = parts.path[: parts.path.rfind("/") + 1] or "/"
+        return root, f"{parts.scheme}://{parts.netloc}{path}"
+
+    def _join(self, scope, url):
+        return self._cached(urljoin(scope, url))
+
+    def _normalize(self, url):
+        parts = urlsplit(url.strip())
+        scheme = parts.scheme.lower()
+        if scheme not in DEFAULT_PORTS or not parts.netloc:
+            return None
+
+        netloc = parts.netloc
+        if self.lowercase_host or self.strip_default_port:
+            userinfo, _, hostport = netloc.rpartition("@")
+            host, colon, port = hostport.partition(":")
+            if hostport.startswith("["):
+                # IPv6 literal: the port follows the closing bracket
+                host, _, port = hostport.partition("]")
+                host += "]"
+                colon = ":" if port.startswith(":") else ""
+                port = port[1:]
+            if self.lowercase_host:
+                host = host.lower()
+            if self.strip_default_port and port == DEFAULT_PORTS[scheme]:
+                colon = port = ""
+            netloc = host + colon + port
+            if userinfo:
+                netloc = f"{userinfo}@{netloc}"
+
+        path = parts.path
+        if self.resolve_dots:
+            path = remove_dot_segments(path)
+        if self.strip_trailing_slash:
+            path = path.rstrip("/")
+
+        url = f"{scheme}://{netloc}{path}"
+        if parts.query and self.query != "drop":
+            query = parts.query
+            if self.query == "sort":
+                query = urlencode(
+                    sorted(parse_qsl(query, keep_blank_values=True))
+                )
+            url = f"{url}?{query}"
+        if len(url) > MAX_URL_LENGTH:
+            return None
+        return url
+
+
+_normalizers = {}
+
+
+def get_normalizer(**rules):
+    """Return the shared :class:`Normalizer` for ``rules``.
+
+    Normalizers are kept per worker process so that their memo survives
+    from one crawl task to the next.
+    """
+    key = tuple(sorted(rules.items()))
+    if key not in _normalizers:
+        _normalizers[key] = Normalizer(**rules)
+    return _normalizers[key]
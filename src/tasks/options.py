@@ -0,0 +1,161 @@
+from dataclasses import dataclass, asdict, fields
+from src.tasks.extractors import EXTRACTORS
+from src.tasks.fingerprints import DEDUPE_MODES, MAX_DISTANCE
+from src.tasks.frontier import FRONTIERS
+from src.tasks.normalization import QUERY_MODES
+from src.tasks.scheduler import JOB_QUEUES, MAX_WEIGHT
+from src.tasks.scope import compile_patterns
+
+
+ENGINES = ("sync", "async")
+MODES = ("single", "distributed")
+
+
+@dataclass
+class CrawlOptions:
+    """Per-job crawl settings, stored on the job and passed to the task"""
+
+    engine: str = "sync"
+    extractor: str = "lxml"
+    concurrency: int = 16
+    per_host_concurrency: int = 4
+    request_timeout: float = 10.0
+    # Seconds between requests to a host whose robots.txt sets no
+    # Crawl-delay (0 disables it)
+    crawl_delay: float = 1.0
+    # Bodies over this size are abandoned; HEAD first to skip non-HTML
+    # URLs without opening a body at all
+    max_bytes: int = 5 * 1024 * 1024
+    head_first: bool = False
+    # Processes parsing fetched pages while fetching goes on (0 parses
+    # inline), and fetched pages that may wait for them
+    parse_workers: int = 0
+    parse_queue: int = 32
+    flush_size: int = 2000
+    flush_interval: float = 5.0
+    frontier: str = "memory"
+    mode: str = "single"
+    fanout: int = 4
+    batch_size: int = 50
+    checkpoint_interval: float = 60.0
+    # Hand over to a fresh task after this many seconds, keeping the
+    # frontier in Redis between turns; keep it below the Celery
+    # task_time_limit.  Off (0) by default: long crawls still continue in
+    # a fresh task at the soft time limit, from their checkpoint
+    chunk_seconds: float = 0.0
+    # Longest crawl-delay wait a sync distributed batch sleeps through;
+    # longer waits hand the batch back to the frontier
+    max_host_wait: float = 5.0
+    # How URL queries are canonicalized, see Normalizer
+    url_query: str = "drop"
+    # Reuse unchanged pages of the latest completed crawl of the same URL
+    recrawl: bool = False
+    # Check the status of external links once the crawl completes
+    check_external: bool = False
+    link_check_concurrency: int = 64
+    # Keep a per-stage time and counter profile of the job
+    profile: bool = False
+    # Skip link extraction on pages whose body duplicates an earlier page's
+    # exactly ("exact") or within simhash_distance SimHash bits ("near")
+    dedupe: str = "off"
+    simhash_distance: int = 3
+    # Crawl scope and budget, see CrawlScope and CrawlBudget: deepest link
+    # depth followed, pages and seconds spent (0: no limit) and URL regular
+    # expressions to stay within and to skip
+    max_depth: int = 0
+    max_pages: int = 0
+    max_seconds: float = 0.0
+    include: tuple = ()
+    exclude: tuple = ()
+    # Scheduling, see JobScheduler: the job's queue and its share of the
+    # workers relative to other running jobs
+    queue: str = "interactive"
+    weight: int = 1
+
+    def __post_init__(self):
+        if self.engine not in ENGINES:
+            raise ValueError(f"Unknown crawl engine: {self.engine}")
+        if self.extractor not in EXTRACTORS:
+            raise ValueError(f"Unknown link extractor: {self.extractor}")
+        if (
+            self.concurrency < 1
+            or self.per_host_concurrency < 1
+            or self.link_check_concurrency < 1
+        ):
+            raise ValueError("Concurrency limits must be positive")
+        if self.per_host_concurrency > self.concurrency:
+            self.per_host_concurrency = self.concurrency
+        if self.mode not in MODES:
+            raise ValueError(f"Unknown crawl mode: {self.mode}")
+        if self.frontier not in FRONTIERS:
+            raise ValueError(f"Unknown frontier: {self.frontier}")
+        if self.mode == "distributed" or self.chunk_seconds:
+            # Batch tasks on other workers, or the next turn of a chunked
+            # crawl, must see the same frontier
+            self.frontier = "redis"
+        if self.chunk_seconds < 0:
+            raise ValueError("Chunk length cannot be negative")
+        if self.fanout < 1 or self.batch_size < 1:
+            raise ValueError("Fanout and batch size must be positive")
+        if self.url_query not in QUERY_MODES:
+            raise ValueError(f"Unknown URL query mode: {self.url_query}")
+        if self.crawl_delay < 0:
+            raise ValueError("Crawl delay cannot be negative")
+        if self.max_bytes < 1:
+            raise ValueError("Max body size must be positive")
+        if self.parse_workers < 0 or self.parse_queue < 1:
+            raise ValueError("Bad parse workers or queue size")
+        if self.flush_size < 1:
+            raise ValueError("Flush size must be positive")
+        if self.dedupe not in DEDUPE_MODES:
+            raise ValueError(f"Unknown dedupe mode: {self.dedupe}")
+        if not 0 <= self.simhash_distance <= MAX_DISTANCE:
+            raise ValueError(
+                f"SimHash distance must be between 0 and {MAX_DISTANCE}"
+            )
+        if self.max_depth < 0 or self.max_pages < 0 or self.max_seconds < 0:
+            raise ValueError("Crawl limits must not be negative")
+        self.include = _coerce(tuple, self.include)
+        self.exclude = _coerce(tuple, self.exclude)
+        compile_patterns(self.include + self.exclude)
+        if self.queue not in JOB_QUEUES:
+            raise ValueError(f"Unknown job queue: {self.queue}")
+        if not 1 <= self.weight <= MAX_WEIGHT:
+            raise ValueError(f"Weight must be between 1 and {MAX_WEIGHT}")
+
+    @classmethod
+    def from_dict(cls, data=None):
+        """Build options from a dict or form, ignoring unknown/empty keys.
+
+        Values are coerced to the declared field types so that the same
+        helper works for JSON payloads and HTML form submissions.
+        """
+        if isinstance(data, cls):
+            return data
+        kwargs = {}
+        for field in fields(cls):
+            value = (data or {}).get(field.name)
+            if value is None or value == "":
+                continue
+            kwargs[field.name] = _coerce(field.type, value)
+        return cls(**kwargs)
+
+    def to_dict(self):
+        return asdict(self)
+
+
+def _coerce(kind, value):
+    if kind in (bool, "bool"):
+        if isinstance(value, str):
+            return value.lower() in ("1", "true", "yes", "on")
+        return bool(value)
+    if kind in (int, "int"):
+        return int(value)
+    if kind in (float, "float"):
+        return float(value)
+    if kind in (tuple, "tuple"):
+        # One item per line of a form's textarea
+        if isinstance(value, str):
+            value = value.splitlines()
+        return tuple(item.strip() for item in value if item.strip())
+    return value
@@ -0,0 +1,50 @@
+# Page parsing, as run by parser processes.  Spawned parser processes
+# import this module to unpickle their work, so it depends only on the
+# extractors and the normalizer: not on the crawler, and through it on
+# SQLAlchemy, Celery, Redis and Prometheus.
+
+from itertools import chain
+from src.tasks.extractors import get_extractor
+from src.tasks.normalization import get_normalizer
+from urllib.parse import urlparse
+import time
+
+
+def parse_links(html, url, extract, normalize):
+    """Extract, normalize and classify the links of a page.
+
+    Returns the ``(absolute_url, is_external)`` targets of the page,
+    self-links skipped, the set of its internal links and the seconds
+    spent parsing the HTML and extracting links from what it found.
+    """
+    started = time.perf_counter()
+    domain = urlparse(url).netloc
+
+    # Find all links: HTML anchors and JavaScript links (static analysis)
+    found = extract(html, url)
+    parsed = time.perf_counter()
+    links = normalize.normalize_many(chain(found.anchors, found.scripts), url)
+
+    internal = set()
+    targets = []
+    for absolute_url in links:
+        # Skip self-links
+        if absolute_url == url:
+            continue
+        is_external = urlparse(absolute_url).netloc != domain
+        if not is_external:
+            internal.add(absolute_url)
+        targets.append((absolute_url, is_external))
+    timings = (parsed - started, time.perf_counter() - parsed)
+    return targets, internal, timings
+
+
+def parse_page(extractor, url_query, html, url):
+    """:func:`parse_links` by extractor and query mode names.
+
+    Runs in parser processes, where extractors and normalizers are looked
+    up (and their memos kept) per process.
+    """
+    return parse_links(
+        html, url, get_extractor(extractor), get_normalizer(query=url_query)
+    )
@@ -0,0 +1,148 @@
+from collections import deque
+from concurrent.futures import CancelledError, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from src.instrumentation import CrawlRecorder
+from src.tasks.extractors import get_extractor
+from src.tasks.normalization import get_normalizer
+from src.tasks.parse_worker import parse_links, parse_page
+import logging
+import multiprocessing
+
+
+logger = logging.getLogger("Parsing")
+
+
+_executors = {}
+
+
+def get_executor(workers):
+    """Return the process-wide parser pool of ``workers`` processes.
+
+    Pools outlive crawl tasks, so worker processes are started once per
+    Celery worker rather than once per batch.  They are spawned, not
+    forked, so that they inherit no database or Redis connections.
+    Returns None once processes turned out not to start here.
+    """
+    if workers not in _executors:
+        _executors[workers] = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return _executors[workers]
+
+
+def discard_executor(workers, disable=False):
+    """Shut down a broken parser pool.
+
+    The next :func:`get_executor` call starts a fresh one, unless
+    ``disable`` is set: then the process parses inline from now on.
+    """
+    executor = _executors.pop(workers, None)
+    if executor is not None:
+        executor.shutdown(wait=False, cancel_futures=True)
+    if disable:
+        _executors[workers] = None
+
+
+class ParsePool:
+    """The parse stage of the crawl pipeline.
+
+    Fetched pages are handed to :meth:`submit` and parsed by ``workers``
+    processes while the caller goes on fetching; finished pages come back
+    in submission order.  At most ``max_pending`` pages wait for a parser:
+    past that :meth:`submit` blocks on the oldest one, which holds fetching
+    back when parsing falls behind.  Parse and extract times measured by
+    the workers are recorded by ``recorder``.
+
+    With no workers, or when the processes cannot be started (e.g. in a
+    daemonic worker process), pages are parsed inline on submission.
+    """
+
+    def __init__(
+        self, extractor, url_query, workers=0, max_pending=32, recorder=None
+    ):
+        self.extractor = extractor
+        self.url_query = url_query
+        self.workers = workers
+        self.max_pending = max_pending
+        self.recorder = recorder or CrawlRecorder()
+        self.extract = get_extractor(extractor)
+        self.normalize = get_normalizer(query=url_query)
+        self.executor = get_executor(workers) if workers else None
+        if workers and self.executor is None:
+            logger.warning(
+                f"Parser processes cannot start here, parsing inline "
+                f"instead of in {workers} processes"
+            )
+        self._pending = deque()
+
+    def __len__(self):
+        return len(self._pending)
+
+    def _record(self, parsed):
+        targets, internal, (parse_seconds, extract_seconds) = parsed
+        self.recorder.observe("parse", parse_seconds)
+        self.recorder.observe("extract", extract_seconds)
+        return targets, internal
+
+    def parse(self, url, html):
+        """Parse a page inline; return its targets and internal links"""
+        return self._record(
+            parse_links(html, url, self.extract, self.normalize)
+        )
+
+    def _fall_back(self, error, disable=False):
+        logger.warning(f"Parser pool unavailable, parsing inline: {error!r}")
+        discard_executor(self.workers, disable)
+        self.executor = None
+
+    def submit(self, url, html, tag=None):
+        """Queue a page for parsing; return the pages finished meanwhile.
+
+        Finished pages are ``(url, tag, (targets, internal_links))``
+        tuples; ``tag`` is passed through untouched.
+        """
+        if self.executor is not None:
+            try:
+                future = self.executor.submit(
+                    parse_page, self.extractor, self.url_query, html, url
+                )
+            except (AssertionError, OSError) as e:
+                # Processes cannot be started from this one
+                self._fall_back(e, disable=True)
+            except BrokenProcessPool as e:
+                self._fall_back(e)
+            else:
+                self._pending.append((url, html, tag, future))
+        if self.executor is None:
+            # Earlier pages go first to keep submission order
+            return self.drain() + [(url, tag, self.parse(url, html))]
+
+        done = []
+        while self._pending and (
+            self._pending[0][3].done() or len(self._pending) > self.max_pending
+        ):
+            done.append(self._finish(*self._pending.popleft()))
+        return done
+
+    def _finish(self, url, html, tag, future):
+        try:
+            return url, tag, self._record(future.result())
+        except (BrokenProcessPool, CancelledError) as e:
+            # A parser died (e.g. out of memory): parse what it held here
+            if self.executor is not None:
+                self._fall_back(e)
+            return url, tag, self.parse(url, html)
+
+    def drain(self):
+        """Wait for and return every page still being parsed"""
+        done = []
+        while self._pending:
+            done.append(self._finish(*self._pending.popleft()))
+        return done
+
+    def close(self):
+        """Drop pages still queued; the shared processes keep running"""
+        for *_, future in self._pending:
+            future.cancel()
+        self._pending.clear()
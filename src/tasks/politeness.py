@@ -0,0 +1,188 @@
+from robotexclusionrulesparser import RobotExclusionRulesParser
+from src.redis_client import get_redis
+from urllib.parse import urlparse
+import logging
+import redis
+import requests
+import threading
+import time
+
+
+logger = logging.getLogger("Politeness")
+
+# robots.txt bodies are shared by all jobs and workers for ROBOTS_TTL
+# seconds; parsed rules are kept in process for as long as their body.
+ROBOTS_TTL = 3600
+ROBOTS_TIMEOUT = 10
+# An unreachable robots.txt disallows the site for this long only
+ROBOTS_ERROR_TTL = 60
+DISALLOW_ALL = "User-agent: *\nDisallow: /\n"
+
+# Reserve the next fetch slot for a host: the slot starts at the later of
+# "now" and the host's stored next-allowed time, and the stored time moves
+# one delay past it.  Returns the milliseconds to wait for the slot.
+_RESERVE_SCRIPT = """
+local t = redis.call('TIME')
+local now = t[1] * 1000 + math.floor(t[2] / 1000)
+local start = tonumber(redis.call('GET', KEYS[1]) or now)
+if start < now then
+    start = now
+end
+local delay = tonumber(ARGV[1])
+redis.call('SET', KEYS[1], start + delay, 'PX', delay + 60000)
+return start - now
+"""
+
+# Take the host's fetch slot only if it is free now; otherwise leave it
+# untouched and return the milliseconds until it frees up.
+_ACQUIRE_SCRIPT = """
+local t = redis.call('TIME')
+local now = t[1] * 1000 + math.floor(t[2] / 1000)
+local free = tonumber(redis.call('GET', KEYS[1]) or now)
+if free > now then
+    return free - now
+end
+local delay = tonumber(ARGV[1])
+redis.call('SET', KEYS[1], now + delay, 'PX', delay + 60000)
+return 0
+"""
+
+
+class HostThrottle:
+    """Per-host request spacing shared by every worker through Redis.
+
+    The next allowed fetch time of each host is kept in Redis, so all jobs
+    and workers hitting a host share its crawl delay.  :meth:`reserve`
+    queues up for a future slot (callers sleep without blocking other
+    work, as the async engine does); :meth:`acquire` only takes a slot that
+    is free now, letting sync callers work on something else meanwhile.
+    While Redis is unavailable requests are spaced per process instead.
+    """
+
+    def __init__(self, client=None):
+        self.redis = client or get_redis()
+        self._reserve = self.redis.register_script(_RESERVE_SCRIPT)
+        self._acquire = self.redis.register_script(_ACQUIRE_SCRIPT)
+        # Next free time of each host, used while Redis is unavailable
+        self._local = {}
+        self._lock = threading.Lock()
+        self._degraded = False
+
+    def _local_slot(self, host, delay, queue):
+        with self._lock:
+            now = time.monotonic()
+            free = self._local.get(host, now)
+            if free > now and not queue:
+                return free - now
+            start = max(now, free)
+            self._local[host] = start + delay
+            return start - now
+
+    def _slot(self, script, host, delay, queue):
+        if not delay:
+            return 0
+        try:
+            wait_ms = script(
+                keys=[f"crawl:host:{host}:next"], args=[int(delay * 1000)]
+            )
+        except redis.RedisError as e:
+            if not self._degraded:
+                logger.warning(
+                    f"Host throttle unavailable, spacing requests per "
+                    f"process: {e}"
+                )
+                self._degraded = True
+            return self._local_slot(host, delay, queue)
+        self._degraded = False
+        return wait_ms / 1000
+
+    def reserve(self, host, delay):
+        """Reserve a fetch slot for ``host``; return seconds to wait for it"""
+        return self._slot(self._reserve, host, delay, queue=True)
+
+    def acquire(self, host, delay):
+        """Take ``host``'s slot if free; else return seconds until it is"""
+        return self._slot(self._acquire, host, delay, queue=False)
+
+
+def robots_url(base_url):
+    parsed = urlparse(base_url)
+    return f"{parsed.scheme}://{parsed.netloc}/robots.txt"
+
+
+def fetch_robots(url):
+    """Download a robots.txt body, mapping errors the way MK1996 does.
+
+    Returns the body and how long it may be cached: a server error or an
+    unreachable server disallows everything, but only for a short while.
+    """
+    try:
+        response = requests.get(url, timeout=ROBOTS_TIMEOUT)
+    except requests.RequestException as e:
+        logger.warning(f"robots.txt unreachable at {url}: {e}")
+        return DISALLOW_ALL, ROBOTS_ERROR_TTL
+    if response.status_code in (401, 403):
+        return DISALLOW_ALL, ROBOTS_TTL
+    if 400 <= response.status_code < 500:
+        # No robots.txt: everything is allowed
+        return "", ROBOTS_TTL
+    if response.status_code >= 500:
+        logger.warning(f"robots.txt at {url}: {response.status_code}")
+        return DISALLOW_ALL, ROBOTS_ERROR_TTL
+    return response.text, ROBOTS_TTL
+
+
+class RobotsCache:
+    """robots.txt rules shared across jobs through a Redis TTL cache.
+
+    Redis holds the raw body of each site's robots.txt for ``ttl`` seconds
+    so that concurrent jobs on one host fetch it once; every worker parses
+    a body at most once per TTL.  Without Redis the file is fetched
+    directly.
+    """
+
+    def __init__(self, client=None, ttl=ROBOTS_TTL):
+        self.redis = client or get_redis()
+        self.ttl = ttl
+        self._parsed = {}
+
+    def _body(self, url):
+        key = f"robots:{url}"
+        try:
+            body = self.redis.get(key)
+            if body is not None:
+                return body, max(self.redis.ttl(key), 0)
+        except redis.RedisError as e:
+            logger.warning(f"robots.txt cache unavailable: {e}")
+            return fetch_robots(url)[0], 0
+        body, ttl = fetch_robots(url)
+        ttl = min(ttl, self.ttl)
+        try:
+            self.redis.set(key, body, ex=ttl)
+        except redis.RedisError as e:
+            logger.warning(f"robots.txt cache unavailable: {e}")
+        return body, ttl
+
+    def get(self, base_url):
+        """Return parsed robots.txt rules for the site of ``base_url``"""
+        url = robots_url(base_url)
+        cached = self._parsed.get(url)
+        if cached is not None and cached[0] > time.monotonic():
+            return cached[1]
+
+        body, ttl = self._body(url)
+        robots = RobotExclusionRulesParser()
+        robots.parse(body)
+        self._parsed[url] = (time.monotonic() + ttl, robots)
+        return robots
+
+
+_robots_cache = None
+
+
+def get_robots_cache():
+    """Return the process-wide :class:`RobotsCache`"""
+    global _robots_cache
+    if _robots_cache is None:
+        _robots_cache = RobotsCache()
+    return _robots_cache
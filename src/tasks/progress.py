@@ -0,0 +1,180 @@
+from collections import Counter
+from sqlalchemy import func, update
+from sqlalchemy.dialects.postgresql import insert
+from src.models import CrawlJob, CrawlJobStats
+from src.redis_client import get_redis
+import json
+import logging
+import redis
+
+
+logger = logging.getLogger("Progress")
+
+# Job counters and the crawl_jobs columns they are kept in.  ``internal``
+# lives in ``total_urls``: internal URLs are the crawl's workload.
+COUNTERS = {
+    "processed": "processed_urls",
+    "discovered": "discovered_urls",
+    "internal": "total_urls",
+    "external": "external_urls",
+    "errors": "error_urls",
+}
+
+FINISHED_STATUSES = ("completed", "failed", "aborted")
+
+# Latest snapshot kept for late subscribers
+PROGRESS_TTL = 7 * 24 * 3600
+
+# Internal and external URLs kept in crawl_job_stats for result pages
+SAMPLE_SIZE = 200
+
+
+def progress_key(job_id):
+    return f"crawl:{job_id}:progress"
+
+
+def status_class(status_code):
+    """Bucket of a status code: ``"2xx"`` ... or ``"error"`` (no response)"""
+    return "error" if status_code < 0 else f"{status_code // 100}xx"
+
+
+def is_error(status_code):
+    return status_code < 0 or status_code >= 400
+
+
+def snapshot(job):
+    """Progress of ``job`` (a CrawlJob or a row of its columns) as a dict"""
+    data = {
+        name: getattr(job, column) or 0 for name, column in COUNTERS.items()
+    }
+    data["status"] = job.status
+    data["progress"] = (
+        round(data["processed"] / data["internal"] * 100, 2)
+        if data["internal"]
+        else 0
+    )
+    return data
+
+
+def publish_progress(job_id, data, client=None):
+    """Store ``data`` as the job's latest progress and notify subscribers"""
+    payload = json.dumps(data)
+    try:
+        pipe = (client or get_redis()).pipeline()
+        pipe.set(progress_key(job_id), payload, ex=PROGRESS_TTL)
+        pipe.publish(progress_key(job_id), payload)
+        pipe.execute()
+    except redis.RedisError as e:
+        # Progress is advisory; never fail a crawl over it
+        logger.warning(f"Could not publish progress of job {job_id}: {e}")
+
+
+class ProgressTracker:
+    """Incrementally maintained progress counters and stats of one job.
+
+    :meth:`record` adds counter deltas to the job row with a single
+    ``UPDATE``; run it in the transaction that writes the counted rows so
+    that counters and graph can never disagree, even across retries.  The
+    resulting totals are then published to Redis with :meth:`publish`.
+    :meth:`record_flush` also folds the flushed pages, and the crawl profile
+    if one is kept, into the job's ``crawl_job_stats`` row.
+    """
+
+    def __init__(self, job_id, client=None):
+        self.job_id = job_id
+        self.redis = client
+
+    def record(self, db, **deltas):
+        """Add ``deltas`` to the job's counters; return the new snapshot.
+
+        Returns ``None`` if there was nothing to add.
+        """
+        jobs = CrawlJob.__table__
+        values = {
+            COUNTERS[name]: jobs.c[COUNTERS[name]] + delta
+            for name, delta in deltas.items()
+            if delta
+        }
+        if not values:
+            return None
+        columns = [jobs.c[column] for column in COUNTERS.values()]
+        stmt = (
+            update(jobs)
+            .where(jobs.c.id == self.job_id)
+            .values(values)
+            .returning(jobs.c.status, *columns)
+        )
+        row = db.execute(stmt).first()
+        return None if row is None else snapshot(row)
+
+    def record_flush(self, db, pages, new_nodes, profile=None):
+        """Record a graph flush; return the new progress snapshot.
+
+        ``pages`` are the ``(status_code, depth)`` of the pages fetched or
+        skipped, ``new_nodes`` the ``(url, is_external)`` of the nodes
+        inserted by the flush and ``profile`` the counters to add to the
+        job's profile (see :class:`~src.instrumentation.CrawlRecorder`).
+        """
+        internal = [url for url, is_external in new_nodes if not is_external]
+        external = [url for url, is_external in new_nodes if is_external]
+        self._record_stats(
+            db,
+            Counter(status_class(code) for code, _ in pages),
+            Counter(str(depth) for _, depth in pages if depth is not None),
+            internal[:SAMPLE_SIZE],
+            external[:SAMPLE_SIZE],
+            profile or {},
+        )
+        return self.record(
+            db,
+            processed=len(pages),
+            errors=sum(1 for code, _ in pages if is_error(code)),
+            internal=len(internal),
+            external=len(external),
+            discovered=len(new_nodes),
+        )
+
+    def _record_stats(self, db, statuses, depths, internal, external, profile):
+        if not (statuses or depths or internal or external or profile):
+            return
+        stats = CrawlJobStats.__table__
+        stmt = insert(stats).values(
+            job_id=self.job_id,
+            status_classes=dict(statuses),
+            depths=dict(depths),
+            internal_sample=internal,
+            external_sample=external,
+            profile=profile,
+        )
+        excluded = stmt.excluded
+        db.execute(
+            stmt.on_conflict_do_update(
+                index_elements=[stats.c.job_id],
+                set_={
+                    "status_classes": func.jsonb_add_counts(
+                        stats.c.status_classes, excluded.status_classes
+                    ),
+                    "depths": func.jsonb_add_counts(
+                        stats.c.depths, excluded.depths
+                    ),
+                    "internal_sample": func.jsonb_append_capped(
+                        stats.c.internal_sample,
+                        excluded.internal_sample,
+                        SAMPLE_SIZE,
+                    ),
+                    "external_sample": func.jsonb_append_capped(
+                        stats.c.external_sample,
+                        excluded.external_sample,
+                        SAMPLE_SIZE,
+                    ),
+                    "profile": func.jsonb_add_counts(
+                        stats.c.profile, excluded.profile
+                    ),
+                    "updated_at": func.now(),
+                },
+            )
+        )
+
+    def publish(self, data):
+        if data is not None:
+            publish_progress(self.job_id, data, self.redis)
@@ -0,0 +1,139 @@
+from collections import namedtuple
+from sqlalchemy import and_, select
+from sqlalchemy.orm import aliased
+from src.models import CrawlJob, UrlEdge, UrlNode, url_hash
+import logging
+
+
+logger = logging.getLogger("Recrawl")
+
+
+class PreviousPage(
+    namedtuple(
+        "PreviousPage",
+        [
+            "id",
+            "status_code",
+            "etag",
+            "last_modified",
+            "lastmod",
+            "current_lastmod",
+            "links",
+        ],
+        defaults=((),),
+    )
+):
+    """A page as the previous crawl stored it.
+
+    ``current_lastmod`` is the page's ``<lastmod>`` in the sitemap of the
+    running crawl, ``lastmod`` the one the previous crawl saw.  ``links``
+    are its ``(target_url, is_external)`` links.
+    """
+
+    __slots__ = ()
+
+    @property
+    def lastmod_unchanged(self):
+        return bool(self.lastmod) and self.lastmod == self.current_lastmod
+
+    def conditional_headers(self):
+        """Request headers that make the server answer 304 if unchanged"""
+        headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+
+def find_previous_job(db, start_url):
+    """Return the latest completed crawl of ``start_url``, if any"""
+    return (
+        db.query(CrawlJob)
+        .filter_by(start_url=start_url, status="completed")
+        .order_by(CrawlJob.created_at.desc())
+        .first()
+    )
+
+
+class PreviousCrawl:
+    """What the previous crawl of a recrawl job saw, looked up in bulk.
+
+    Only pages the previous job fetched successfully (2xx) are returned:
+    everything else is worth fetching again.
+    """
+
+    def __init__(self, db, job_id, previous_job_id):
+        self.db = db
+        self.job_id = job_id
+        self.previous_job_id = previous_job_id
+
+    def lookup(self, urls):
+        """Return ``{url: PreviousPage}`` for the known pages of ``urls``.
+
+        Two queries load the pages and all of their links, so that reusing
+        the pages of a batch costs no query per page.
+        """
+        hashes = {url_hash(url): url for url in urls}
+        if not hashes:
+            return {}
+        previous = aliased(UrlNode)
+        current = aliased(UrlNode)
+        stmt = (
+            select(
+                previous.url,
+                previous.id,
+                previous.status_code,
+                previous.etag,
+                previous.last_modified,
+                previous.lastmod,
+                current.lastmod,
+            )
+            .outerjoin(
+                current,
+                and_(
+                    current.job_id == self.job_id,
+                    current.url_hash == previous.url_hash,
+                ),
+            )
+            .where(
+                previous.job_id == self.previous_job_id,
+                previous.url_hash.in_(hashes),
+                previous.status_code.between(200, 299),
+            )
+        )
+        pages = {
+            url: PreviousPage(*page)
+            for url, *page in self.db.execute(stmt)
+            if hashes[url_hash(url)] == url
+        }
+        links = self.links({page.id for page in pages.values()})
+        return {
+            url: page._replace(links=links.get(page.id, []))
+            for url, page in pages.items()
+        }
+
+    def links(self, page_ids):
+        """Return ``{page_id: [(target_url, is_external)]}`` of pages"""
+        if not page_ids:
+            return {}
+        target = aliased(UrlNode)
+        stmt = (
+            select(UrlEdge.source_id, target.url, target.is_external)
+            .join(
+                UrlEdge,
+                and_(
+                    UrlEdge.job_id == target.job_id,
+                    UrlEdge.target_id == target.id,
+                ),
+            )
+            .where(
+                UrlEdge.job_id == self.previous_job_id,
+                UrlEdge.source_id.in_(page_ids),
+                target.job_id == self.previous_job_id,
+            )
+        )
+        links = {}
+        for source_id, url, is_external in self.db.execute(stmt):
+            links.setdefault(source_id, []).append((url, is_external))
+        return links
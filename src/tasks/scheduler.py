@@ -0,0 +1,215 @@
+from src.redis_client import get_redis
+import json
+import os
+import time
+
+
+# Jobs are interactive (someone is waiting on the result) or bulk; waiting
+# interactive jobs are admitted first and their tasks served first
+JOB_QUEUES = ("interactive", "bulk")
+
+# Celery message priority of each queue's tasks; the Redis transport
+# serves lower numbers first
+TASK_PRIORITIES = {"interactive": 0, "bulk": 6}
+
+# Largest share weight of a job, see turn_seconds
+MAX_WEIGHT = 8
+
+# Shortest turn of a contended job: every turn sets up its fetch engine,
+# parse pool and writer again, which a few seconds of crawling would not
+# pay for
+MIN_TURN_SECONDS = 60
+
+# Jobs running at once, worker processes their tasks share, and the most
+# task chains one distributed job may run in parallel
+MAX_RUNNING_JOBS = int(os.getenv("CRAWLER_MAX_RUNNING_JOBS", 8))
+WORKER_SLOTS = int(os.getenv("CRAWLER_WORKER_SLOTS", 4))
+JOB_QUOTA = int(os.getenv("CRAWLER_JOB_QUOTA", 4))
+
+# A running job that has not shown signs of life for this long (its worker
+# was lost) gives its place up
+RUNNING_LEASE = 15 * 60
+
+# Drop running jobs whose lease ran out, then fill the free places with
+# waiting jobs, interactive ones first and oldest first.
+_ADMIT_SCRIPT = """
+local now = tonumber(ARGV[2])
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', now - tonumber(ARGV[3]))
+local free = tonumber(ARGV[1]) - redis.call('ZCARD', KEYS[1])
+local admitted = {}
+for i = 2, #KEYS do
+    while free > 0 do
+        local popped = redis.call('ZPOPMIN', KEYS[i])
+        if #popped == 0 then
+            break
+        end
+        redis.call('ZADD', KEYS[1], now, popped[1])
+        admitted[#admitted + 1] = popped[1]
+        free = free - 1
+    end
+end
+return admitted
+"""
+
+
+def turn_seconds(options, contended):
+    """Seconds a single-worker job runs before handing its worker over.
+
+    Jobs take turns at the workers: each turn ends with the job's next
+    task queued behind the others.  While more jobs run than there are
+    worker slots, a job's turns last in proportion to its ``weight``, which
+    makes the turns a weighted round robin, but no less than
+    ``MIN_TURN_SECONDS``; otherwise they last the full ``chunk_seconds``.
+    """
+    if not contended:
+        return options.chunk_seconds
+    return max(
+        options.chunk_seconds * options.weight / MAX_WEIGHT,
+        min(options.chunk_seconds, MIN_TURN_SECONDS),
+    )
+
+
+def job_fanout(options):
+    """Task chains a distributed job runs, within the per-job quota"""
+    return min(options.fanout, JOB_QUOTA)
+
+
+class JobScheduler:
+    """Admission control for crawl jobs, kept in Redis.
+
+    At most ``max_running`` jobs run at once.  Submitted jobs wait in a
+    ZSET per queue, scored by submission time; :meth:`admit` moves them to
+    the running ZSET as places free up and returns them to be started.
+    Running jobs are scored by their last :meth:`heartbeat`, so the place
+    of a job whose worker died is reclaimed after ``RUNNING_LEASE``.  The
+    task arguments of every job are kept in a HASH until it finishes.
+    """
+
+    def __init__(self, client=None, max_running=MAX_RUNNING_JOBS):
+        self.redis = client or get_redis()
+        self.max_running = max_running
+        self.running_key = "scheduler:running"
+        self.jobs_key = "scheduler:jobs"
+        self.waiting_keys = {
+            queue: f"scheduler:waiting:{queue}" for queue in JOB_QUEUES
+        }
+        self._admit = self.redis.register_script(_ADMIT_SCRIPT)
+
+    def submit(self, job_id, base_url, options, resume=False):
+        """Queue a job to be started, or resumed, once admitted"""
+        entry = {
+            "base_url": base_url,
+            "options": options.to_dict(),
+            "resume": resume,
+            "queue": options.queue,
+            "weight": options.weight,
+            "submitted_at": time.time(),
+        }
+        pipe = self.redis.pipeline()
+        pipe.hset(self.jobs_key, job_id, json.dumps(entry))
+        pipe.zadd(self.waiting_keys[options.queue], {job_id: time.time()})
+        pipe.execute()
+
+    def admit(self):
+        """Admit waiting jobs into free places; return ``(job_id, entry)``"""
+        admitted = self._admit(
+            keys=[self.running_key, *self.waiting_keys.values()],
+            args=[self.max_running, time.time(), RUNNING_LEASE],
+        )
+        if not admitted:
+            return []
+        entries = self.redis.hmget(self.jobs_key, admitted)
+        now = time.time()
+        started = []
+        pipe = self.redis.pipeline()
+        for job_id, raw in zip(admitted, entries):
+            if raw is None:
+                # Finished while waiting
+                pipe.zrem(self.running_key, job_id)
+                continue
+            entry = json.loads(raw)
+            entry["admitted_at"] = now
+            pipe.hset(self.jobs_key, job_id, json.dumps(entry))
+            started.append((job_id, entry))
+        pipe.execute()
+        return started
+
+    def heartbeat(self, job_id):
+        """Renew a running job's lease.
+
+        A job whose lease ran out while its task waited for a worker takes
+        its place back, even if that runs more than ``max_running`` jobs
+        for a while: it runs either way, and is counted.  Only call this
+        for jobs whose status says they are running or about to.
+        """
+        self.redis.zadd(self.running_key, {job_id: time.time()})
+
+    def finish(self, job_id):
+        """Forget a job, running or waiting, freeing its place"""
+        pipe = self.redis.pipeline()
+        pipe.zrem(self.running_key, job_id)
+        for key in self.waiting_keys.values():
+            pipe.zrem(key, job_id)
+        pipe.hdel(self.jobs_key, job_id)
+        pipe.execute()
+
+    def contended(self):
+        """True while more jobs run than there are worker slots"""
+        return self.redis.zcard(self.running_key) > WORKER_SLOTS
+
+    def snapshot(self):
+        """Queue depths, running jobs and waits, as the API shows them"""
+        now = time.time()
+        pipe = self.redis.pipeline()
+        pipe.zrange(self.running_key, 0, -1, withscores=True)
+        for key in self.waiting_keys.values():
+            pipe.zrange(key, 0, -1, withscores=True)
+        running, *waiting = pipe.execute()
+        ids = [job_id for job_id, _ in running]
+        ids += [job_id for jobs in waiting for job_id, _ in jobs]
+        raws = self.redis.hmget(self.jobs_key, ids) if ids else []
+        entries = {
+            job_id: json.loads(raw) if raw else {}
+            for job_id, raw in zip(ids, raws)
+        }
+
+        def waited(entry, until):
+            submitted = entry.get("submitted_at")
+            return round(until - submitted, 1) if submitted else None
+
+        queues = {}
+        for queue, jobs in zip(self.waiting_keys, waiting):
+            queues[queue] = {
+                "depth": len(jobs),
+                "oldest_wait_seconds": (
+                    round(now - jobs[0][1], 1) if jobs else 0
+                ),
+                "jobs": [
+                    {
+                        "job_id": job_id,
+                        "position": position,
+                        "weight": entries[job_id].get("weight"),
+                        "wait_seconds": round(now - submitted, 1),
+                    }
+                    for position, (job_id, submitted) in enumerate(jobs, 1)
+                ],
+            }
+        return {
+            "max_running": self.max_running,
+            "worker_slots": WORKER_SLOTS,
+            "job_quota": JOB_QUOTA,
+            "running": [
+                {
+                    "job_id": job_id,
+                    "queue": entries[job_id].get("queue"),
+                    "weight": entries[job_id].get("weight"),
+                    "waited_seconds": waited(
+                        entries[job_id],
+                        entries[job_id].get("admitted_at", now),
+                    ),
+                    "heartbeat_age_seconds": round(now - heartbeat, 1),
+                }
+                for job_id, heartbeat in running
+            ],
+            "waiting": queues,
+        }
@@ -0,0 +1,75 @@
+from datetime import datetime, timedelta
+import re
+
+
+def compile_patterns(patterns):
+    """Compile URL regular expressions; ValueError names a bad one"""
+    compiled = []
+    for pattern in patterns:
+        try:
+            compiled.append(re.compile(pattern))
+        except re.error as e:
+            raise ValueError(f"Bad URL pattern {pattern!r}: {e}")
+    return compiled
+
+
+class CrawlScope:
+    """Which discovered URLs a job queues.
+
+    A URL is in scope when it is at most ``max_depth`` links away from the
+    seeds (0: no limit), matches one of the ``include`` patterns if there
+    are any and none of the ``exclude`` patterns.  Patterns are regular
+    expressions searched anywhere in the normalized URL.  Out of scope URLs
+    are still recorded as nodes of the pages linking to them, never
+    fetched.
+    """
+
+    def __init__(self, options):
+        self.max_depth = options.max_depth
+        self.include = compile_patterns(options.include)
+        self.exclude = compile_patterns(options.exclude)
+
+    def allows(self, url, depth=0):
+        if self.max_depth and depth > self.max_depth:
+            return False
+        if self.include and not any(p.search(url) for p in self.include):
+            return False
+        return not any(p.search(url) for p in self.exclude)
+
+    def filter(self, urls, depth=0):
+        """The URLs of ``urls`` in scope at ``depth``"""
+        if self.max_depth and depth > self.max_depth:
+            return []
+        if not (self.include or self.exclude):
+            return list(urls)
+        return [url for url in urls if self.allows(url, depth)]
+
+
+class CrawlBudget:
+    """Page and wall-clock limits of a job.
+
+    ``max_pages`` counts the pages fetched or skipped, like the job's
+    ``processed_urls``; ``max_seconds`` runs from when the job started
+    running, across chunks and resumes.  0 disables either.
+    """
+
+    def __init__(self, options, started_at=None):
+        self.max_pages = options.max_pages
+        self.deadline = (
+            started_at + timedelta(seconds=options.max_seconds)
+            if options.max_seconds and started_at
+            else None
+        )
+
+    def expired(self):
+        if self.deadline is None:
+            return False
+        return datetime.now(self.deadline.tzinfo) >= self.deadline
+
+    def batch_limit(self, batch_size, processed):
+        """Size of the next batch after ``processed`` pages, 0 once spent"""
+        if self.expired():
+            return 0
+        if not self.max_pages:
+            return batch_size
+        return max(min(batch_size, self.max_pages - processed), 0)
@@ -0,0 +1,18 @@
+import os
+
+import pytest
+
+# Importing src.tasks builds the SQLAlchemy engine; unit tests never touch
+# the database, only the in-memory one of the ``db`` fixture.
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+
+@pytest.fixture
+def db():
+    """A session on an in-memory SQLite copy of the link graph tables"""
+    # The benchmark's stand-in for PostgreSQL, built per test
+    from benchmarks.bench_crawl import make_sessions
+
+    session = make_sessions("sqlite://")()
+    yield session
+    session.close()
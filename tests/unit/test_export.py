@@ -0,0 +1,189 @@
+import gzip
+import io
+import time
+
+import pytest
+
+from src import export
+from src.export import ExportError, check_export, export_job, export_name
+
+EDGES_CSV = b"source_id,target_id,link_type\n1,2,hyperlink\n1,3,script\n"
+
+
+class Cursor:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+    def mogrify(self, sql, params):
+        for name, value in params.items():
+            sql = sql.replace(f"%({name})s", repr(value))
+        return sql.encode()
+
+    def copy_expert(self, sql, file):
+        self.conn.statements.append(sql)
+        output = self.conn.outputs.pop(0)
+        if isinstance(output, Exception):
+            raise output
+        # COPY writes one row at a time
+        for line in output.splitlines(keepends=True):
+            file.write(line)
+
+
+class Connection:
+    """Raw connection whose COPYs take the next of ``outputs``"""
+
+    def __init__(self, outputs):
+        self.outputs = outputs
+        self.statements = []
+        self.closed = self.invalidated = False
+
+    def cursor(self):
+        return Cursor(self)
+
+    def invalidate(self):
+        self.invalidated = True
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def copy_outputs(monkeypatch):
+    """Set what COPY returns; the connections used are listed back"""
+    connections = []
+
+    def use(*outputs):
+        outputs = list(outputs)
+
+        class Engine:
+            def raw_connection(self):
+                connections.append(Connection(outputs))
+                return connections[-1]
+
+        monkeypatch.setattr(export, "engine", Engine())
+        return connections
+
+    return use
+
+
+def test_csv(copy_outputs):
+    connections = copy_outputs(EDGES_CSV)
+    assert b"".join(export_job("job-1", "csv")) == EDGES_CSV
+    [conn] = connections
+    [statement] = conn.statements
+    assert statement.startswith("COPY (SELECT url_edges.source_id")
+    assert "'job-1'" in statement
+    assert statement.endswith(f"TO STDOUT WITH ({export.CSV})")
+    assert conn.closed and not conn.invalidated
+
+
+def test_ndjson_nodes(copy_outputs):
+    connections = copy_outputs(b'{"id":1}\n')
+    assert b"".join(export_job("job", "ndjson", "nodes")) == b'{"id":1}\n'
+    [statement] = connections[0].statements
+    assert "row_to_json" in statement and "url_nodes" in statement
+
+
+def test_graphml(copy_outputs):
+    copy_outputs(b'<node id="n1"></node>\n', b'<edge source="n1"/>\n')
+    document = b"".join(export_job("job", "graphml")).decode()
+    assert document.startswith(export.GRAPHML_HEADER)
+    assert document.endswith(export.GRAPHML_FOOTER)
+    assert document.index("<node") < document.index("<edge")
+
+
+def test_gzip(copy_outputs):
+    copy_outputs(EDGES_CSV)
+    chunks = export_job("job", "csv", compression="gzip")
+    assert gzip.decompress(b"".join(chunks)) == EDGES_CSV
+
+
+def test_zstd(copy_outputs):
+    zstandard = pytest.importorskip("zstandard")
+    copy_outputs(EDGES_CSV)
+    data = b"".join(export_job("job", "csv", compression="zstd"))
+    reader = zstandard.ZstdDecompressor().stream_reader(io.BytesIO(data))
+    assert reader.read() == EDGES_CSV
+
+
+def test_parquet(copy_outputs):
+    parquet = pytest.importorskip("pyarrow.parquet")
+    copy_outputs(EDGES_CSV)
+    data = b"".join(export_job("job", "parquet"))
+    table = parquet.read_table(io.BytesIO(data))
+    assert table.column("target_id").to_pylist() == [2, 3]
+    assert table.column("link_type").to_pylist() == ["hyperlink", "script"]
+
+
+def test_copy_error_is_raised(copy_outputs):
+    connections = copy_outputs(RuntimeError("canceled"))
+    with pytest.raises(RuntimeError, match="canceled"):
+        b"".join(export_job("job", "csv"))
+    assert connections[0].invalidated and connections[0].closed
+
+
+def test_abandoned_export_stops_copy(copy_outputs, monkeypatch):
+    monkeypatch.setattr(export, "COPY_CHUNK", 10)
+    monkeypatch.setattr(export, "COPY_QUEUE", 1)
+    connections = copy_outputs(b"1,2,hyperlink\n" * 1000)
+    chunks = export_job("job", "csv")
+    next(chunks)
+    chunks.close()
+    for _ in range(100):
+        if connections[0].closed:
+            break
+        time.sleep(0.01)
+    # The COPY was interrupted, not left blocked on a full queue
+    assert connections[0].invalidated and connections[0].closed
+
+
+@pytest.mark.parametrize(
+    "args",
+    [
+        ("xml", "edges"),
+        ("csv", "pages"),
+        ("csv", "edges", "bz2"),
+    ],
+)
+def test_bad_export(args):
+    with pytest.raises(ExportError):
+        check_export(*args)
+
+
+def test_missing_optional_packages(monkeypatch):
+    monkeypatch.setattr(export, "pyarrow", None)
+    monkeypatch.setattr(export, "zstandard", None)
+    with pytest.raises(ExportError, match="pyarrow"):
+        check_export("parquet", "edges")
+    with pytest.raises(ExportError, match="zstandard"):
+        check_export("csv", "edges", "zstd")
+    # Parquet compresses with its own zstd
+    monkeypatch.setattr(export, "pyarrow", object())
+    check_export("parquet", "edges", "zstd")
+
+
+@pytest.mark.parametrize(
+    "args, name, mimetype",
+    [
+        (("j", "csv", "edges"), "j-edges.csv", "text/csv"),
+        (
+            ("j", "ndjson", "nodes", "gzip"),
+            "j-nodes.ndjson.gz",
+            "application/gzip",
+        ),
+        (("j", "graphml", "edges"), "j.graphml", "application/graphml+xml"),
+        (
+            ("j", "parquet", "nodes", "zstd"),
+            "j-nodes.parquet",
+            "application/vnd.apache.parquet",
+        ),
+    ],
+)
+def test_export_name(args, name, mimetype):
+    assert export_name(*args) == (name, mimetype)
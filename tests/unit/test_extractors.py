@@ -0,0 +1,93 @@
+import pytest
+
+from src.tasks.extractors import (
+    EXTRACTORS,
+    extract_links_bs4,
+    extract_links_lxml,
+    get_extractor,
+)
+
+
+URL = "https://example.com/page"
+
+# Pages both backends must read the same links from
+PARITY_CASES = {
+    "anchors_and_scripts": (
+        '<html><body><a href="/a">a</a><a href="https://other.org/b">b</a>'
+        '<script>window.location = "/loc"; var o = {url: "/u"};</script>'
+        '<script src="/app.js"></script></body></html>'
+    ),
+    "after_html": (
+        '<html><body><a href="/x"></body></html><a href="/after-html">'
+    ),
+    "after_html_uppercase": (
+        '<HTML><BODY><A HREF="/x"></BODY></HTML >\n<a href="/y">y</a>'
+        '<script>url = "/s"</script>'
+    ),
+    "two_documents": (
+        '<html><body><a href="/1"></body></html>'
+        '<html><body><a href="/2"></body></html>'
+    ),
+    "after_body": (
+        '<html><body><a href="/x"></body><a href="/after-body"></html>'
+    ),
+    "before_html": '<a href="/before"><html><body><a href="/in">',
+    "in_head": (
+        '<!DOCTYPE html><html><head><a href="/head">h</a></head>'
+        "<body></body></html>"
+    ),
+    "self_links": (
+        f'<a href="#">s</a><a href="">e</a><a href=" ">w</a>'
+        f'<a href="{URL}">u</a><a>none</a><a href>bare</a>'
+    ),
+    "entities": '<a href="/q?a=1&amp;b=2">e</a><a href="/caf&eacute;">c</a>',
+    "comment": '<!-- <a href="/c"> --><a href="/real">r</a>',
+    "cdata": '<body><![CDATA[<a href="/cd">]]><a href="/after">a</a></body>',
+    "nested_anchors": '<a href="/1"><a href="/2">two</a></a>',
+    "table": (
+        '<table><tr><a href="/in-table">x</a>'
+        '<td><a href="/td">t</a></td></tr></table>'
+    ),
+    "containers": (
+        '<noscript><a href="/ns">x</a></noscript>'
+        '<textarea><a href="/t">x</a></textarea>'
+        '<template><a href="/tpl">x</a></template>'
+        '<select><option><a href="/opt">o</a></option></select>'
+        '<svg><a href="/svg">s</a></svg>'
+    ),
+    "style": '<style>a{background:url("/img.png")}</style><a href="/s">',
+    "frameset": '<frameset><frame src="/f"></frameset><a href="/after">',
+    "unicode": '<a href="/ünï">ü</a>',
+    "empty": "",
+    "text_only": "plain text",
+}
+
+
+@pytest.mark.parametrize("html", PARITY_CASES.values(), ids=list(PARITY_CASES))
+def test_lxml_matches_bs4(html):
+    assert extract_links_lxml(html, URL) == extract_links_bs4(html, URL)
+
+
+def test_links_after_html_end_tag():
+    html = '<html><body><a href="/x"></body></html><a href="/after-html">'
+    assert extract_links_lxml(html, URL).anchors == ["/x", "/after-html"]
+
+
+def test_unclosed_script_keeps_links():
+    # Bodies cut at max_bytes end mid-script; html.parser drops the script
+    html = '<a href="/a"></a><script>url="/late"'
+    links = extract_links_lxml(html, URL)
+    assert links.anchors == ["/a"]
+    assert links.scripts == ["/late"]
+
+
+def test_duplicate_href_takes_the_first():
+    # As browsers do; html.parser keeps the last one
+    html = '<a HREF="/first" href="/second">x</a>'
+    assert extract_links_lxml(html, URL).anchors == ["/first"]
+
+
+def test_get_extractor():
+    assert get_extractor("lxml") is EXTRACTORS["lxml"]
+    with pytest.raises(ValueError):
+        get_extractor("regex")
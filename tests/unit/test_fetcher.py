@@ -0,0 +1,139 @@
+import asyncio
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+from src.tasks.fetcher import AsyncFetcher, fetch_url, is_html
+
+LIMIT = 1000
+PAGE = b"<html><body><a href='/a'>a</a></body></html>"
+
+# path: (Content-Type, body, whether Content-Length is sent)
+RESOURCES = {
+    "/page": ("text/html; charset=utf-8", PAGE, True),
+    "/xhtml": ("application/xhtml+xml", PAGE, True),
+    "/untyped": (None, PAGE, True),
+    "/pdf": ("application/pdf", b"%PDF" * 100, True),
+    "/large": ("text/html", b"x" * (LIMIT + 1), True),
+    "/large-unannounced": ("text/html", b"x" * (LIMIT * 200), False),
+}
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.0"
+
+    def _send_headers(self):
+        content_type, body, announced = RESOURCES[self.path]
+        self.server.requests.append((self.command, self.path))
+        self.send_response(200)
+        if content_type:
+            self.send_header("Content-Type", content_type)
+        if announced:
+            self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        return body
+
+    def do_HEAD(self):
+        self._send_headers()
+
+    def do_GET(self):
+        body = self._send_headers()
+        try:
+            self.wfile.write(body)
+        except ConnectionError:
+            # The client stopped reading
+            pass
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture(scope="module")
+def server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.requests = []
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def base(server):
+    server.requests.clear()
+    return f"http://127.0.0.1:{server.server_port}"
+
+
+def fetch(base, path, **kwargs):
+    with requests.Session() as session:
+        return fetch_url(session, base + path, max_bytes=LIMIT, **kwargs)
+
+
+@pytest.mark.parametrize("path", ["/page", "/xhtml", "/untyped"])
+def test_html_is_read(base, path):
+    result = fetch(base, path)
+    assert result.status_code == 200
+    assert "href='/a'" in result.text
+    assert result.size == len(PAGE)
+    assert not result.truncated
+
+
+def test_other_types_are_not_read(base):
+    result = fetch(base, "/pdf")
+    assert result.text is None
+    assert result.content_type == "application/pdf"
+    assert result.size == 400
+    assert not result.truncated
+
+
+def test_announced_large_body_is_not_read(base):
+    result = fetch(base, "/large")
+    assert result.text is None
+    assert result.truncated
+    assert result.size == LIMIT + 1
+
+
+def test_large_body_is_abandoned(base):
+    result = fetch(base, "/large-unannounced")
+    assert result.text is None
+    assert result.truncated
+    assert LIMIT < result.size < LIMIT * 200
+
+
+def test_head_first(server, base):
+    assert fetch(base, "/pdf", head_first=True).text is None
+    assert server.requests == [("HEAD", "/pdf")]
+    assert fetch(base, "/page", head_first=True).text
+    assert server.requests[1:] == [("HEAD", "/page"), ("GET", "/page")]
+
+
+@pytest.mark.parametrize("path", list(RESOURCES))
+def test_async_fetcher_matches(base, path):
+    async def fetch_async():
+        async with AsyncFetcher(max_bytes=LIMIT) as fetcher:
+            return await fetcher.fetch(base + path)
+
+    result = asyncio.run(fetch_async())
+    expected = fetch(base, path)
+    assert (result.text, result.truncated) == (
+        expected.text,
+        expected.truncated,
+    )
+
+
+@pytest.mark.parametrize(
+    "content_type, html",
+    [
+        ("text/html", True),
+        ("Text/HTML; charset=ISO-8859-1", True),
+        (None, True),
+        ("", True),
+        ("application/json", False),
+        ("image/png", False),
+    ],
+)
+def test_is_html(content_type, html):
+    assert is_html(content_type) is html
@@ -0,0 +1,131 @@
+import pytest
+
+from src.tasks.fingerprints import (
+    BAND_BITS,
+    BUCKET_SIZE,
+    MASK64,
+    FingerprintIndex,
+    RedisFingerprintIndex,
+    bands,
+    distance,
+    fingerprint,
+    make_fingerprint_index,
+    restore_fingerprints,
+)
+from src.tasks.graph_writer import GraphWriter
+from src.tasks.options import CrawlOptions
+
+fakeredis = pytest.importorskip("fakeredis")
+
+
+def signed(value):
+    value &= MASK64
+    return value - (1 << 64) if value >> 63 else value
+
+
+def from_bands(*values):
+    return signed(sum(v << (i * BAND_BITS) for i, v in enumerate(values)))
+
+
+@pytest.fixture(params=["memory", "redis"])
+def index(request):
+    if request.param == "memory":
+        return FingerprintIndex("job")
+    client = fakeredis.FakeRedis(decode_responses=True)
+    return RedisFingerprintIndex("job", client=client)
+
+
+def test_exact_duplicates(index):
+    assert index.match(1, 100) is None
+    assert index.match(2, 100) == 1
+    assert index.match(3, 101) is None
+    assert len(index) == 2
+
+
+def test_near_duplicates(index):
+    original = from_bands(0x1234, 0x5678, 0x9ABC, 0xDEF0)
+    # Negative, as half of all SimHashes are
+    assert original < 0
+    assert index.match(1, 100, original) is None
+    # Three bits off, one in each of three bands
+    near = original ^ from_bands(1, 1, 1, 0)
+    assert index.match(2, 200, near) == 1
+    # Its body now resolves exactly
+    assert index.match(3, 200) == 1
+    far = original ^ from_bands(1, 1, 1, 1)
+    assert index.match(4, 300, far) is None
+
+
+def test_crowded_bands_are_capped(index):
+    # Originals sharing their first band, far apart in the others
+    originals = [
+        from_bands(0, i * 0x0101, i * 0x0101, i * 0x0101)
+        for i in range(1, BUCKET_SIZE + 2)
+    ]
+    for page, simhash in enumerate(originals):
+        assert index.match(page, 1000 + page, simhash) is None
+
+    def near(simhash):
+        # Agrees with ``simhash`` on the first band only
+        return simhash ^ from_bands(0, 1 << 15, 1 << 15, 1 << 15)
+
+    # Found through the first band's bucket while it had room
+    assert index.match(-1, -1, near(originals[0])) == 0
+    # The last original did not fit in it
+    assert index.match(-2, -2, near(originals[-1])) is None
+    # but is found through its other bands
+    assert index.match(-3, -3, originals[-1] ^ 1) == BUCKET_SIZE
+
+
+def test_add_many_and_clear(index):
+    simhash = from_bands(1, 2, 3, 4)
+    index.add_many([(1, 100, simhash), (2, 200, None)])
+    assert index.match(3, 200) == 2
+    assert index.match(4, 400, simhash ^ 7) == 1
+    index.clear()
+    assert len(index) == 0
+    assert index.match(5, 100) is None
+
+
+def test_restore(db, index):
+    simhash = from_bands(1, 2, 3, 4)
+    writer = GraphWriter(db, "job")
+    writer.add_node("https://e.com/a", content_hash=100, simhash=simhash)
+    writer.add_node("https://e.com/b", content_hash=200, duplicate_of=1)
+    writer.add_node("https://e.com/c")
+    writer.flush()
+    index.match(9, 900)
+    restore_fingerprints("job", index, db, chunk=1)
+    assert len(index) == 1
+    original = index.match(7, 700, simhash ^ 1)
+    assert original is not None and original == index.match(8, 100)
+
+
+def test_fingerprint():
+    page = "<html><body><p>" + "Some text. " * 200 + "</p></body></html>"
+    first = fingerprint(page)
+    assert first == fingerprint(page.upper())
+    edited = fingerprint(page.replace("Some text.", "Some test.", 1))
+    assert edited["content_hash"] != first["content_hash"]
+    assert distance(edited["simhash"], first["simhash"]) <= 3
+    other = fingerprint("<html><body>Something else entirely</body></html>")
+    assert distance(other["simhash"], first["simhash"]) > 3
+    assert fingerprint(page, near=False)["simhash"] is None
+    assert fingerprint("")["simhash"] is not None
+
+
+def test_bands():
+    assert bands(from_bands(1, 2, 3, 0xFFFF)) == [1, 2, 3, 0xFFFF]
+    assert distance(-1, 0) == 64
+
+
+def test_make_fingerprint_index():
+    assert make_fingerprint_index(CrawlOptions(), "job") is None
+    exact = make_fingerprint_index(CrawlOptions(dedupe="exact"), "job")
+    assert isinstance(exact, FingerprintIndex)
+    shared = make_fingerprint_index(
+        CrawlOptions(dedupe="near", frontier="redis", simhash_distance=2),
+        "job",
+    )
+    assert isinstance(shared, RedisFingerprintIndex)
+    assert shared.distance == 2
@@ -0,0 +1,137 @@
+import pytest
+import time
+
+from src.tasks.frontier import (
+    CLAIM_LEASE,
+    MemoryFrontier,
+    RedisFrontier,
+    make_frontier,
+    queue_score,
+)
+
+
+@pytest.fixture(params=["memory", "redis"])
+def frontier(request):
+    if request.param == "memory":
+        return MemoryFrontier("job")
+    fakeredis = pytest.importorskip("fakeredis")
+    client = fakeredis.FakeRedis(decode_responses=True)
+    return RedisFrontier("job", client=client)
+
+
+@pytest.fixture
+def redis_frontier():
+    fakeredis = pytest.importorskip("fakeredis")
+    client = fakeredis.FakeRedis(decode_responses=True)
+    return RedisFrontier("job", client=client)
+
+
+def test_queue_score():
+    assert queue_score(0, 1.0) < queue_score(0) < queue_score(0, 0.0)
+    assert queue_score(0, 0.0) < queue_score(1, 1.0)
+    # Out of range priorities are clamped
+    assert queue_score(0, 7) == queue_score(0, 1.0)
+
+
+def test_add_many_skips_seen(frontier):
+    assert frontier.add_many(["/a", "/b"]) == ["/a", "/b"]
+    assert frontier.add_many(["/b", "/c"], depth=1) == ["/c"]
+    assert not frontier.add("/a")
+    assert len(frontier) == 3
+    assert frontier.seen_count == 3
+
+
+def test_pop_batch_order(frontier):
+    frontier.add("/deep", depth=2)
+    frontier.add_many(["/low", "/high"], 1, {"/low": 0.1, "/high": 0.9})
+    frontier.add("/root", depth=0)
+    assert frontier.pop_batch(3) == [("/root", 0), ("/high", 1), ("/low", 1)]
+    assert frontier.pop_batch(3) == [("/deep", 2)]
+    assert frontier.pop_batch(3) == []
+
+
+def test_mark_seen_and_requeue(frontier):
+    frontier.mark_seen(["/a"])
+    assert not frontier.add("/a")
+    assert len(frontier) == 0
+    frontier.requeue([("/a", 1)])
+    assert frontier.pop_batch(5) == [("/a", 1)]
+    assert frontier.seen_count == 1
+
+
+def test_clear(frontier):
+    frontier.add_many(["/a", "/b"])
+    frontier.clear()
+    assert len(frontier) == 0
+    assert frontier.seen_count == 0
+    assert frontier.add("/a")
+
+
+def test_make_frontier():
+    assert isinstance(make_frontier("memory", "job"), MemoryFrontier)
+
+
+def test_release_finishes_once(redis_frontier):
+    redis_frontier.add_many(["/a", "/b", "/c"])
+    first, batch = redis_frontier.claim_batch(2)
+    assert batch == [("/a", 0), ("/b", 0)]
+    second, batch = redis_frontier.claim_batch(2)
+    assert batch == [("/c", 0)]
+    assert redis_frontier.inflight == 2
+    # Drained, but the other batch is still in flight
+    assert not redis_frontier.release_batch(second)
+    assert redis_frontier.release_batch(first)
+    assert not redis_frontier.release_batch(first)
+    assert redis_frontier.inflight == 0
+
+
+def test_empty_claim(redis_frontier):
+    claim, batch = redis_frontier.claim_batch(5)
+    assert batch == []
+    assert redis_frontier.inflight == 0
+    # Releasing it finishes a frontier that was drained from the start
+    assert redis_frontier.release_batch(claim)
+
+
+def test_unclaim_keeps_priorities(redis_frontier):
+    redis_frontier.add_many(["/low", "/high"], 1, {"/low": 0.1, "/high": 0.9})
+    redis_frontier.add("/done", depth=1)
+    claim, batch = redis_frontier.claim_batch(3)
+    assert redis_frontier.unclaim(claim, []) == 0
+    assert redis_frontier.unclaim(claim, [("/low", 1), ("/high", 1)]) == 2
+    redis_frontier.add("/new", depth=1)
+    assert not redis_frontier.release_batch(claim)
+    assert redis_frontier.pop_batch(5) == [
+        ("/high", 1),
+        ("/new", 1),
+        ("/low", 1),
+    ]
+
+
+def test_unclaim_everything(redis_frontier):
+    redis_frontier.add_many(["/a", "/b"])
+    claim, batch = redis_frontier.claim_batch(2)
+    assert redis_frontier.unclaim(claim) == 2
+    assert redis_frontier.unclaim("unknown") == 0
+    assert redis_frontier.pop_batch(5) == batch
+
+
+def test_lost_claim_is_requeued(redis_frontier, monkeypatch):
+    redis_frontier.add_many(["/a", "/b"])
+    redis_frontier.claim_batch(2)
+    assert redis_frontier.claim_batch(2)[1] == []
+
+    later = time.time() + CLAIM_LEASE + 1
+    monkeypatch.setattr("src.tasks.frontier.time.time", lambda: later)
+    assert redis_frontier.inflight == 0
+    claim, batch = redis_frontier.claim_batch(2)
+    assert batch == [("/a", 0), ("/b", 0)]
+    assert redis_frontier.release_batch(claim)
+
+
+def test_stop_waits_for_claims(redis_frontier):
+    redis_frontier.add_many(["/a", "/b", "/c"])
+    claim, _ = redis_frontier.claim_batch(1)
+    assert not redis_frontier.stop()
+    assert len(redis_frontier) == 0
+    assert redis_frontier.release_batch(claim)
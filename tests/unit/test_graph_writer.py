@@ -0,0 +1,129 @@
+from src.models import UrlEdge, UrlNode, url_hash
+from src.tasks import graph_writer
+from src.tasks.graph_writer import GraphWriter
+
+SITE = "https://example.com"
+JOB = "job"
+
+
+def nodes(db, job_id=JOB):
+    rows = db.query(UrlNode).filter_by(job_id=job_id).order_by(UrlNode.url)
+    return {node.url: node for node in rows}
+
+
+def edges(db, job_id=JOB):
+    urls = {node.id: url for url, node in nodes(db, job_id).items()}
+    return {
+        (urls[edge.source_id], urls[edge.target_id], edge.link_type)
+        for edge in db.query(UrlEdge).filter_by(job_id=job_id)
+    }
+
+
+def test_flush_writes_nodes_and_edges(db):
+    writer = GraphWriter(db, JOB)
+    writer.add_page(
+        f"{SITE}/",
+        200,
+        [(f"{SITE}/a", False), (f"{SITE}/", False), ("https://o.org", True)],
+        depth=0,
+        etag='"v1"',
+    )
+    writer.add_page(f"{SITE}/a", 404, [(f"{SITE}/", False)], depth=1)
+    assert len(writer) == 6
+    writer.flush()
+    assert len(writer) == 0
+
+    found = nodes(db)
+    assert sorted(found) == [f"{SITE}/", f"{SITE}/a", "https://o.org"]
+    root = found[f"{SITE}/"]
+    assert (root.status_code, root.depth, root.etag) == (200, 0, '"v1"')
+    assert root.url_hash == url_hash(root.url)
+    assert found["https://o.org"].is_external
+    assert found["https://o.org"].status_code is None
+    # Self-links are dropped
+    assert edges(db) == {
+        (f"{SITE}/", f"{SITE}/a", "hyperlink"),
+        (f"{SITE}/", "https://o.org", "hyperlink"),
+        (f"{SITE}/a", f"{SITE}/", "hyperlink"),
+    }
+
+
+def test_later_flushes_merge_into_existing_nodes(db):
+    writer = GraphWriter(db, JOB)
+    writer.add_node(f"{SITE}/a", depth=3, in_sitemap=True, priority=0.8)
+    writer.add_page(f"{SITE}/", 200, [(f"{SITE}/a", False)], depth=0)
+    writer.flush()
+    first_id = nodes(db)[f"{SITE}/a"].id
+
+    # Known values are kept over unknown ones, depths only go down
+    writer.add_page(
+        f"{SITE}/a", 200, [(f"{SITE}/b", False)], depth=5, etag='"x"'
+    )
+    writer.add_page(f"{SITE}/", None, [(f"{SITE}/a", False)])
+    writer.flush()
+    db.expire_all()
+    found = nodes(db)
+    page = found[f"{SITE}/a"]
+    assert page.id == first_id
+    assert (page.status_code, page.depth, page.etag) == (200, 1, '"x"')
+    assert page.in_sitemap and page.priority == 0.8
+    assert found[f"{SITE}/"].status_code == 200
+    assert found[f"{SITE}/b"].depth == 6
+    assert len(edges(db)) == 2
+    assert db.query(UrlEdge).count() == 2
+
+
+def test_buffered_node_keeps_known_values(db):
+    writer = GraphWriter(db, JOB)
+    writer.add_node(f"{SITE}/a", status_code=200, depth=4, lastmod="2024")
+    writer.add_node(f"{SITE}/a", depth=2, in_sitemap=True)
+    writer.add_node(f"{SITE}/a", depth=3)
+    writer.flush()
+    page = nodes(db)[f"{SITE}/a"]
+    assert (page.status_code, page.depth, page.lastmod) == (200, 2, "2024")
+    assert page.in_sitemap
+
+
+def test_jobs_are_kept_apart(db):
+    for job_id in ("one", "two"):
+        writer = GraphWriter(db, job_id)
+        writer.add_page(f"{SITE}/", 200, [(f"{SITE}/a", False)], depth=0)
+        writer.flush()
+    assert len(nodes(db, "one")) == len(nodes(db, "two")) == 2
+    assert len(edges(db, "two")) == 1
+
+
+def test_flush_size(db):
+    writer = GraphWriter(db, JOB, flush_size=5, flush_interval=3600)
+    writer.add_page(f"{SITE}/", 200, [(f"{SITE}/a", False)])
+    assert len(writer) == 3
+    writer.add_page(f"{SITE}/b", 200, [(f"{SITE}/c", False)])
+    assert len(writer) == 0
+    assert len(nodes(db)) == 4
+
+
+def test_flush_in_chunks(db, monkeypatch):
+    chunks = graph_writer._chunks
+    sizes = []
+
+    def small_chunks(rows):
+        for chunk in chunks(rows, 7):
+            sizes.append(len(chunk))
+            yield chunk
+
+    monkeypatch.setattr(graph_writer, "_chunks", small_chunks)
+    writer = GraphWriter(db, JOB)
+    links = [(f"{SITE}/{n}", False) for n in range(30)]
+    writer.add_page(f"{SITE}/", 200, links)
+    writer.flush()
+    writer.add_page(f"{SITE}/", 200, links + [(f"{SITE}/new", False)])
+    writer.flush()
+    assert len(nodes(db)) == 32
+    assert len(edges(db)) == 31
+    assert max(sizes) == 7
+
+
+def test_empty_flush(db):
+    writer = GraphWriter(db, JOB)
+    writer.flush()
+    assert db.query(UrlNode).count() == 0
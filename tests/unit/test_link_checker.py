@@ -0,0 +1,135 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from src.models import UrlNode
+from src.tasks import link_checker
+from src.tasks.graph_writer import GraphWriter
+from src.tasks.link_checker import (
+    NO_RESPONSE,
+    LinkChecker,
+    cached_statuses,
+    check_external_links,
+)
+
+fakeredis = pytest.importorskip("fakeredis")
+
+SITE = "https://example.com"
+EXTERNAL = [f"https://other{n}.org/" for n in range(5)]
+
+
+class Checker:
+    """Answers 200 for every URL, recording what it was asked"""
+
+    def __init__(self):
+        self.checked = []
+
+    def check(self, urls):
+        self.checked.append(list(urls))
+        return {url: 200 for url in urls}
+
+
+@pytest.fixture
+def written(db, monkeypatch):
+    """The statuses written back to a crawled job, by node URL"""
+    # SQLite cannot run the bulk UPDATE ... FROM (VALUES ...)
+    statuses = {}
+
+    def write_statuses(db, job_id, rows):
+        urls = dict(db.query(UrlNode.id, UrlNode.url).filter_by(job_id=job_id))
+        for node_id, status in rows:
+            statuses[urls[node_id]] = status
+            db.query(UrlNode).filter_by(job_id=job_id, id=node_id).update(
+                {"status_code": status}
+            )
+
+    monkeypatch.setattr(link_checker, "write_statuses", write_statuses)
+    writer = GraphWriter(db, "job")
+    writer.add_page(
+        f"{SITE}/",
+        200,
+        [(f"{SITE}/a", False)] + [(url, True) for url in EXTERNAL],
+    )
+    writer.flush()
+    return statuses
+
+
+@pytest.fixture
+def client():
+    return fakeredis.FakeRedis(decode_responses=True)
+
+
+def test_external_links_are_checked_once(db, written, client, monkeypatch):
+    monkeypatch.setattr(link_checker, "CHECK_CHUNK", 2)
+    checker = Checker()
+    assert check_external_links(db, "job", checker, client) == 5
+    assert written == dict.fromkeys(EXTERNAL, 200)
+    assert sorted(sum(checker.checked, [])) == EXTERNAL
+    assert max(len(urls) for urls in checker.checked) == 2
+
+    # Checked nodes are not checked again
+    assert check_external_links(db, "job", checker, client) == 0
+    assert len(checker.checked) == 3
+
+
+def test_cached_statuses_are_reused(db, written, client):
+    link_checker.cache_statuses({EXTERNAL[0]: 404}, client)
+    checker = Checker()
+    check_external_links(db, "job", checker, client)
+    assert checker.checked == [EXTERNAL[1:]]
+    assert written[EXTERNAL[0]] == 404
+    assert cached_statuses(EXTERNAL, client) == {
+        EXTERNAL[0]: 404,
+        **dict.fromkeys(EXTERNAL[1:], 200),
+    }
+
+
+def test_unavailable_cache(db, written):
+    server = fakeredis.FakeServer()
+    server.connected = False
+    client = fakeredis.FakeRedis(server=server)
+    assert check_external_links(db, "job", Checker(), client) == 5
+    assert written == dict.fromkeys(EXTERNAL, 200)
+
+
+class Handler(BaseHTTPRequestHandler):
+    def do_HEAD(self):
+        # Like servers that get HEAD wrong
+        if self.path == "/no-head":
+            self.send_response(405)
+            self.end_headers()
+        else:
+            self.do_GET()
+
+    def do_GET(self):
+        self.send_response(404 if self.path == "/missing" else 200)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+def test_link_checker():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_port}"
+    try:
+        statuses = LinkChecker(timeout=5).check(
+            [f"{base}/ok", f"{base}/no-head", f"{base}/missing"]
+        )
+    finally:
+        server.shutdown()
+        server.server_close()
+    assert statuses == {
+        f"{base}/ok": 200,
+        f"{base}/no-head": 200,
+        f"{base}/missing": 404,
+    }
+
+
+def test_unreachable_link():
+    # Nothing listens on port 9 of this host
+    url = "http://127.0.0.1:9/"
+    assert LinkChecker(timeout=5).check([url]) == {url: NO_RESPONSE}
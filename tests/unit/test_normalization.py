@@ -0,0 +1,112 @@
+from urllib.parse import urljoin
+
+import pytest
+
+from src.tasks.normalization import (
+    MAX_URL_LENGTH,
+    Normalizer,
+    remove_dot_segments,
+)
+
+
+CASES = [
+    ("HTTP://Example.COM/a/", "http://example.com/a"),
+    ("https://example.com:443/a", "https://example.com/a"),
+    ("http://example.com:8080/a", "http://example.com:8080/a"),
+    ("https://example.com/a/./b/../c", "https://example.com/a/c"),
+    ("https://example.com/a#frag", "https://example.com/a"),
+    ("https://example.com/a?b=1", "https://example.com/a"),
+    ("https://user@Example.com:443/", "https://user@example.com"),
+    ("https://[::1]:443/a", "https://[::1]/a"),
+    ("  https://example.com/a ", "https://example.com/a"),
+    ("mailto:someone@example.com", None),
+    ("javascript:void(0)", None),
+    ("ftp://example.com/a", None),
+    ("https:///a", None),
+]
+
+# Links resolved against BASES must normalize as their urljoin does
+LINKS = [
+    "c",
+    "./c",
+    "../c",
+    "../../../c",
+    "/d",
+    "/d/../e",
+    "//other.org/f",
+    "//",
+    "//?x=1",
+    "//#top",
+    "?q=1",
+    "#frag",
+    "",
+    " /spaced ",
+    "c?q=1#f",
+    "https://example.com/abs",
+    "mailto:a@example.com",
+]
+BASES = [
+    "https://example.com",
+    "https://example.com/",
+    "https://example.com/a/b",
+    "https://example.com/a/b/",
+    "https://example.com/a/b?x=1#y",
+    "http://Example.com:80/a/",
+]
+
+
+@pytest.mark.parametrize("url, expected", CASES)
+def test_normalize(url, expected):
+    assert Normalizer()(url) == expected
+
+
+@pytest.mark.parametrize("base", BASES)
+def test_relative_links_join_like_urljoin(base):
+    normalize = Normalizer(query="keep")
+    for link in LINKS:
+        expected = Normalizer(query="keep")(urljoin(base, link.strip()))
+        assert normalize(link, base) == expected, link
+    # Memoized joins give the same answers
+    for link in LINKS:
+        expected = Normalizer(query="keep")(urljoin(base, link.strip()))
+        assert normalize(link, base) == expected, link
+    assert normalize.join_cache_info().hits
+
+
+def test_query_modes():
+    url = "https://example.com/a?b=2&a=1&c="
+    assert Normalizer(query="drop")(url) == "https://example.com/a"
+    assert Normalizer(query="keep")(url) == url
+    assert Normalizer(query="sort")(url) == "https://example.com/a?a=1&b=2&c="
+    with pytest.raises(ValueError):
+        Normalizer(query="lower")
+
+
+def test_long_urls_are_dropped():
+    prefix = "https://example.com/"
+    fits = prefix + "a" * (MAX_URL_LENGTH - len(prefix))
+    assert Normalizer()(fits) == fits
+    assert Normalizer()(fits + "a") is None
+
+
+def test_normalize_many():
+    links = ["/a", "/a/", "mailto:x@example.com", "b", "/a#top"]
+    assert Normalizer().normalize_many(links, "https://example.com/d/") == [
+        "https://example.com/a",
+        "https://example.com/d/b",
+    ]
+
+
+@pytest.mark.parametrize(
+    "path, expected",
+    [
+        ("/a/b/../c", "/a/c"),
+        ("/a/./b", "/a/b"),
+        ("/../a", "/a"),
+        ("/a/b/..", "/a/"),
+        ("/a/.", "/a/"),
+        ("/plain", "/plain"),
+    ],
+)
+def test_remove_dot_segments(path, expected):
+    assert remove_dot_segments(path) == expected
@@ -0,0 +1,103 @@
+import pytest
+
+from src.tasks.options import CrawlOptions
+
+
+def test_defaults():
+    options = CrawlOptions.from_dict(None)
+    assert options == CrawlOptions()
+    assert options.engine == "sync"
+    assert options.queue == "interactive"
+
+
+def test_form_values_are_coerced():
+    # As an HTML form submits them
+    options = CrawlOptions.from_dict(
+        {
+            "engine": "async",
+            "concurrency": "8",
+            "max_seconds": "1.5",
+            "recrawl": "true",
+            "profile": "off",
+            "include": "/docs/\n\n  /blog/ \n",
+            "fanout": "",
+            "unknown": "ignored",
+        }
+    )
+    assert options.concurrency == 8
+    assert options.max_seconds == 1.5
+    assert options.recrawl is True
+    assert options.profile is False
+    assert options.include == ("/docs/", "/blog/")
+    assert options.fanout == CrawlOptions().fanout
+
+
+def test_json_values_are_coerced():
+    options = CrawlOptions.from_dict(
+        {"recrawl": 1, "exclude": [r"\.pdf$", " "], "crawl_delay": 2}
+    )
+    assert options.recrawl is True
+    assert options.exclude == (r"\.pdf$",)
+    assert options.crawl_delay == 2.0
+
+
+def test_round_trip():
+    options = CrawlOptions(engine="async", include=("/a",), weight=3)
+    assert CrawlOptions.from_dict(options.to_dict()) == options
+    assert CrawlOptions.from_dict(options) is options
+
+
+def test_per_host_concurrency_is_capped():
+    options = CrawlOptions(concurrency=2, per_host_concurrency=8)
+    assert options.per_host_concurrency == 2
+
+
+@pytest.mark.parametrize(
+    "data, frontier",
+    [
+        ({}, "memory"),
+        ({"chunk_seconds": 0}, "memory"),
+        ({"chunk_seconds": 0, "frontier": "redis"}, "redis"),
+        # The next turn of a chunked crawl takes the frontier over
+        ({"chunk_seconds": 60}, "redis"),
+        ({"chunk_seconds": 0, "mode": "distributed"}, "redis"),
+    ],
+)
+def test_frontier(data, frontier):
+    assert CrawlOptions.from_dict(data).frontier == frontier
+
+
+@pytest.mark.parametrize(
+    "data",
+    [
+        {"engine": "threads"},
+        {"extractor": "regex"},
+        {"concurrency": 0},
+        {"link_check_concurrency": 0},
+        {"mode": "cluster"},
+        {"fanout": 0},
+        {"batch_size": 0},
+        {"frontier": "disk"},
+        {"url_query": "lower"},
+        {"crawl_delay": -1},
+        {"max_bytes": 0},
+        {"parse_workers": -1},
+        {"flush_size": 0},
+        {"dedupe": "fuzzy"},
+        {"simhash_distance": 4},
+        {"max_pages": -1},
+        {"chunk_seconds": -1},
+        {"include": "("},
+        {"queue": "urgent"},
+        {"weight": 9},
+        {"weight": 0},
+    ],
+)
+def test_invalid_options(data):
+    with pytest.raises(ValueError):
+        CrawlOptions.from_dict(data)
+
+
+def test_bad_number():
+    with pytest.raises(ValueError):
+        CrawlOptions.from_dict({"concurrency": "many"})
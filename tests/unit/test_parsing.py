@@ -0,0 +1,75 @@
+import logging
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+from src.tasks import parsing
+from src.tasks.parsing import ParsePool
+
+URL = "https://example.com/0"
+PAGES = {
+    f"https://example.com/{n}": (
+        f'<a href="/{n + 1}">next</a><a href="/{n}">self</a>'
+        f'<a href="https://other.org/{n}">out</a>'
+    )
+    for n in range(5)
+}
+
+# Modules a parser process must not import
+HEAVY = ("sqlalchemy", "celery", "redis", "prometheus_client", "requests")
+
+
+def test_parse_worker_imports_stay_light():
+    names = subprocess.check_output(
+        [
+            sys.executable,
+            "-c",
+            "import sys, src.tasks.parse_worker; print(*sys.modules)",
+        ],
+        cwd=Path(__file__).parents[2],
+        text=True,
+    ).split()
+    assert "src.tasks.crawler" not in names
+    assert not [name for name in names if name.split(".")[0] in HEAVY]
+
+
+def test_inline_parse():
+    pool = ParsePool("lxml", "drop")
+    [(url, tag, (targets, internal))] = pool.submit(URL, PAGES[URL], "t")
+    assert (url, tag) == (URL, "t")
+    # The self-link is skipped
+    assert targets == [
+        ("https://example.com/1", False),
+        ("https://other.org/0", True),
+    ]
+    assert internal == {"https://example.com/1"}
+
+
+def test_process_pool_matches_inline():
+    inline = ParsePool("lxml", "drop")
+    pooled = ParsePool("lxml", "drop", workers=1, max_pending=2)
+    expected = [inline.submit(url, html)[0] for url, html in PAGES.items()]
+    done = []
+    for url, html in PAGES.items():
+        done += pooled.submit(url, html)
+    done += pooled.drain()
+    assert pooled.executor is not None
+    assert done == expected
+
+
+def test_unavailable_pool_warns(monkeypatch, caplog):
+    # As after processes failed to start in this one
+    monkeypatch.setitem(parsing._executors, 3, None)
+    with caplog.at_level(logging.WARNING, logger="Parsing"):
+        pool = ParsePool("lxml", "drop", workers=3)
+    assert "parsing inline" in caplog.text
+    assert len(pool.submit(URL, PAGES[URL])) == 1
+
+
+@pytest.fixture(autouse=True)
+def no_stray_pools():
+    yield
+    for workers in list(parsing._executors):
+        parsing.discard_executor(workers)
@@ -0,0 +1,154 @@
+import asyncio
+import threading
+from unittest import mock
+
+import pytest
+import requests
+
+from src.tasks.fetcher import AsyncFetcher
+from src.tasks.politeness import (
+    DISALLOW_ALL,
+    ROBOTS_ERROR_TTL,
+    ROBOTS_TTL,
+    HostThrottle,
+    RobotsCache,
+    fetch_robots,
+)
+
+fakeredis = pytest.importorskip("fakeredis")
+
+HOST = "example.com"
+
+
+@pytest.fixture
+def server():
+    return fakeredis.FakeServer()
+
+
+@pytest.fixture
+def throttle(server):
+    return HostThrottle(fakeredis.FakeRedis(server=server))
+
+
+def test_reserve_queues_up(throttle):
+    waits = [throttle.reserve(HOST, 10) for _ in range(3)]
+    assert waits[0] == 0
+    assert 9 < waits[1] <= 10
+    assert 19 < waits[2] <= 20
+    # Other hosts have slots of their own
+    assert throttle.reserve("other.org", 10) == 0
+
+
+def test_acquire_takes_free_slots_only(throttle):
+    assert throttle.acquire(HOST, 10) == 0
+    assert 9 < throttle.acquire(HOST, 10) <= 10
+    # Not queued: a reservation still gets the slot after the first one
+    assert 9 < throttle.reserve(HOST, 10) <= 10
+
+
+def test_slots_are_shared(server, throttle):
+    other_worker = HostThrottle(fakeredis.FakeRedis(server=server))
+    assert throttle.reserve(HOST, 10) == 0
+    assert other_worker.acquire(HOST, 10) > 9
+
+
+def test_no_delay(throttle):
+    assert throttle.reserve(HOST, 0) == 0
+    assert throttle.acquire(HOST, 0) == 0
+    assert throttle.acquire(HOST, 0) == 0
+
+
+def test_unavailable_redis_spaces_per_process(server, throttle, caplog):
+    server.connected = False
+    assert throttle.reserve(HOST, 10) == 0
+    assert 9 < throttle.reserve(HOST, 10) <= 10
+    assert 19 < throttle.acquire(HOST, 10) <= 20
+    assert throttle.acquire("other.org", 10) == 0
+    assert caplog.text.count("Host throttle unavailable") == 1
+
+    server.connected = True
+    assert throttle.reserve(HOST, 10) == 0
+
+
+def test_async_reserve_runs_off_the_event_loop():
+    threads = []
+
+    class Throttle:
+        def reserve(self, host, delay):
+            threads.append(threading.current_thread())
+            return 0
+
+    async def wait():
+        fetcher = AsyncFetcher(host_delay=1, throttle=Throttle())
+        await fetcher._wait_for_host(HOST)
+
+    asyncio.run(wait())
+    assert threads and threads[0] is not threading.main_thread()
+
+
+@pytest.fixture
+def robots_fetches(monkeypatch):
+    fetched = []
+
+    def fetch_robots(url):
+        fetched.append(url)
+        return "User-agent: *\nDisallow: /private/\n", ROBOTS_TTL
+
+    monkeypatch.setattr("src.tasks.politeness.fetch_robots", fetch_robots)
+    return fetched
+
+
+def test_robots_are_fetched_once_per_site(server, robots_fetches):
+    cache = RobotsCache(fakeredis.FakeRedis(server=server))
+    robots = cache.get("https://example.com/a/page")
+    assert not robots.is_allowed("*", "https://example.com/private/x")
+    assert robots.is_allowed("*", "https://example.com/public")
+    assert cache.get("https://example.com/b") is robots
+
+    # Another worker parses the body cached in Redis
+    other_worker = RobotsCache(fakeredis.FakeRedis(server=server))
+    assert other_worker.get("https://example.com/") is not robots
+    assert robots_fetches == ["https://example.com/robots.txt"]
+
+    cache.get("https://other.org/")
+    assert len(robots_fetches) == 2
+
+
+def test_robots_without_redis(server, robots_fetches):
+    server.connected = False
+    cache = RobotsCache(fakeredis.FakeRedis(server=server))
+    robots = cache.get("https://example.com/")
+    assert not robots.is_allowed("*", "https://example.com/private/x")
+    # Not kept, as nothing tells when it expires
+    cache.get("https://example.com/")
+    assert len(robots_fetches) == 2
+
+
+@pytest.mark.parametrize(
+    "status, allowed, ttl",
+    [
+        (200, True, ROBOTS_TTL),
+        (404, True, ROBOTS_TTL),
+        (403, False, ROBOTS_TTL),
+        (503, False, ROBOTS_ERROR_TTL),
+    ],
+)
+def test_fetch_robots_statuses(monkeypatch, status, allowed, ttl):
+    response = mock.Mock(status_code=status, text="User-agent: *\n")
+    monkeypatch.setattr(
+        "src.tasks.politeness.requests.get", lambda *a, **kw: response
+    )
+    body, got_ttl = fetch_robots("https://example.com/robots.txt")
+    assert (body != DISALLOW_ALL) is allowed
+    assert got_ttl == ttl
+
+
+def test_unreachable_robots(monkeypatch):
+    def get(*args, **kwargs):
+        raise requests.ConnectionError("refused")
+
+    monkeypatch.setattr("src.tasks.politeness.requests.get", get)
+    assert fetch_robots("https://example.com/robots.txt") == (
+        DISALLOW_ALL,
+        ROBOTS_ERROR_TTL,
+    )
@@ -0,0 +1,72 @@
+from src.tasks.graph_writer import GraphWriter
+from src.tasks.recrawl import PreviousCrawl, PreviousPage
+
+SITE = "https://example.com"
+
+
+def crawl(db, job_id, pages, sitemap=()):
+    """Write ``{url: (status, links, fields)}`` pages of a job"""
+    writer = GraphWriter(db, job_id)
+    for url, lastmod in sitemap:
+        writer.add_node(url, in_sitemap=True, lastmod=lastmod)
+    for url, (status, links, fields) in pages.items():
+        writer.add_page(url, status, links, **fields)
+    writer.flush()
+
+
+def test_lookup(db):
+    crawl(
+        db,
+        "old",
+        {
+            f"{SITE}/": (
+                200,
+                [(f"{SITE}/a", False), ("https://o.org/", True)],
+                {"etag": '"v1"', "last_modified": "Mon", "lastmod": "2024"},
+            ),
+            f"{SITE}/a": (200, [], {}),
+            f"{SITE}/gone": (404, [], {}),
+            f"{SITE}/down": (503, [], {}),
+        },
+    )
+    crawl(db, "new", {}, sitemap=[(f"{SITE}/", "2024")])
+
+    previous = PreviousCrawl(db, "new", "old")
+    found = previous.lookup(
+        [f"{SITE}/", f"{SITE}/a", f"{SITE}/gone", f"{SITE}/down", "x"]
+    )
+    # Pages that failed last time are not worth reusing
+    assert sorted(found) == [f"{SITE}/", f"{SITE}/a"]
+
+    root = found[f"{SITE}/"]
+    assert (root.status_code, root.etag, root.last_modified) == (
+        200,
+        '"v1"',
+        "Mon",
+    )
+    assert root.lastmod_unchanged
+    assert sorted(root.links) == [
+        (f"{SITE}/a", False),
+        ("https://o.org/", True),
+    ]
+    assert root.conditional_headers() == {
+        "If-None-Match": '"v1"',
+        "If-Modified-Since": "Mon",
+    }
+    page = found[f"{SITE}/a"]
+    assert page.links == []
+    assert not page.lastmod_unchanged
+    assert page.conditional_headers() == {}
+
+
+def test_lookup_of_nothing(db):
+    assert PreviousCrawl(db, "new", "old").lookup([]) == {}
+    assert PreviousCrawl(db, "new", "old").lookup([f"{SITE}/"]) == {}
+
+
+def test_changed_lastmod():
+    page = PreviousPage(1, 200, None, None, "2024", "2025")
+    assert not page.lastmod_unchanged
+    assert not page._replace(
+        lastmod=None, current_lastmod=None
+    ).lastmod_unchanged
@@ -0,0 +1,125 @@
+import pytest
+import time
+
+from src.tasks.options import CrawlOptions
+from src.tasks.scheduler import (
+    JOB_QUOTA,
+    MAX_WEIGHT,
+    MIN_TURN_SECONDS,
+    RUNNING_LEASE,
+    JobScheduler,
+    job_fanout,
+    turn_seconds,
+)
+
+fakeredis = pytest.importorskip("fakeredis")
+
+
+@pytest.fixture
+def scheduler():
+    client = fakeredis.FakeRedis(decode_responses=True)
+    return JobScheduler(client=client, max_running=2)
+
+
+def submit(scheduler, job_id, queue="interactive", resume=False):
+    options = CrawlOptions(queue=queue)
+    scheduler.submit(job_id, f"https://{job_id}.example", options, resume)
+
+
+def admitted(scheduler):
+    return [job_id for job_id, _ in scheduler.admit()]
+
+
+def test_interactive_jobs_are_admitted_first(scheduler):
+    submit(scheduler, "bulk-1", "bulk")
+    submit(scheduler, "inter-1")
+    submit(scheduler, "inter-2")
+    assert admitted(scheduler) == ["inter-1", "inter-2"]
+    assert admitted(scheduler) == []
+
+    scheduler.finish("inter-1")
+    assert admitted(scheduler) == ["bulk-1"]
+
+
+def test_admitted_entry(scheduler):
+    submit(scheduler, "job", "bulk", resume=True)
+    [(job_id, entry)] = scheduler.admit()
+    assert job_id == "job"
+    assert entry["base_url"] == "https://job.example"
+    assert entry["resume"] is True
+    assert entry["queue"] == "bulk"
+    assert CrawlOptions.from_dict(entry["options"]).queue == "bulk"
+
+
+def test_finished_waiting_job_is_not_admitted(scheduler):
+    submit(scheduler, "gone")
+    scheduler.finish("gone")
+    assert admitted(scheduler) == []
+
+
+def test_lost_jobs_give_their_place_up(scheduler, monkeypatch):
+    submit(scheduler, "lost")
+    submit(scheduler, "alive")
+    submit(scheduler, "waiting")
+    assert admitted(scheduler) == ["lost", "alive"]
+
+    later = time.time() + RUNNING_LEASE - 1
+    monkeypatch.setattr("src.tasks.scheduler.time.time", lambda: later)
+    scheduler.heartbeat("alive")
+    assert admitted(scheduler) == []
+
+    later += 2
+    assert admitted(scheduler) == ["waiting"]
+    running = [job["job_id"] for job in scheduler.snapshot()["running"]]
+    assert sorted(running) == ["alive", "waiting"]
+
+
+def test_late_task_takes_its_place_back(scheduler, monkeypatch):
+    submit(scheduler, "late", "bulk")
+    submit(scheduler, "other")
+    submit(scheduler, "waiting", "bulk")
+    assert admitted(scheduler) == ["other", "late"]
+
+    # The bulk job's task waits in the broker past its lease
+    later = time.time() + RUNNING_LEASE + 1
+    monkeypatch.setattr("src.tasks.scheduler.time.time", lambda: later)
+    scheduler.heartbeat("other")
+    assert admitted(scheduler) == ["waiting"]
+
+    # Once it starts it is counted again, if over max_running for a while
+    scheduler.heartbeat("late")
+    running = [job["job_id"] for job in scheduler.snapshot()["running"]]
+    assert sorted(running) == ["late", "other", "waiting"]
+    scheduler.finish("waiting")
+    submit(scheduler, "next")
+    assert admitted(scheduler) == []
+
+
+def test_snapshot(scheduler):
+    submit(scheduler, "a")
+    submit(scheduler, "b")
+    submit(scheduler, "c")
+    submit(scheduler, "d", "bulk")
+    scheduler.admit()
+    snapshot = scheduler.snapshot()
+    assert [job["job_id"] for job in snapshot["running"]] == ["a", "b"]
+    assert snapshot["waiting"]["interactive"]["depth"] == 1
+    assert snapshot["waiting"]["bulk"]["jobs"][0]["job_id"] == "d"
+
+
+def test_turn_seconds():
+    options = CrawlOptions(chunk_seconds=240, weight=2)
+    assert turn_seconds(options, contended=False) == 240
+    assert turn_seconds(options, contended=True) == 240 * 2 / MAX_WEIGHT
+    heaviest = CrawlOptions(chunk_seconds=240, weight=MAX_WEIGHT)
+    assert turn_seconds(heaviest, contended=True) == 240
+    # Turns are worth their setup, unless chunks are shorter still
+    lightest = CrawlOptions(chunk_seconds=240, weight=1)
+    assert turn_seconds(lightest, contended=True) == MIN_TURN_SECONDS
+    short = CrawlOptions(chunk_seconds=10, weight=1)
+    assert turn_seconds(short, contended=True) == 10
+
+
+def test_job_fanout():
+    assert job_fanout(CrawlOptions(fanout=1)) == 1
+    assert job_fanout(CrawlOptions(fanout=JOB_QUOTA + 10)) == JOB_QUOTA
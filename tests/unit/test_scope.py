@@ -0,0 +1,65 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from src.tasks.options import CrawlOptions
+from src.tasks.scope import CrawlBudget, CrawlScope, compile_patterns
+
+
+def scope(**options):
+    return CrawlScope(CrawlOptions(**options))
+
+
+def test_unrestricted_scope_allows_everything():
+    urls = ["https://example.com/a", "https://example.com/b.pdf"]
+    assert scope().filter(urls, depth=50) == urls
+    assert scope().allows(urls[0], depth=50)
+
+
+def test_max_depth():
+    limited = scope(max_depth=2)
+    assert limited.allows("https://example.com/a", depth=2)
+    assert not limited.allows("https://example.com/a", depth=3)
+    assert limited.filter(["https://example.com/a"], depth=3) == []
+
+
+def test_include_and_exclude():
+    docs = scope(include=("/docs/", "/blog/"), exclude=(r"\.pdf$",))
+    urls = [
+        "https://example.com/docs/a",
+        "https://example.com/blog/b",
+        "https://example.com/docs/c.pdf",
+        "https://example.com/shop/d",
+    ]
+    assert docs.filter(urls) == urls[:2]
+    assert not docs.allows(urls[3])
+
+
+def test_bad_pattern():
+    with pytest.raises(ValueError, match="Bad URL pattern"):
+        compile_patterns(["/ok", "("])
+
+
+def test_page_budget():
+    budget = CrawlBudget(CrawlOptions(max_pages=120))
+    assert budget.batch_limit(50, 0) == 50
+    assert budget.batch_limit(50, 100) == 20
+    assert budget.batch_limit(50, 120) == 0
+    assert budget.batch_limit(50, 130) == 0
+
+
+def test_unlimited_budget():
+    budget = CrawlBudget(CrawlOptions(), datetime.now(timezone.utc))
+    assert not budget.expired()
+    assert budget.batch_limit(50, 10**9) == 50
+
+
+def test_time_budget():
+    now = datetime.now(timezone.utc)
+    options = CrawlOptions(max_seconds=60)
+    assert CrawlBudget(options, now).batch_limit(50, 0) == 50
+    spent = CrawlBudget(options, now - timedelta(seconds=61))
+    assert spent.expired()
+    assert spent.batch_limit(50, 0) == 0
+    # A job that has not started has no deadline yet
+    assert not CrawlBudget(options).expired()
@@ -0,0 +1,110 @@
+import json
+import threading
+import time
+
+import pytest
+
+from src.routes.sitemap import cache
+from src.routes.sitemap.cache import CACHE_TTL, cached_sitemap_urls
+
+fakeredis = pytest.importorskip("fakeredis")
+
+SITEMAP = "https://example.com/sitemap.xml"
+URLS = [f"https://example.com/{n}" for n in range(5)]
+
+
+@pytest.fixture
+def client():
+    return fakeredis.FakeRedis(decode_responses=True)
+
+
+@pytest.fixture
+def fetches(monkeypatch):
+    """The sitemap trees fetched, served from URLS with a duplicate"""
+    fetched = []
+
+    def iter_sitemap_urls(url, validators=None):
+        fetched.append(url)
+        validators[url] = ['"etag"', None]
+        yield from URLS[:2]
+        yield URLS[0]
+        yield from URLS[2:]
+
+    monkeypatch.setattr(cache, "iter_sitemap_urls", iter_sitemap_urls)
+    return fetched
+
+
+def make_stale(client):
+    keys = cache._Keys(SITEMAP)
+    meta = json.loads(client.get(keys.meta))
+    meta["fetched_at"] -= CACHE_TTL + 1
+    client.set(keys.meta, json.dumps(meta))
+
+
+def test_fresh_results_are_read_back(client, fetches):
+    assert list(cached_sitemap_urls(SITEMAP, client)) == URLS
+    assert list(cached_sitemap_urls(SITEMAP, client)) == URLS
+    assert fetches == [SITEMAP]
+    assert not client.exists(cache._Keys(SITEMAP).lock)
+
+
+def test_unmodified_sitemap_is_not_refetched(client, fetches, monkeypatch):
+    list(cached_sitemap_urls(SITEMAP, client))
+    make_stale(client)
+    checked = []
+
+    def revalidate(validators):
+        checked.append(validators)
+        return True
+
+    monkeypatch.setattr(cache, "revalidate", revalidate)
+    assert list(cached_sitemap_urls(SITEMAP, client)) == URLS
+    assert checked == [{SITEMAP: ['"etag"', None]}]
+    assert fetches == [SITEMAP]
+    # Fresh again
+    assert list(cached_sitemap_urls(SITEMAP, client)) == URLS
+    assert len(checked) == 1
+
+
+def test_modified_sitemap_is_refetched(client, fetches, monkeypatch):
+    list(cached_sitemap_urls(SITEMAP, client))
+    make_stale(client)
+    monkeypatch.setattr(cache, "revalidate", lambda validators: False)
+    assert list(cached_sitemap_urls(SITEMAP, client)) == URLS
+    assert fetches == [SITEMAP, SITEMAP]
+
+
+def test_abandoned_fill_is_not_cached(client, fetches):
+    urls = cached_sitemap_urls(SITEMAP, client)
+    assert next(urls) == URLS[0]
+    urls.close()
+    assert not client.exists(cache._Keys(SITEMAP).lock)
+    assert list(cached_sitemap_urls(SITEMAP, client)) == URLS
+    assert fetches == [SITEMAP, SITEMAP]
+    # Only the completed fill's keys are left
+    assert sorted(client.keys()) == sorted(
+        [cache._Keys(SITEMAP).meta, cache._Keys(SITEMAP).urls]
+    )
+
+
+def test_concurrent_requests_are_coalesced(client, fetches, monkeypatch):
+    monkeypatch.setattr(cache, "COALESCE_POLL", 0.01)
+    first = cached_sitemap_urls(SITEMAP, client)
+    # The first request holds the lock while it streams the tree
+    got = [next(first)]
+
+    results = []
+    waiting = threading.Thread(
+        target=lambda: results.append(
+            list(cached_sitemap_urls(SITEMAP, client))
+        )
+    )
+    waiting.start()
+    time.sleep(0.1)
+    assert results == []
+
+    got += list(first)
+    waiting.join(timeout=5)
+    assert got == URLS
+    assert results == [URLS]
+    assert fetches == [SITEMAP]